@@ -0,0 +1,295 @@
+# bench.py - Đo hiệu năng các đường nóng (hot path) và phát hiện suy giảm (regression)
+#
+# Cách dùng:
+#   python bench.py                          # chạy và in kết quả
+#   python bench.py --save                   # lưu kết quả làm baseline (bench_baseline.json)
+#   python bench.py --tolerance 0.25         # so với baseline, lỗi (exit 1) nếu chậm hơn 25%
+#   xvfb-run python bench.py                 # đo cả phần GUI trên màn hình ảo
+# Phần GUI (CartPoleVisualizer.draw, MainApp.update_gui_components) tự bỏ qua khi không có display.
+
+import argparse
+import json
+import platform
+import statistics
+import sys
+import timeit
+
+import numpy as np
+
+from conf import PhysParam
+from plant import CartPoleSystem
+from controller import LQRController, DEFAULT_Q, DEFAULT_R
+
+DEFAULT_BASELINE = "bench_baseline.json"
+
+
+class SkipBenchmark(Exception):
+    pass
+
+
+def measure(func, number, repeat):
+    """Chạy func `number` lần cho mỗi lượt, lặp `repeat` lượt; trả về thống kê thời gian mỗi lần gọi (giây)."""
+    times = [t / number for t in timeit.Timer(func).repeat(repeat=repeat, number=number)]
+    return {
+        'median': statistics.median(times),
+        'min': min(times),
+        'stdev': statistics.stdev(times) if len(times) > 1 else 0.0,
+        'repeat': repeat,
+        'number': number,
+    }
+
+
+# ----------------------------------------------------------------------
+# Các bài đo
+# ----------------------------------------------------------------------
+def _setup_plant():
+    p = PhysParam()
+    return p, CartPoleSystem(p)
+
+
+def bench_dynamics(repeat):
+    _, plant = _setup_plant()
+    s = np.array([0.1, 0.2, 0.0, 0.1])
+    return measure(lambda: plant.dynamics(s, 1.0), 20000, repeat)
+
+
+def bench_rk4_step(repeat):
+    p, plant = _setup_plant()
+    s = np.array([0.1, 0.2, 0.0, 0.1])
+    return measure(lambda: plant.rk4_step(s, 1.0, p.dt), 5000, repeat)
+
+
+def bench_fast_step(repeat):
+    from plant import FastCartPole
+    p, _ = _setup_plant()
+    kernel = FastCartPole(p)
+    s = np.array([0.1, 0.2, 0.0, 0.1])
+    return measure(lambda: kernel.step(s, 1.0, p.dt), 20000, repeat)
+
+
+def bench_nlink_step_5(repeat):
+    from conf import NLinkParam, LinkParam
+    from plant import NLinkCartPole
+    plant = NLinkCartPole(NLinkParam([LinkParam.rod_ball(0.05, 0.05, 0.2)] * 5))
+    s = np.zeros(12)
+    s[0] = 0.1
+    return measure(lambda: plant.rk4_step(s, 1.0, 0.001), 2000, repeat)
+
+
+def bench_rk4_step_batch_1k(repeat):
+    p, plant = _setup_plant()
+    X = np.tile([0.1, 0.2, 0.0, 0.1], (1000, 1))
+    F = np.ones(1000)
+    return measure(lambda: plant.rk4_step_batch(X, F, p.dt), 200, repeat)
+
+
+def bench_compute_gains(repeat):
+    _, plant = _setup_plant()
+    ctrl = LQRController(plant)
+
+    def solve():
+        LQRController.cache.clear()
+        ctrl.compute_gains(DEFAULT_Q, DEFAULT_R, verbose=False)
+    return measure(solve, 50, repeat)
+
+
+def bench_compute_gains_cached(repeat):
+    _, plant = _setup_plant()
+    ctrl = LQRController(plant)
+    ctrl.compute_gains(DEFAULT_Q, DEFAULT_R, verbose=False)
+    return measure(lambda: ctrl.compute_gains(DEFAULT_Q, DEFAULT_R, verbose=False), 2000, repeat)
+
+
+def bench_get_action(repeat):
+    _, plant = _setup_plant()
+    ctrl = LQRController(plant)
+    ctrl.compute_gains(DEFAULT_Q, DEFAULT_R, verbose=False)
+    s = np.array([0.1, 0.2, 0.0, 0.1])
+    return measure(lambda: ctrl.get_action(s), 20000, repeat)
+
+
+def bench_mpc_get_action(repeat):
+    from engine import SimEngine
+    from mpc import MPCController
+    p, plant = _setup_plant()
+    ctrl = MPCController(plant, u_max=15.0, x_limits=(-0.25, 0.25))
+    ctrl.compute_gains(DEFAULT_Q, DEFAULT_R, verbose=False)
+    # Chuỗi trạng thái vòng kín thật (có lúc chạm giới hạn lực / đường ray) để khởi động ấm đúng như khi chạy
+    states = SimEngine(p, ctrl).run([0.4, 0.0, 0.0, 0.0], 4.0).states
+    n = len(states)
+    it = iter(range(1 << 62))
+    return measure(lambda: ctrl.get_action(states[next(it) % n]), 1000, repeat)
+
+
+def bench_kalman_update(repeat):
+    from estimator import SteadyStateKalman
+    _, plant = _setup_plant()
+    est = SteadyStateKalman(plant, delay=2)
+    est.update(0.0, 0.1, 0.0)
+    state = {'t': 0.0}
+
+    def step():
+        state['t'] += 1e-3
+        est.update(state['t'], 0.1, 0.0)
+        est.command(1.0)
+    return measure(step, 20000, repeat)
+
+
+def bench_vec_env_step_1k(repeat):
+    from env import VecCartPoleEnv
+    env = VecCartPoleEnv(1000, seed=0)
+    obs, _ = env.reset()
+    actions = np.zeros(1000)
+    return measure(lambda: env.step(actions), 200, repeat)
+
+
+def bench_offscreen_render(repeat):
+    from offscreen import FrameRasterizer
+    raster = FrameRasterizer(downsample=2)
+    s = np.array([0.3, 0.0, 0.1, 0.0])
+    return measure(lambda: raster.render(s, 0.5), 500, repeat)
+
+
+def _tk_root():
+    try:
+        import tkinter as tk
+        root = tk.Tk()
+    except Exception as e:  # không có display / không có Tk
+        raise SkipBenchmark(f"không mở được Tk ({e})")
+    root.withdraw()
+    return root
+
+
+def bench_visualizer_draw(repeat):
+    import tkinter as tk
+    from conf import SimParam
+    from visualizer import CartPoleVisualizer
+    root = _tk_root()
+    try:
+        canvas = tk.Canvas(root, width=SimParam.WIN_WIDTH, height=SimParam.WIN_HEIGHT)
+        canvas.pack()
+        viz = CartPoleVisualizer(canvas)
+        states = [np.array([0.3 * np.sin(k / 20), 0.0, 0.2 * np.sin(k / 50), 0.0]) for k in range(256)]
+        it = iter(range(1 << 62))
+
+        def draw():
+            viz.draw(states[next(it) & 255])
+            root.update_idletasks()
+        return measure(draw, 500, repeat)
+    finally:
+        root.destroy()
+
+
+def bench_update_gui_components(repeat):
+    from main3 import MainApp
+    root = _tk_root()
+    try:
+        app = MainApp(root)
+        root.update()
+        it = iter(range(1 << 62))
+
+        def step():
+            k = next(it)
+            app.time = k * 0.016
+            app.state = np.array([0.3 * np.sin(k / 20), 0.0, 0.2 * np.sin(k / 50), 0.0])
+            app.update_gui_components()
+            root.update_idletasks()
+        return measure(step, 200, repeat)
+    finally:
+        root.destroy()
+
+
+BENCHMARKS = {
+    'plant.dynamics': bench_dynamics,
+    'plant.rk4_step': bench_rk4_step,
+    'plant.FastCartPole.step': bench_fast_step,
+    'plant.rk4_step_batch[1000]': bench_rk4_step_batch_1k,
+    'plant.NLinkCartPole.rk4_step[5]': bench_nlink_step_5,
+    'controller.compute_gains': bench_compute_gains,
+    'controller.compute_gains[cached]': bench_compute_gains_cached,
+    'controller.get_action': bench_get_action,
+    'mpc.get_action': bench_mpc_get_action,
+    'estimator.SteadyStateKalman.update': bench_kalman_update,
+    'env.VecCartPoleEnv.step[1000]': bench_vec_env_step_1k,
+    'offscreen.render': bench_offscreen_render,
+    'visualizer.draw': bench_visualizer_draw,
+    'main.update_gui_components': bench_update_gui_components,
+}
+
+
+# ----------------------------------------------------------------------
+# Chạy, lưu và so sánh baseline
+# ----------------------------------------------------------------------
+def run(names, repeat):
+    results = {}
+    for name in names:
+        try:
+            results[name] = BENCHMARKS[name](repeat)
+        except SkipBenchmark as e:
+            print(f"  {name:34s} BỎ QUA: {e}")
+            continue
+        r = results[name]
+        print(f"  {name:34s} {r['median'] * 1e6:12.2f} us/op  (min {r['min'] * 1e6:.2f}, "
+              f"sd {r['stdev'] * 1e6:.2f}, {1.0 / r['median']:,.0f} op/s)")
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """
+    Trả về danh sách (tên, baseline, hiện tại, tỷ lệ) của các bài đo chậm hơn ngưỡng.
+    So sánh giá trị min của các lượt (ít bị nhiễu bởi tải nền hơn median).
+    """
+    regressions = []
+    for name, r in results.items():
+        base = baseline.get('results', {}).get(name)
+        if base is None:
+            continue
+        ratio = r['min'] / base['min']
+        flag = "SUY GIẢM" if ratio > 1.0 + tolerance else "ok"
+        print(f"  {name:34s} x{ratio:5.2f}  {flag}")
+        if ratio > 1.0 + tolerance:
+            regressions.append((name, base['min'], r['min'], ratio))
+    return regressions
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Benchmark plant / controller / GUI")
+    ap.add_argument("--repeat", type=int, default=7, help="Số lượt lặp cho thống kê")
+    ap.add_argument("--only", default=None, help="Danh sách bài đo (phân tách bởi dấu phẩy, khớp tiền tố)")
+    ap.add_argument("--baseline", default=DEFAULT_BASELINE)
+    ap.add_argument("--save", action="store_true", help="Lưu kết quả làm baseline mới")
+    ap.add_argument("--tolerance", type=float, default=0.2, help="Ngưỡng chậm hơn cho phép (0.2 = 20%%)")
+    args = ap.parse_args(argv)
+
+    names = list(BENCHMARKS)
+    if args.only:
+        prefixes = [s.strip() for s in args.only.split(',')]
+        names = [n for n in names if any(n.startswith(p) for p in prefixes)]
+
+    print(f"Python {platform.python_version()} | NumPy {np.__version__} | {platform.machine()}")
+    results = run(names, args.repeat)
+
+    if args.save:
+        with open(args.baseline, 'w') as f:
+            json.dump({'python': platform.python_version(), 'numpy': np.__version__,
+                       'machine': platform.machine(), 'results': results}, f, indent=2)
+        print(f"Đã lưu baseline: {args.baseline}")
+        return 0
+
+    try:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    except FileNotFoundError:
+        print(f"Chưa có baseline ({args.baseline}); chạy với --save để tạo.")
+        return 0
+
+    print(f"So sánh với {args.baseline} (ngưỡng +{args.tolerance:.0%}):")
+    regressions = compare(results, baseline, args.tolerance)
+    if regressions:
+        print(f"LỖI: {len(regressions)} bài đo suy giảm hiệu năng")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,200 @@
+# cli.py - Điểm vào dòng lệnh cho các tác vụ không giao diện (headless)
+# Chỉ import những gì tác vụ cần: tkinter/matplotlib không bao giờ được nạp ở đây,
+# scipy chỉ nạp khi phải giải Riccati.
+#
+#   python cli.py run --x0 0.2 0 0 0 -t 60 --out run.npz --timing
+#   python cli.py sweep spec.json --mode random -n 5000
+#   python cli.py bench --only plant
+#   python cli.py swingup -n 5000 --seed 1
+#   python cli.py roa --theta -1.2 1.2 1001 --theta-dot -8 8 1001 --png roa.png
+#   python cli.py sysid logs/run_xxx.cplog --json params.json
+#   python cli.py render logs/*.cplog --out-dir videos
+#   python cli.py scenario scenarios/ --report report.json
+#   python cli.py gui
+
+import time
+
+_T0 = time.perf_counter()
+
+import argparse
+import sys
+
+
+def cmd_run(args):
+    import numpy as np
+    from conf import PhysParam
+    from plant import CartPoleSystem
+    from controller import LQRController
+    from engine import SimEngine
+
+    p = PhysParam()
+    if args.dt:
+        p.dt = args.dt
+    plant = CartPoleSystem(p)
+    if args.controller == 'swingup':
+        from swingup import SwingUpController
+        ctrl = SwingUpController(plant, balance=LQRController(plant, discrete=args.discrete))
+    elif args.controller == 'mpc':
+        from mpc import MPCController
+        ctrl = MPCController(plant, horizon=args.horizon, u_max=args.u_max,
+                             x_limits=(-args.x_max, args.x_max))
+    else:
+        ctrl = LQRController(plant, discrete=args.discrete)
+    ctrl.compute_gains(args.Q, args.R, verbose=False)
+    engine = SimEngine(p, ctrl)
+
+    integrator = None
+    events = ()
+    if args.integrator != 'fixed' or args.stop_on_fall:
+        from integrators import make_integrator, pole_fall
+        if args.integrator != 'fixed':
+            integrator = make_integrator(args.integrator)
+        if args.stop_on_fall:
+            events = (pole_fall(),)
+
+    # Thời gian từ lúc khởi động tới bước mô phỏng đầu tiên
+    engine.run(args.x0, p.dt, integrator=integrator)
+    t_first = time.perf_counter() - _T0
+
+    t_start = time.perf_counter()
+    traj = engine.run(args.x0, args.duration, integrator=integrator, events=events)
+    t_run = time.perf_counter() - t_start
+
+    theta = np.abs(traj.states[:, 0])
+    print(f"Mô phỏng {traj.t[-1]:.2f}s ({len(traj) - 1} bước) trong {t_run * 1e3:.1f} ms "
+          f"(x{traj.t[-1] / max(t_run, 1e-9):,.0f} thời gian thực)")
+    print(f"Góc lớn nhất: {theta.max():.4f} rad | Lực lớn nhất: {np.abs(traj.controls).max():.3f} N")
+    print(f"Trạng thái cuối: {traj.states[-1]}")
+    for name, te, _ in traj.events:
+        print(f"Sự kiện: {name} tại t = {te:.4f}s")
+    if args.controller == 'mpc':
+        s = ctrl.stats()
+        print(f"MPC: giải p50 {s['p50'] * 1e3:.3f} ms | p99 {s['p99'] * 1e3:.3f} ms | max {s['max_all'] * 1e3:.3f} ms | "
+              f"trễ hạn {s['misses']}/{s['count']} | không hội tụ {s['unconverged']}")
+    if args.timing:
+        print(f"Khởi động -> bước mô phỏng đầu tiên: {t_first * 1e3:.1f} ms")
+
+    if args.out:
+        if args.out.endswith('.csv'):
+            data = np.column_stack((traj.t, traj.states, traj.controls))
+            np.savetxt(args.out, data, delimiter=',', header='t,theta,theta_dot,x,x_dot,u', comments='')
+        else:
+            np.savez(args.out, t=traj.t, states=traj.states, controls=traj.controls, K=ctrl.K)
+        print(f"Đã lưu: {args.out}")
+    return 0
+
+
+def cmd_sweep(args):
+    import sweep
+    return sweep.main(args.rest)
+
+
+def cmd_bench(args):
+    import bench
+    return bench.main(args.rest)
+
+
+def cmd_swingup(args):
+    import swingup
+    return swingup.main(args.rest)
+
+
+def cmd_roa(args):
+    import roa
+    return roa.main(args.rest)
+
+
+def cmd_env(args):
+    import env
+    return env.main(args.rest)
+
+
+def cmd_sysid(args):
+    import sysid
+    return sysid.main(args.rest)
+
+
+def cmd_estimator(args):
+    import estimator
+    return estimator.main(args.rest)
+
+
+def cmd_render(args):
+    import offscreen
+    return offscreen.main(args.rest)
+
+
+def cmd_scenario(args):
+    import scenario
+    return scenario.main(args.rest)
+
+
+def cmd_gui(args):
+    import tkinter as tk
+    from main3 import MainApp
+    root = tk.Tk()
+    app = MainApp(root)
+    root.protocol("WM_DELETE_WINDOW", app.on_close)
+    root.mainloop()
+    return 0
+
+
+# Lệnh con chuyển nguyên tham số cho main() của module tương ứng
+DELEGATED = {
+    "sweep": (cmd_sweep, "Quét thông số / Monte Carlo (xem sweep.py)"),
+    "bench": (cmd_bench, "Benchmark hiệu năng (xem bench.py)"),
+    "swingup": (cmd_swingup, "Swing-up từ trạng thái treo xuống, chạy hàng loạt (xem swingup.py)"),
+    "roa": (cmd_roa, "Bản đồ miền hút của LQR (xem roa.py)"),
+    "env": (cmd_env, "Đo thông lượng môi trường reset/step (xem env.py)"),
+    "sysid": (cmd_sysid, "Nhận dạng thông số vật lý từ log .cplog (xem sysid.py)"),
+    "estimator": (cmd_estimator, "So sánh bộ ước lượng trạng thái vòng kín (xem estimator.py)"),
+    "render": (cmd_render, "Dựng log / lần đổ của sweep ra GIF, video, PNG không cần Tk (xem offscreen.py)"),
+    "scenario": (cmd_scenario, "Chạy thư mục kịch bản JSON, lưu đệm kết quả (xem scenario.py)"),
+}
+
+
+def build_parser():
+    from controller import DEFAULT_Q, DEFAULT_R
+
+    ap = argparse.ArgumentParser(description="Cart-pole: mô phỏng và công cụ không giao diện")
+    sub = ap.add_subparsers(dest="command", required=True)
+
+    run = sub.add_parser("run", help="Chạy một lần mô phỏng vòng kín")
+    run.add_argument("--x0", type=float, nargs=4, default=[0.1, 0.0, 0.0, 0.0],
+                     metavar=("THETA", "THETA_DOT", "X", "X_DOT"))
+    run.add_argument("-t", "--duration", type=float, default=10.0)
+    run.add_argument("--dt", type=float, default=None, help="Chu kỳ điều khiển (mặc định PhysParam.dt)")
+    run.add_argument("--Q", type=float, nargs=4, default=DEFAULT_Q)
+    run.add_argument("--R", type=float, default=DEFAULT_R)
+    run.add_argument("--discrete", action="store_true", help="LQR rời rạc (ZOH)")
+    run.add_argument("--controller", default="lqr", choices=("lqr", "mpc", "swingup"))
+    run.add_argument("--horizon", type=int, default=30, help="MPC: số bước dự báo")
+    run.add_argument("--u-max", type=float, default=20.0, help="MPC: giới hạn lực (N)")
+    run.add_argument("--x-max", type=float, default=0.5, help="MPC: giới hạn đường ray |x| (m)")
+    run.add_argument("--integrator", default="fixed", choices=("fixed", "rk4", "semi_implicit", "dopri5"))
+    run.add_argument("--stop-on-fall", action="store_true", help="Dừng khi con lắc đổ")
+    run.add_argument("--out", default=None, help="Lưu quỹ đạo (.npz hoặc .csv)")
+    run.add_argument("--timing", action="store_true", help="In thời gian khởi động tới bước đầu tiên")
+    run.set_defaults(func=cmd_run)
+
+    for name, (func, help_text) in DELEGATED.items():
+        p = sub.add_parser(name, help=help_text, add_help=False)
+        p.add_argument("rest", nargs=argparse.REMAINDER)
+        p.set_defaults(func=func)
+
+    gui = sub.add_parser("gui", help="Mở giao diện Tkinter")
+    gui.set_defaults(func=cmd_gui)
+    return ap
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else list(argv)
+    # REMAINDER không nuốt được tùy chọn đứng đầu (--only ...) -> chuyển thẳng
+    if argv and argv[0] in DELEGATED:
+        return DELEGATED[argv[0]][0](argparse.Namespace(rest=argv[1:]))
+    args = build_parser().parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
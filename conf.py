@@ -3,7 +3,13 @@
 import numpy as np
 
 class PhysParam:
-    def __init__(self):
+    def __setattr__(self, name, value):
+        # Mỗi lần gán thuộc tính tăng số phiên bản, để các bộ đệm hằng số
+        # (vd. plant.FastCartPole) biết khi nào cần tính lại
+        object.__setattr__(self, name, value)
+        object.__setattr__(self, 'version', self.__dict__.get('version', 0) + 1)
+
+    def __init__(self, verbose=False):
         # --- 1. THÔNG SỐ CƠ BẢN (NHẬP VÀO) ---
         self.M = 0.5        # Khối lượng xe (kg)
         self.L = 0.3        # Chiều dài thanh (m)
@@ -17,6 +23,24 @@ class PhysParam:
         self.m_ball = 0.1   # Khối lượng riêng của quả cầu (kg)
         
         # --- 3. TỰ ĐỘNG TÍNH TOÁN (DERIVED PARAMETERS) ---
+        self.update_derived()
+
+        # In ra để kiểm tra (mặc định im lặng: tạo PhysParam phải rẻ và không gây nhiễu stdout)
+        if verbose:
+            print(self.summary())
+
+        # Target state
+        # Trạng thái mục tiêu (Cân bằng thẳng đứng, xe ở giữa)
+        # Vector trạng thái: [theta, theta_dot, x, x_dot]
+        self.target_state = np.array([0.0, 0.0, 0.0, 0.0])
+        
+        self.dt = 0.02 # Bước thời gian lấy mẫu (20ms = 50Hz)
+
+    def update_derived(self):
+        """
+        Tính lại các thông số dẫn xuất (m_total, l_cm, J) từ M, m_pole, m_ball, L.
+        Gọi lại hàm này sau mỗi lần thay đổi thông số cơ bản.
+        """
         # Tổng khối lượng con lắc
         self.m_total = self.m_pole + self.m_ball 
 
@@ -33,18 +57,72 @@ class PhysParam:
         J_ball = self.m_ball * (self.L**2)
         self.J = J_pole + J_ball
 
-        # In ra để kiểm tra
-        print(f"--- CẤU TRÚC VẬT LÝ MỚI ---")
-        print(f"Tổng khối lượng m: {self.m_total:.3f} kg")
-        print(f"Trọng tâm l_cm: {self.l_cm:.4f} m (Lệch về phía đỉnh)")
-        print(f"Quán tính J: {self.J:.6f}")
+    def summary(self):
+        return (f"--- CẤU TRÚC VẬT LÝ MỚI ---\n"
+                f"Tổng khối lượng m: {self.m_total:.3f} kg\n"
+                f"Trọng tâm l_cm: {self.l_cm:.4f} m (Lệch về phía đỉnh)\n"
+                f"Quán tính J: {self.J:.6f}")
 
-        # Target state
-        # Trạng thái mục tiêu (Cân bằng thẳng đứng, xe ở giữa)
-        # Vector trạng thái: [theta, theta_dot, x, x_dot]
-        self.target_state = np.array([0.0, 0.0, 0.0, 0.0])
-        
-        self.dt = 0.02 # Bước thời gian lấy mẫu (20ms = 50Hz)
+class LinkParam:
+    """
+    Thông số một khâu của con lắc nhiều khâu (khâu 1 gắn trên xe, khâu i+1 gắn ở đầu khâu i).
+    m:    khối lượng khâu (kg)
+    L:    chiều dài từ khớp dưới đến khớp trên / đầu khâu (m)
+    l_cm: khoảng cách từ khớp dưới đến trọng tâm (m)
+    J:    moment quán tính quanh khớp dưới (kg*m^2), cùng quy ước với PhysParam.J
+    """
+    def __init__(self, m, L, l_cm, J):
+        self.m = m
+        self.L = L
+        self.l_cm = l_cm
+        self.J = J
+
+    @classmethod
+    def rod_ball(cls, m_pole, m_ball, L):
+        """Khâu dạng Thanh + Cầu ở đỉnh, cùng công thức với PhysParam.update_derived()."""
+        m = m_pole + m_ball
+        l_cm = (m_pole * (L / 2) + m_ball * L) / m
+        J = (1/3) * m_pole * (L**2) + m_ball * (L**2)
+        return cls(m, L, l_cm, J)
+
+    def __repr__(self):
+        return f"LinkParam(m={self.m:g}, L={self.L:g}, l_cm={self.l_cm:g}, J={self.J:g})"
+
+class NLinkParam:
+    """
+    Thông số xe + chuỗi N khâu (con lắc ngược đôi, ba, ...).
+    Vector trạng thái: [theta_1, theta_dot_1, ..., theta_N, theta_dot_N, x, x_dot],
+    theta_i là góc tuyệt đối của khâu i so với phương thẳng đứng (0 = thẳng đứng hướng lên).
+    Với N = 1 trùng với [theta, theta_dot, x, x_dot] của PhysParam.
+    """
+    def __setattr__(self, name, value):
+        # Như PhysParam: mỗi lần gán thuộc tính tăng số phiên bản
+        object.__setattr__(self, name, value)
+        object.__setattr__(self, 'version', self.__dict__.get('version', 0) + 1)
+
+    def __init__(self, links=None, M=0.5, g=9.81, d=0.0, dt=0.02):
+        self.M = M          # Khối lượng xe (kg)
+        self.g = g
+        self.d = d          # Ma sát nhớt của xe
+        self.links = list(links) if links is not None else [LinkParam.rod_ball(0.1, 0.1, 0.3)]
+        self.target_state = np.zeros(2 * len(self.links) + 2)
+        self.dt = dt
+
+    @classmethod
+    def from_phys(cls, p):
+        """NLinkParam một khâu tương đương PhysParam (dùng các thông số dẫn xuất đã tính)."""
+        return cls([LinkParam(p.m_total, p.L, p.l_cm, p.J)], M=p.M, g=p.g, d=p.d, dt=p.dt)
+
+    @property
+    def n(self):
+        return len(self.links)
+
+    def summary(self):
+        lines = [f"--- XE + {self.n} KHÂU ---", f"Khối lượng xe M: {self.M:.3f} kg"]
+        for i, link in enumerate(self.links, 1):
+            lines.append(f"Khâu {i}: m={link.m:.3f} kg, L={link.L:.3f} m, "
+                         f"l_cm={link.l_cm:.4f} m, J={link.J:.6f}")
+        return "\n".join(lines)
 
 class SimParam:
     COLOR_BG = "#570080"
@@ -1,18 +1,91 @@
 # controller.py - Tính toán bộ điều khiển LQR (Linear Quadratic Regulator)
 
+from collections import OrderedDict
+
 import numpy as np
-import scipy.linalg
+
+# scipy.linalg chỉ được import khi thật sự giải Riccati / rời rạc hóa (import tốn ~0.3s),
+# nên các tiến trình chỉ tra bộ đệm hoặc không dùng LQR không phải trả chi phí này.
+
+# Trọng số mặc định (dùng chung cho GUI và mô phỏng headless)
+DEFAULT_Q = [100.0, 1.0, 10.0, 1.0]
+DEFAULT_R = 0.1
+
+
+class GainCache:
+    """
+    Bộ nhớ đệm LRU cho ma trận K, khóa theo (chế độ, dt, A, B, Q, R).
+    Tránh giải lại phương trình Riccati khi thông số không đổi
+    (GUI cập nhật thông số, quét tham số lặp lại cùng cấu hình...).
+    """
+    def __init__(self, maxsize=256):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+
+    @staticmethod
+    def make_key(mode, dt, A, B, Q, R):
+        return (mode, dt) + tuple(np.ascontiguousarray(M, dtype=float).tobytes() for M in (A, B, Q, R))
+
+    def get(self, key):
+        K = self._data.get(key)
+        if K is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._data.move_to_end(key)
+        return K
+
+    def put(self, key, K):
+        self._data[key] = K
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def clear(self):
+        self._data.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def info(self):
+        return {'hits': self.hits, 'misses': self.misses, 'size': len(self._data), 'maxsize': self.maxsize}
+
+
+def discretize_zoh(A, B, dt):
+    """
+    Rời rạc hóa (A, B) với bộ giữ bậc 0 (ZOH) chu kỳ dt:
+        expm([[A, B], [0, 0]] * dt) = [[Ad, Bd], [0, I]]
+    """
+    import scipy.linalg
+    n, m = B.shape
+    blk = np.zeros((n + m, n + m))
+    blk[:n, :n] = A
+    blk[:n, n:] = B
+    E = scipy.linalg.expm(blk * dt)
+    return E[:n, :n], E[:n, n:]
+
 
 class LQRController:
-    def __init__(self, plant):
+    # Bộ đệm dùng chung cho mọi instance
+    cache = GainCache()
+
+    def __init__(self, plant, discrete=False):
+        """
+        plant: CartPoleSystem
+        discrete: True -> LQR rời rạc khớp chu kỳ lấy mẫu PhysParam.dt (ZOH + DARE),
+                  False -> LQR liên tục (CARE) như trước
+        """
         self.plant = plant
+        self.discrete = discrete
         self.K = None # Ma trận Gains (sẽ được tính toán)
 
-    def compute_gains(self, Q_diag, R_val):
+    def compute_gains(self, Q_diag, R_val, verbose=True):
         """
         Tính toán ma trận K tối ưu dựa trên trọng số Q và R.
         Q_diag: List 4 phần tử [trọng số theta, trọng số d_theta, trọng số x, trọng số d_x]
         R_val: Trọng số pha phạt năng lượng (Scalar)
+        verbose: In kết quả ra màn hình (tắt khi chạy hàng loạt)
         """
         # 1. Lấy ma trận hệ thống A, B
         A, B = self.plant.get_state_space_matrices()
@@ -24,21 +97,47 @@ class LQRController:
         # R: Ma trận phạt tín hiệu điều khiển (1x1)
         R = np.array([[R_val]])
 
-        # 3. Giải phương trình Riccati đại số liên tục (CARE)
+        # 3. Tra bộ đệm trước khi giải Riccati
+        dt = self.plant.p.dt if self.discrete else 0.0
+        key = GainCache.make_key('d' if self.discrete else 'c', dt, A, B, Q, R)
+        K = self.cache.get(key)
+        if K is None:
+            if self.discrete:
+                K = self._solve_discrete(A, B, Q, R, dt)
+            else:
+                K = self._solve_continuous(A, B, Q, R)
+            self.cache.put(key, K)
+        self.K = K.copy()
+
+        if verbose:
+            print("--- LQR Computed ---")
+            print(f"Q weights: {Q_diag}")
+            print(f"R weight: {R_val}")
+            print(f"Mode: {'discrete (dt=%g)' % dt if self.discrete else 'continuous'}")
+            print(f"Feedback Gains K: {self.K}")
+        
+        return self.K
+
+    @staticmethod
+    def _solve_continuous(A, B, Q, R):
+        import scipy.linalg
+        # Giải phương trình Riccati đại số liên tục (CARE)
         # A.T * P + P * A - P * B * R^-1 * B.T * P + Q = 0
         P = scipy.linalg.solve_continuous_are(A, B, Q, R)
 
-        # 4. Tính ma trận Gain K
+        # Tính ma trận Gain K
         # K = R^-1 * B.T * P
         # Vì R là scalar 1x1, R^-1 = 1/R
-        self.K = np.dot(scipy.linalg.inv(R), np.dot(B.T, P))
-        
-        print("--- LQR Computed ---")
-        print(f"Q weights: {Q_diag}")
-        print(f"R weight: {R_val}")
-        print(f"Feedback Gains K: {self.K}")
-        
-        return self.K
+        return np.dot(scipy.linalg.inv(R), np.dot(B.T, P))
+
+    @staticmethod
+    def _solve_discrete(A, B, Q, R, dt):
+        import scipy.linalg
+        # Rời rạc hóa ZOH rồi giải phương trình Riccati đại số rời rạc (DARE)
+        # K = (R + Bd.T * P * Bd)^-1 * Bd.T * P * Ad
+        Ad, Bd = discretize_zoh(A, B, dt)
+        P = scipy.linalg.solve_discrete_are(Ad, Bd, Q, R)
+        return np.linalg.solve(R + Bd.T @ P @ Bd, Bd.T @ P @ Ad)
 
     def get_action(self, state):
         """
@@ -58,4 +157,115 @@ class LQRController:
         # Kết quả là ma trận 1x1, lấy ra giá trị scalar
         u = -np.dot(self.K, error).item()
         
-        return u
\ No newline at end of file
+        return u
+
+class GainScheduledController:
+    """
+    LQR lập lịch độ lợi (Gain Scheduling): tính trước bảng K trên lưới điểm làm việc
+    (theta, theta_dot), mỗi điểm dùng mô hình tuyến tính hóa plant.linearize().
+    Khi chạy chỉ nội suy song tuyến tính trong bảng - không giải Riccati trong vòng lặp.
+    Giao diện giống LQRController (compute_gains / get_action) để thay thế trực tiếp.
+    """
+    def __init__(self, plant, theta_range=(-0.6, 0.6), theta_dot_range=(-3.0, 3.0),
+                 n_theta=13, n_theta_dot=13, discrete=False):
+        self.plant = plant
+        self.discrete = discrete
+        self.theta_grid = np.linspace(theta_range[0], theta_range[1], n_theta)
+        self.theta_dot_grid = np.linspace(theta_dot_range[0], theta_dot_range[1], n_theta_dot)
+        self.table = None   # (n_theta, n_theta_dot, 4)
+        self.K = None       # K tại điểm gần thẳng đứng nhất (tương thích LQRController)
+
+        # Hằng số lưới đều để tra chỉ số bằng phép tính thay vì tìm kiếm
+        self._t0 = float(self.theta_grid[0])
+        self._w0 = float(self.theta_dot_grid[0])
+        self._inv_dt = (n_theta - 1) / (theta_range[1] - theta_range[0])
+        self._inv_dw = (n_theta_dot - 1) / (theta_dot_range[1] - theta_dot_range[0])
+        self._imax = n_theta - 2
+        self._jmax = n_theta_dot - 2
+        self._rows = None
+
+    def compute_gains(self, Q_diag, R_val, verbose=True):
+        """Tính bảng K trên toàn bộ lưới (gọi lại khi thông số thay đổi)."""
+        Q = np.diag(Q_diag)
+        R = np.array([[R_val]])
+        dt = self.plant.p.dt
+
+        table = np.empty((len(self.theta_grid), len(self.theta_dot_grid), 4))
+        for i, th in enumerate(self.theta_grid):
+            for j, w in enumerate(self.theta_dot_grid):
+                A, B = self.plant.linearize(th, w)
+                if self.discrete:
+                    K = LQRController._solve_discrete(A, B, Q, R, dt)
+                else:
+                    K = LQRController._solve_continuous(A, B, Q, R)
+                table[i, j] = K.ravel()
+        self.table = table
+
+        # Bảng dạng list các tuple Python: truy cập phần tử nhanh hơn mảng NumPy trong vòng lặp
+        self._rows = [[tuple(table[i, j]) for j in range(table.shape[1])] for i in range(table.shape[0])]
+
+        i0 = int(np.argmin(np.abs(self.theta_grid)))
+        j0 = int(np.argmin(np.abs(self.theta_dot_grid)))
+        self.K = table[i0, j0].reshape(1, 4)
+
+        if verbose:
+            print("--- Gain-Scheduled LQR Computed ---")
+            print(f"Grid: {table.shape[0]} x {table.shape[1]} operating points")
+            print(f"K (upright): {self.K}")
+        return self.K
+
+    def _cell(self, theta, theta_dot):
+        """Chỉ số ô lưới (i, j) và hệ số nội suy (a, b); ngoài lưới thì kẹp về biên."""
+        fi = (theta - self._t0) * self._inv_dt
+        fj = (theta_dot - self._w0) * self._inv_dw
+        i = int(fi)
+        j = int(fj)
+        if i < 0:
+            i = 0
+        elif i > self._imax:
+            i = self._imax
+        if j < 0:
+            j = 0
+        elif j > self._jmax:
+            j = self._jmax
+        a = min(max(fi - i, 0.0), 1.0)
+        b = min(max(fj - j, 0.0), 1.0)
+        return i, j, a, b
+
+    def gains_at(self, theta, theta_dot):
+        """Nội suy song tuyến tính K(theta, theta_dot), trả về mảng (1, 4)."""
+        i, j, a, b = self._cell(theta, theta_dot)
+        t = self.table
+        K = ((1 - a) * ((1 - b) * t[i, j] + b * t[i, j + 1])
+             + a * ((1 - b) * t[i + 1, j] + b * t[i + 1, j + 1]))
+        return K.reshape(1, 4)
+
+    def get_action(self, state):
+        """
+        u = -K(theta, theta_dot) * (State - Target)
+        Toàn bộ tính bằng số thực Python (không tạo mảng NumPy) để mỗi bước chỉ tốn vài micro giây.
+        """
+        if self._rows is None:
+            return 0.0
+
+        theta, theta_dot, x, x_dot = state.tolist() if isinstance(state, np.ndarray) else state
+        t0, t1, t2, t3 = self.plant.p.target_state.tolist()
+        e0 = theta - t0
+        e1 = theta_dot - t1
+        e2 = x - t2
+        e3 = x_dot - t3
+
+        i, j, a, b = self._cell(theta, theta_dot)
+        row_i = self._rows[i]
+        row_i1 = self._rows[i + 1]
+        k00 = row_i[j]
+        k01 = row_i[j + 1]
+        k10 = row_i1[j]
+        k11 = row_i1[j + 1]
+
+        # u của từng góc ô rồi nội suy (tương đương nội suy K trước vì u tuyến tính theo K)
+        u00 = k00[0] * e0 + k00[1] * e1 + k00[2] * e2 + k00[3] * e3
+        u01 = k01[0] * e0 + k01[1] * e1 + k01[2] * e2 + k01[3] * e3
+        u10 = k10[0] * e0 + k10[1] * e1 + k10[2] * e2 + k10[3] * e3
+        u11 = k11[0] * e0 + k11[1] * e1 + k11[2] * e2 + k11[3] * e3
+        return -((1 - a) * ((1 - b) * u00 + b * u01) + a * ((1 - b) * u10 + b * u11))
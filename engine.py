@@ -0,0 +1,125 @@
+# engine.py - Bộ mô phỏng không giao diện (Headless), chạy nhanh hơn thời gian thực
+# Dùng chung CartPoleSystem, LQRController và PhysParam với GUI nhưng không cần Tk/matplotlib.
+
+import numpy as np
+
+from plant import CartPoleSystem, FastCartPole
+from controller import LQRController, DEFAULT_Q, DEFAULT_R
+
+
+class Trajectory:
+    """
+    Kết quả một lần chạy vòng kín.
+        t:        (n+1,)   thời điểm lấy mẫu
+        states:   (n+1, 4) trạng thái [theta, theta_dot, x, x_dot]
+        controls: (n+1,)   lực tác dụng lên xe tại mỗi mẫu (bộ điều khiển + ngoại lực)
+    Mẫu cuối cùng không có bước điều khiển kế tiếp nên controls[-1] = 0.
+    """
+    def __init__(self, t, states, controls, events=None):
+        self.t = t
+        self.states = states
+        self.controls = controls
+        self.events = events if events is not None else []  # (tên, t, state) từ integrators.Event
+
+    def __len__(self):
+        return len(self.t)
+
+
+class SimEngine:
+    def __init__(self, phys_param, controller=None):
+        """
+        phys_param: Đối tượng PhysParam
+        controller: Bộ điều khiển có hàm get_action(state). Nếu None,
+                    tạo LQRController với trọng số mặc định như GUI.
+        """
+        self.p = phys_param
+        self.plant = CartPoleSystem(phys_param)
+        self.kernel = FastCartPole(phys_param)
+        if controller is None:
+            controller = LQRController(self.plant)
+            controller.compute_gains(DEFAULT_Q, DEFAULT_R, verbose=False)
+        self.controller = controller
+
+    def run(self, x0, duration, dt=None, external_force=None, integrator=None, events=()):
+        """
+        Chạy vòng kín trong `duration` giây, không chờ đồng hồ thực.
+        x0: trạng thái ban đầu [theta, theta_dot, x, x_dot]
+        dt: bước mô phỏng (mặc định PhysParam.dt)
+        external_force: None hoặc hàm f(t) -> lực ngoại (N), cộng vào lực điều khiển
+                        (tương đương nút ĐẨY TRÁI/PHẢI trên GUI)
+        integrator: None (một bước RK4 của FastCartPole mỗi chu kỳ) hoặc bộ tích phân từ integrators.py,
+                    dùng để tích phân trong mỗi chu kỳ điều khiển (lực giữ không đổi)
+        events: các integrators.Event (vd. pole_fall(), track_end(0.5)); sự kiện terminal
+                dừng mô phỏng và quỹ đạo bị cắt tại thời điểm sự kiện
+        """
+        if dt is None:
+            dt = self.p.dt
+        n = int(round(duration / dt))
+        if events and integrator is None:
+            from integrators import RK4
+            integrator = RK4(h=dt)
+
+        # Cấp phát trước toàn bộ quỹ đạo
+        t = np.arange(n + 1) * dt
+        states = np.empty((n + 1, 4))
+        controls = np.zeros(n + 1)
+
+        state = np.asarray(x0, dtype=float)
+        states[0] = state
+
+        get_action = self.controller.get_action
+        step = self.kernel.step
+        dynamics = self.plant.dynamics
+        found = []
+        for k in range(n):
+            u = get_action(state)
+            if external_force is not None:
+                u += external_force(t[k])
+            controls[k] = u
+            if integrator is None:
+                # Ghi thẳng vào hàng kế tiếp của quỹ đạo, không tạo mảng tạm
+                state = step(state, u, dt, states[k + 1])
+                continue
+
+            res = integrator.integrate(lambda y: dynamics(y, u), state, dt, events)
+            state = res.y
+            for name, te, ye in res.events:
+                found.append((name, t[k] + te, ye))
+            states[k + 1] = state
+            if res.terminated:
+                t[k + 1] = t[k] + res.t
+                return Trajectory(t[:k + 2], states[:k + 2], controls[:k + 2], found)
+
+        return Trajectory(t, states, controls, found)
+
+    def run_batch(self, X0, duration, K, params=None, dt=None):
+        """
+        Chạy N hệ vòng kín cùng lúc với luật u = -K_i * (x_i - target).
+        X0:     (N, 4) trạng thái ban đầu
+        K:      (4,), (1, 4) dùng chung, hoặc (N, 4) - gain riêng từng hàng
+        params: None hoặc dict từ plant.batch_params() (thông số riêng từng hàng)
+        Trả về Trajectory với states (n+1, N, 4) và controls (n+1, N).
+        """
+        if dt is None:
+            dt = self.p.dt
+        n = int(round(duration / dt))
+
+        X = np.array(X0, dtype=float)
+        K = np.atleast_2d(np.asarray(K, dtype=float))
+        N = X.shape[0]
+        target = self.p.target_state
+
+        t = np.arange(n + 1) * dt
+        states = np.empty((n + 1, N, 4))
+        controls = np.zeros((n + 1, N))
+        states[0] = X
+
+        rk4_step_batch = self.plant.rk4_step_batch
+        for k in range(n):
+            # Tích vô hướng từng hàng: u_i = -K_i . e_i
+            u = -np.einsum('ij,ij->i', np.broadcast_to(K, X.shape), X - target)
+            controls[k] = u
+            X = rk4_step_batch(X, u, dt, params)
+            states[k + 1] = X
+
+        return Trajectory(t, states, controls)
@@ -0,0 +1,331 @@
+# env.py - Môi trường kiểu Gym (reset / step) trên CartPoleSystem cho bộ điều khiển học máy
+# Dùng đúng mô hình vật rắn của dự án (l_cm, J từ conf.py), không phải con lắc chất điểm trong sách.
+#   CartPoleEnv     : một môi trường, bước bằng nhân vô hướng FastCartPole
+#   VecCartPoleEnv  : N môi trường bước trong một lần gọi trên mảng (N, 4), tự reset khi kết thúc
+#   ShardedVecEnv   : chia N môi trường cho nhiều tiến trình con, mỗi tiến trình giữ một VecCartPoleEnv
+# API theo Gymnasium: reset(seed) -> (obs, info); step(action) -> (obs, reward, terminated, truncated, info)
+#
+# Đo thông lượng:
+#   python env.py --num-envs 4096 --workers 4
+
+import argparse
+import multiprocessing as mp
+import time
+
+import numpy as np
+
+from conf import PhysParam
+from plant import CartPoleSystem, FastCartPole, batch_params
+
+
+# ----------------------------------------------------------------------
+# Hàm thưởng: nhận mảng (..., 4) / (...,) nên dùng chung cho môi trường đơn và lô
+# ----------------------------------------------------------------------
+def reward_alive(state, force, next_state):
+    """+1 cho mỗi bước còn đứng (kiểu CartPole cổ điển)."""
+    return np.ones(np.shape(force))
+
+
+def reward_upright(state, force, next_state):
+    """cos(theta) trừ phạt nhẹ vị trí xe: tối đa 1 khi thẳng đứng ở giữa đường ray."""
+    return np.cos(next_state[..., 0]) - 0.1 * next_state[..., 2]**2
+
+
+def make_quadratic_reward(Q_diag=(100.0, 1.0, 10.0, 1.0), R_val=0.1, scale=0.01):
+    """Thưởng = -scale * (e'Qe + R u^2), cùng trọng số với LQR để so sánh trực tiếp."""
+    Q = np.asarray(Q_diag, dtype=float)
+
+    def reward_quadratic(state, force, next_state):
+        return -scale * ((next_state**2 * Q).sum(axis=-1) + R_val * np.asarray(force)**2)
+    return reward_quadratic
+
+
+REWARDS = {
+    'alive': reward_alive,
+    'upright': reward_upright,
+    'quadratic': make_quadratic_reward(),
+}
+
+
+def _reward_fn(reward):
+    if callable(reward):
+        return reward
+    try:
+        return REWARDS[reward]
+    except KeyError:
+        raise ValueError(f"Hàm thưởng không hỗ trợ: {reward} (có: {', '.join(REWARDS)})") from None
+
+
+class _EnvConfig:
+    """Cấu hình chung của CartPoleEnv và VecCartPoleEnv."""
+    def __init__(self, phys=None, dt=None, substeps=1, max_steps=500, force_max=20.0, action_forces=None,
+                 reward='upright', theta_limit=0.8, x_limit=1.0, obs_noise=0.0,
+                 init_low=(-0.05, -0.05, -0.05, -0.05), init_high=(0.05, 0.05, 0.05, 0.05)):
+        """
+        phys: PhysParam (mặc định PhysParam())
+        dt: chu kỳ một bước môi trường (mặc định PhysParam.dt); substeps: số bước RK4 trong một bước
+        max_steps: cắt tập (truncated) sau số bước này
+        force_max: kẹp lực liên tục vào [-force_max, force_max]
+        action_forces: danh sách lực cho hành động rời rạc (vd. [-10, 10]); None -> hành động là lực
+        reward: 'alive' | 'upright' | 'quadratic' hoặc hàm f(state, force, next_state)
+        theta_limit, x_limit: kết thúc tập khi |theta| / |x| vượt ngưỡng (None -> bỏ điều kiện)
+        obs_noise: độ lệch chuẩn nhiễu Gauss cộng vào quan sát (scalar hoặc 4 phần tử)
+        init_low, init_high: phân phối đều của trạng thái ban đầu
+        """
+        self.p = phys if phys is not None else PhysParam()
+        self.dt = dt if dt is not None else self.p.dt
+        self.substeps = substeps
+        self.max_steps = max_steps
+        self.force_max = force_max
+        self.action_forces = None if action_forces is None else np.asarray(action_forces, dtype=float)
+        self.reward_fn = _reward_fn(reward)
+        self.theta_limit = theta_limit
+        self.x_limit = x_limit
+        self.obs_noise = np.broadcast_to(np.asarray(obs_noise, dtype=float), (4,)).copy()
+        self.init_low = np.asarray(init_low, dtype=float)
+        self.init_high = np.asarray(init_high, dtype=float)
+
+    def _force(self, action):
+        if self.action_forces is not None:
+            return self.action_forces[action]
+        return np.clip(action, -self.force_max, self.force_max)
+
+    def _terminated(self, state):
+        term = np.zeros(np.shape(state)[:-1], dtype=bool)
+        if self.theta_limit is not None:
+            term |= np.abs(state[..., 0]) > self.theta_limit
+        if self.x_limit is not None:
+            term |= np.abs(state[..., 2]) > self.x_limit
+        return term
+
+
+class CartPoleEnv(_EnvConfig):
+    """Một môi trường. Trạng thái thật giữ trong self.state, quan sát có thể có nhiễu."""
+    def __init__(self, seed=None, **kwargs):
+        super().__init__(**kwargs)
+        self.kernel = FastCartPole(self.p)
+        self.rng = np.random.default_rng(seed)
+        self.state = np.zeros(4)
+        self.steps = 0
+
+    def _observe(self):
+        if self.obs_noise.any():
+            return self.state + self.rng.normal(0.0, self.obs_noise)
+        return self.state.copy()
+
+    def reset(self, seed=None, state=None):
+        """Bắt đầu tập mới (state: trạng thái đầu cố định, mặc định lấy mẫu đều trong [init_low, init_high])."""
+        if seed is not None:
+            self.rng = np.random.default_rng(seed)
+        if state is None:
+            state = self.rng.uniform(self.init_low, self.init_high)
+        self.state = np.array(state, dtype=float)
+        self.steps = 0
+        return self._observe(), {}
+
+    def step(self, action):
+        force = float(self._force(action))
+        prev = self.state.copy()
+        h = self.dt / self.substeps
+        for _ in range(self.substeps):
+            self.kernel.step(self.state, force, h, out=self.state)
+        self.steps += 1
+
+        reward = float(self.reward_fn(prev, force, self.state))
+        terminated = bool(self._terminated(self.state))
+        truncated = self.steps >= self.max_steps and not terminated
+        return self._observe(), reward, terminated, truncated, {'force': force}
+
+
+class VecCartPoleEnv(_EnvConfig):
+    """
+    N môi trường bước cùng lúc trên mảng. Môi trường nào kết thúc (terminated/truncated)
+    được reset ngay trong step(); quan sát cuối của tập cũ nằm trong info['final_observation']
+    (theo quy ước vector env của Gymnasium).
+    params: None (cùng PhysParam) hoặc danh sách N PhysParam (ngẫu nhiên hóa miền).
+    """
+    def __init__(self, num_envs, seed=None, params=None, **kwargs):
+        super().__init__(**kwargs)
+        self.num_envs = num_envs
+        self.plant = CartPoleSystem(self.p)
+        self.params = None
+        if params is not None:
+            if len(params) != num_envs:
+                raise ValueError(f"Cần {num_envs} PhysParam, nhận {len(params)}")
+            self.params = batch_params(params)
+        self.rng = np.random.default_rng(seed)
+        self.states = np.zeros((num_envs, 4))
+        self.steps = np.zeros(num_envs, dtype=np.int64)
+
+    def _sample(self, n):
+        return self.rng.uniform(self.init_low, self.init_high, size=(n, 4))
+
+    def _observe(self):
+        if self.obs_noise.any():
+            return self.states + self.rng.normal(0.0, 1.0, self.states.shape) * self.obs_noise
+        return self.states.copy()
+
+    def reset(self, seed=None, states=None):
+        if seed is not None:
+            self.rng = np.random.default_rng(seed)
+        self.states = self._sample(self.num_envs) if states is None else np.array(states, dtype=float)
+        self.steps[:] = 0
+        return self._observe(), {}
+
+    def step(self, actions):
+        """actions: (N,) lực hoặc chỉ số hành động rời rạc."""
+        forces = self._force(np.asarray(actions))
+        prev = self.states
+        X = prev
+        h = self.dt / self.substeps
+        for _ in range(self.substeps):
+            X = self.plant.rk4_step_batch(X, forces, h, self.params)
+        self.steps += 1
+
+        rewards = self.reward_fn(prev, forces, X)
+        terminated = self._terminated(X)
+        truncated = (self.steps >= self.max_steps) & ~terminated
+        info = {}
+
+        done = terminated | truncated
+        if done.any():
+            info['final_observation'] = X[done].copy()
+            info['done_index'] = np.flatnonzero(done)
+            X[done] = self._sample(int(done.sum()))
+            self.steps[done] = 0
+        self.states = X
+        return self._observe(), rewards, terminated, truncated, info
+
+
+# ----------------------------------------------------------------------
+# Chia môi trường cho nhiều tiến trình
+# ----------------------------------------------------------------------
+def _worker(conn, num_envs, seed, kwargs):
+    env = VecCartPoleEnv(num_envs, seed=seed, **kwargs)
+    try:
+        while True:
+            cmd, arg = conn.recv()
+            if cmd == 'step':
+                conn.send(env.step(arg))
+            elif cmd == 'reset':
+                conn.send(env.reset(*arg))
+            elif cmd == 'close':
+                break
+    finally:
+        conn.close()
+
+
+class ShardedVecEnv:
+    """
+    num_envs môi trường chia đều cho num_workers tiến trình con (mỗi tiến trình một VecCartPoleEnv).
+    Lệnh step được gửi tới mọi tiến trình trước rồi mới chờ kết quả, nên các mảnh chạy song song.
+    Cùng API với VecCartPoleEnv; chỉ số trong info['done_index'] là chỉ số toàn cục.
+    kwargs phải pickle được (hàm thưởng tự định nghĩa phải ở cấp module).
+    """
+    def __init__(self, num_envs, num_workers=None, seed=None, **kwargs):
+        num_workers = min(num_workers or mp.cpu_count(), num_envs)
+        sizes = [num_envs // num_workers + (i < num_envs % num_workers) for i in range(num_workers)]
+        self.num_envs = num_envs
+        self.offsets = np.cumsum([0] + sizes)
+        seeds = np.random.SeedSequence(seed).spawn(num_workers)
+        self.conns = []
+        self.procs = []
+        for n, s in zip(sizes, seeds):
+            parent, child = mp.Pipe()
+            proc = mp.Process(target=_worker, args=(child, n, s, kwargs), daemon=True)
+            proc.start()
+            child.close()
+            self.conns.append(parent)
+            self.procs.append(proc)
+
+    def reset(self, seed=None):
+        seeds = [None] * len(self.conns) if seed is None else np.random.SeedSequence(seed).spawn(len(self.conns))
+        for conn, s in zip(self.conns, seeds):
+            conn.send(('reset', (s,)))
+        obs = [conn.recv()[0] for conn in self.conns]
+        return np.concatenate(obs), {}
+
+    def step(self, actions):
+        actions = np.asarray(actions)
+        for i, conn in enumerate(self.conns):
+            conn.send(('step', actions[self.offsets[i]:self.offsets[i + 1]]))
+        results = [conn.recv() for conn in self.conns]
+
+        obs = np.concatenate([r[0] for r in results])
+        rewards = np.concatenate([r[1] for r in results])
+        terminated = np.concatenate([r[2] for r in results])
+        truncated = np.concatenate([r[3] for r in results])
+        final = [(r[4]['final_observation'], r[4]['done_index'] + off)
+                 for r, off in zip(results, self.offsets) if 'done_index' in r[4]]
+        info = {}
+        if final:
+            info['final_observation'] = np.concatenate([f[0] for f in final])
+            info['done_index'] = np.concatenate([f[1] for f in final])
+        return obs, rewards, terminated, truncated, info
+
+    def close(self):
+        for conn in self.conns:
+            try:
+                conn.send(('close', None))
+            except (BrokenPipeError, OSError):
+                pass
+        for proc in self.procs:
+            proc.join(timeout=1.0)
+        self.conns = []
+        self.procs = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def main(argv=None):
+    """Đo thông lượng (bước môi trường / giây) với chính sách LQR làm tải thực tế."""
+    from controller import LQRController, DEFAULT_Q, DEFAULT_R
+
+    ap = argparse.ArgumentParser(description="Đo thông lượng môi trường CartPole")
+    ap.add_argument("--num-envs", type=int, default=1024)
+    ap.add_argument("--workers", type=int, default=None, help="Số tiến trình cho ShardedVecEnv")
+    ap.add_argument("--steps", type=int, default=500)
+    ap.add_argument("--obs-noise", type=float, default=0.0)
+    args = ap.parse_args(argv)
+
+    p = PhysParam()
+    K = LQRController(CartPoleSystem(p)).compute_gains(DEFAULT_Q, DEFAULT_R, verbose=False).ravel()
+    kwargs = {'obs_noise': args.obs_noise, 'init_low': (-0.3,) * 4, 'init_high': (0.3,) * 4}
+
+    env = CartPoleEnv(seed=0, **kwargs)
+    obs, _ = env.reset()
+    t0 = time.perf_counter()
+    ret = 0.0
+    for _ in range(args.steps):
+        obs, r, term, trunc, _ = env.step(-float(K @ obs))
+        ret += r
+        if term or trunc:
+            obs, _ = env.reset()
+    t1 = time.perf_counter()
+    print(f"CartPoleEnv          : {args.steps / (t1 - t0):12,.0f} bước/s")
+
+    vec = VecCartPoleEnv(args.num_envs, seed=0, **kwargs)
+    obs, _ = vec.reset()
+    t0 = time.perf_counter()
+    for _ in range(args.steps):
+        obs, r, term, trunc, info = vec.step(-(obs @ K))
+    t1 = time.perf_counter()
+    print(f"VecCartPoleEnv[{args.num_envs}] : {args.num_envs * args.steps / (t1 - t0):12,.0f} bước/s")
+
+    with ShardedVecEnv(args.num_envs, args.workers, seed=0, **kwargs) as sharded:
+        obs, _ = sharded.reset()
+        t0 = time.perf_counter()
+        for _ in range(args.steps):
+            obs, r, term, trunc, info = sharded.step(-(obs @ K))
+        t1 = time.perf_counter()
+        print(f"ShardedVecEnv[{args.num_envs}, {len(sharded.procs)} tiến trình]: "
+              f"{args.num_envs * args.steps / (t1 - t0):12,.0f} bước/s")
+    return 0
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,323 @@
+# estimator.py - Ước lượng trạng thái đầy đủ từ phép đo UART [theta, x] có nhiễu và trễ
+# - SteadyStateKalman: Kalman rời rạc với độ lợi ổn định (DARE) tính một lần mỗi khi PhysParam đổi
+#   (mô hình get_state_space_matrices() rời rạc hóa ZOH theo chu kỳ cảm biến); mỗi mẫu chỉ vài phép
+#   nhân ma trận 4x4, không lan truyền hiệp phương sai.
+# - ExtendedKalman: biến thể phi tuyến dựa trên CartPoleSystem.dynamics()/linearize(), dùng khi
+#   trạng thái đi xa điểm cân bằng (vd. swing-up); đắt hơn vì cập nhật hiệp phương sai mỗi mẫu.
+# Trễ đo cố định `delay` mẫu: bộ lọc chạy ở thời điểm đo, sau đó dự báo tới hiện tại bằng
+# các lệnh lực đã gửi trong khoảng trễ.
+#
+# Giao thức dùng mỗi khi nhận một mẫu đo (xem MainApp.on_hw_measurement):
+#   state = est.update(t, theta, x)      # ước lượng trạng thái hiện tại
+#   u = controller.get_action(state)
+#   est.command(u)                       # lực sẽ giữ (ZOH) tới mẫu kế tiếp
+#
+# Cách dùng (so sánh với sai phân lùi trên mô phỏng vòng kín):
+#   python estimator.py --noise 1e-3 --delay 2
+
+import argparse
+import time
+from collections import deque
+
+import numpy as np
+
+from controller import discretize_zoh
+from instrument import StageTimer
+
+# Phép đo: theta và x
+C = np.array([[1.0, 0.0, 0.0, 0.0],
+              [0.0, 0.0, 1.0, 0.0]])
+
+
+class SteadyStateKalman:
+    """
+    Bộ lọc Kalman độ lợi cố định cho mô hình tuyến tính quanh điểm cân bằng thẳng đứng:
+        x_{k+1} = Ad x_k + Bd u_k + w,   w ~ N(0, Qn),  Qn = sigma_force^2 Bd Bd' + diag(q_state)
+        y_k     = C x_k + v,             v ~ N(0, diag(sigma_theta^2, sigma_x^2))
+    """
+    def __init__(self, plant, dt=1e-3, delay=0, sigma_theta=1e-3, sigma_x=1e-3, sigma_force=1.0,
+                 q_state=(1e-8, 1e-6, 1e-8, 1e-6), timing_window=1000):
+        """
+        plant: CartPoleSystem
+        dt: chu kỳ lấy mẫu của cảm biến (giây), 1 kHz mặc định
+        delay: trễ đo cố định (số mẫu) giữa lúc đo và lúc nhận được
+        sigma_theta, sigma_x: độ lệch chuẩn nhiễu đo (rad, m)
+        sigma_force: độ lệch chuẩn lực nhiễu quy về đầu vào (N) - sai số mô hình, va chạm, ...
+        q_state: phương sai nhiễu quá trình cộng thêm trên từng trạng thái
+        """
+        self.plant = plant
+        self.dt = dt
+        self.delay = int(delay)
+        self.sigma_theta = sigma_theta
+        self.sigma_x = sigma_x
+        self.sigma_force = sigma_force
+        self.q_state = q_state
+        self.timer = StageTimer(window=timing_window, deadline=dt)
+        self.L = None           # Độ lợi Kalman ổn định (4x2)
+        self.P = None           # Hiệp phương sai tiên nghiệm ổn định (4x4)
+        self._version = None    # PhysParam.version lúc tính độ lợi
+        self.reset()
+
+    def _build(self):
+        import scipy.linalg
+        p = self.plant.p
+        A, B = self.plant.get_state_space_matrices()
+        Ad, Bd = discretize_zoh(A, B, self.dt)
+        Qn = self.sigma_force**2 * (Bd @ Bd.T) + np.diag(self.q_state)
+        Rn = np.diag([self.sigma_theta**2, self.sigma_x**2])
+
+        # Phương trình Riccati đối ngẫu -> hiệp phương sai tiên nghiệm P, độ lợi L = P C' (C P C' + R)^-1
+        P = scipy.linalg.solve_discrete_are(Ad.T, C.T, Qn, Rn)
+        L = np.linalg.solve(C @ P @ C.T + Rn, C @ P).T
+        IKC = np.eye(4) - L @ C
+        self.P, self.L = P, L
+        self._Qn, self._Rn = Qn, Rn     # Dùng chung với ExtendedKalman (cùng mô hình nhiễu)
+        self._Ad, self._Bd = Ad, Bd.ravel()
+        # Dự báo + hiệu chỉnh gộp: x = (I - LC)(Ad x + Bd u) + L y
+        self._F, self._G = IKC @ Ad, (IKC @ Bd).ravel()
+
+        # Bù trễ: x_now = Ad^d x_k + [Ad^(d-1) Bd ... Bd] [u_(k) ... u_(k+d-1)]
+        d = self.delay
+        self._Ad_pow = np.linalg.matrix_power(Ad, d)
+        H = np.empty((4, d))
+        col = Bd.ravel()
+        for i in range(d - 1, -1, -1):
+            H[:, i] = col
+            col = Ad @ col
+        self._H = H
+        self._version = p.version
+
+    def compute_gains(self, verbose=False):
+        """Tính lại độ lợi ổn định (tự động gọi khi PhysParam đổi)."""
+        self._build()
+        if verbose:
+            print("--- Steady-state Kalman ---")
+            print(f"dt: {self.dt:g}s | delay: {self.delay} mẫu")
+            print(f"Gain L:\n{self.L}")
+        return self.L
+
+    def reset(self, state=None):
+        """Đặt lại ước lượng (mặc định: điểm mục tiêu) và lịch sử lệnh lực."""
+        self.x = np.zeros(4) if state is None else np.array(state, dtype=float)
+        self.state = self.x.copy()
+        self._t_prev = None
+        self._u = deque([0.0] * (self.delay + 1), maxlen=self.delay + 1)
+        self.timer.reset()
+
+    def command(self, u):
+        """Ghi lực vừa gửi (giữ tới mẫu kế tiếp)."""
+        self._u.append(float(u))
+
+    def _measured(self):
+        # Ước lượng tuyệt đối tại thời điểm đo gần nhất (self.x là sai lệch so với mục tiêu)
+        return self.x + self.plant.p.target_state
+
+    def _set_measured(self, state):
+        self.x = np.array(state, dtype=float) - self.plant.p.target_state
+
+    def handoff(self, other):
+        """
+        Tiếp nối ước lượng của bộ lọc `other` (vd. đổi Kalman ổn định <-> EKF khi bật / tắt
+        swing-up lúc đang nối phần cứng): trạng thái, thời điểm đo và lịch sử lực,
+        tránh mẫu kế tiếp bị coi là mẫu đầu tiên (vận tốc = 0).
+        """
+        if other is None or other._t_prev is None:
+            return
+        if self._version != self.plant.p.version:
+            self._build()
+        self._set_measured(other._measured())
+        self._t_prev = other._t_prev
+        self._u.extend(list(other._u)[-(self.delay + 1):])
+        self.state = np.array(other.state, dtype=float)
+
+    def update(self, t, theta, x):
+        """
+        Nhận phép đo (theta, x) lấy tại thời điểm t (giây, đồng hồ thiết bị).
+        Trả về ước lượng trạng thái hiện tại [theta, theta_dot, x, x_dot] (đã bù trễ).
+        Mẫu bị mất (t nhảy nhiều chu kỳ) được bù bằng các bước dự báo không hiệu chỉnh.
+        """
+        t0 = time.perf_counter()
+        if self._version != self.plant.p.version:
+            self._build()
+        target = self.plant.p.target_state
+        xh = self.x
+        u_hist = self._u
+        u0 = u_hist[0]      # Lực tác dụng trong chu kỳ đo vừa qua
+
+        if self._t_prev is None:
+            # Mẫu đầu tiên: vận tốc chưa biết, lấy 0
+            xh = np.array([theta, 0.0, x, 0.0]) - target
+        else:
+            missed = int(round((t - self._t_prev) / self.dt)) - 1
+            for _ in range(min(max(missed, 0), 100)):
+                xh = self._Ad @ xh + self._Bd * u0
+            y = np.array([theta - target[0], x - target[2]])
+            xh = self._F @ xh + self._G * u0 + self.L @ y
+        self._t_prev = t
+        self.x = xh
+
+        if self.delay:
+            now = self._Ad_pow @ xh + self._H @ np.fromiter(u_hist, float, self.delay + 1)[1:]
+        else:
+            now = xh
+        self.state = now + target
+        self.timer.record(time.perf_counter() - t0)
+        return self.state
+
+    def stats(self):
+        """Thống kê thời gian xử lý mỗi mẫu (giây)."""
+        s = self.timer.stats()
+        s['deadline'] = self.timer.deadline
+        return s
+
+
+class ExtendedKalman(SteadyStateKalman):
+    """
+    Kalman mở rộng (EKF): dự báo bằng RK4 của CartPoleSystem.dynamics(), Jacobian bằng
+    CartPoleSystem.linearize() tại ước lượng hiện tại, hiệp phương sai lan truyền mỗi mẫu.
+    Cùng giao thức update()/command() và đúng cùng ma trận nhiễu Qn, Rn với SteadyStateKalman
+    (Qn dựng từ Bd rời rạc hóa ZOH) nên đổi qua lại hai bộ lọc (handoff) không đổi cách chỉnh bộ lọc.
+    """
+    def reset(self, state=None):
+        super().reset(state)
+        self.P_k = None     # Hiệp phương sai hiện tại (khởi tạo từ P ổn định)
+
+    def _measured(self):
+        return self.x.copy()
+
+    def _set_measured(self, state):
+        self.x = np.array(state, dtype=float)
+        self.P_k = self.P.copy()
+
+    def _predict(self, xh, u):
+        # F = I + A dt + (A dt)^2 / 2 (xấp xỉ expm bậc 2 đủ chính xác ở 1 kHz)
+        A, _ = self.plant.linearize(xh[0], xh[1], u)
+        Adt = A * self.dt
+        F = np.eye(4) + Adt + 0.5 * (Adt @ Adt)
+        self.P_k = F @ self.P_k @ F.T + self._Qn
+        return self.plant.rk4_step(xh, u, self.dt)
+
+    def update(self, t, theta, x):
+        t0 = time.perf_counter()
+        if self._version != self.plant.p.version:
+            self._build()
+        u_hist = self._u
+        u0 = u_hist[0]
+
+        if self._t_prev is None:
+            xh = np.array([theta, 0.0, x, 0.0])
+            self.P_k = self.P.copy()
+        else:
+            xh = self.x
+            missed = int(round((t - self._t_prev) / self.dt)) - 1
+            for _ in range(min(max(missed, 0), 100)):
+                xh = self._predict(xh, u0)
+            xh = self._predict(xh, u0)
+            # Hiệu chỉnh: C chọn theta và x nên C P C' là khối [0, 2] x [0, 2]
+            P = self.P_k
+            PCt = P[:, ::2]
+            K = np.linalg.solve(PCt[::2] + self._Rn, PCt.T).T
+            xh = xh + K @ (np.array([theta, x]) - xh[::2])
+            self.P_k = P - K @ PCt.T
+        self._t_prev = t
+        self.x = xh
+
+        now = xh
+        for u in list(u_hist)[1:]:
+            now = self.plant.rk4_step(now, u, self.dt)
+        self.state = now
+        self.timer.record(time.perf_counter() - t0)
+        return self.state
+
+
+def make_estimator(plant, nonlinear=False, **kwargs):
+    """SteadyStateKalman (mặc định) hoặc ExtendedKalman (nonlinear=True)."""
+    return (ExtendedKalman if nonlinear else SteadyStateKalman)(plant, **kwargs)
+
+
+class FiniteDifference:
+    """Sai phân lùi như cách cũ trong on_hw_measurement (để so sánh)."""
+    def __init__(self):
+        self.prev = None
+
+    def update(self, t, theta, x):
+        prev = self.prev
+        if prev is None:
+            state = np.array([theta, 0.0, x, 0.0])
+        else:
+            h = max(t - prev[0], 1e-6)
+            state = np.array([theta, (theta - prev[1]) / h, x, (x - prev[2]) / h])
+        self.prev = (t, theta, x)
+        return state
+
+    def command(self, u):
+        pass
+
+
+def closed_loop(plant, estimator, controller, x0, duration=10.0, dt=1e-3, noise=1e-3, delay=0,
+                u_max=50.0, seed=0):
+    """
+    Mô phỏng vòng kín giống phần cứng: cảm biến 1 kHz có nhiễu và trễ `delay` mẫu, lực tính
+    ngay khi nhận mẫu và giữ tới mẫu kế tiếp. Trả về (mảng trạng thái thật, mảng ước lượng).
+    """
+    from plant import FastCartPole
+    kernel = FastCartPole(plant.p)
+    rng = np.random.default_rng(seed)
+    n = int(duration / dt)
+    true = np.empty((n, 4))
+    est = np.empty((n, 4))
+    state = np.array(x0, dtype=float)
+    pipe = deque()
+    u = 0.0
+    for k in range(n):
+        pipe.append((k * dt, state[0] + noise * rng.standard_normal(),
+                     state[2] + noise * rng.standard_normal()))
+        if len(pipe) > delay:
+            s = estimator.update(*pipe.popleft())
+            u = min(max(controller.get_action(s), -u_max), u_max)
+            estimator.command(u)
+            est[k] = s
+        else:
+            est[k] = np.nan
+        true[k] = state
+        state = kernel.step(state, u, dt)
+    return true, est
+
+
+def main(argv=None):
+    from conf import PhysParam
+    from controller import LQRController, DEFAULT_Q, DEFAULT_R
+    from plant import CartPoleSystem
+
+    ap = argparse.ArgumentParser(description="So sánh bộ ước lượng trạng thái trên mô phỏng vòng kín")
+    ap.add_argument("--noise", type=float, default=1e-3, help="Độ lệch chuẩn nhiễu đo (rad, m)")
+    ap.add_argument("--delay", type=int, default=2, help="Trễ đo (số mẫu 1 kHz)")
+    ap.add_argument("-t", "--duration", type=float, default=10.0)
+    ap.add_argument("--x0", type=float, nargs=4, default=[0.15, 0.0, 0.0, 0.0])
+    args = ap.parse_args(argv)
+
+    plant = CartPoleSystem(PhysParam())
+    ctrl = LQRController(plant)
+    ctrl.compute_gains(DEFAULT_Q, DEFAULT_R, verbose=False)
+    kw = dict(sigma_theta=args.noise, sigma_x=args.noise, delay=args.delay)
+    candidates = [("sai phân lùi", FiniteDifference()),
+                  ("Kalman ổn định", SteadyStateKalman(plant, **kw)),
+                  ("EKF", ExtendedKalman(plant, **kw))]
+
+    print(f"Nhiễu đo {args.noise:g} | trễ {args.delay} mẫu | {args.duration:g}s @ 1 kHz")
+    print(f"{'':16s}{'RMS dtheta':>12s}{'RMS dx':>10s}{'RMS theta':>11s}{'RMS x':>9s}{'us/mẫu':>9s}")
+    for name, est in candidates:
+        t0 = time.perf_counter()
+        true, e = closed_loop(plant, est, ctrl, args.x0, args.duration, noise=args.noise,
+                              delay=args.delay)
+        err = np.sqrt(np.nanmean((e - true)**2, axis=0))
+        ok = np.isfinite(true).all() and abs(true[-1, 0]) < 0.5
+        us = est.stats()['p50'] * 1e6 if hasattr(est, 'stats') else float('nan')
+        print(f"{name:16s}{err[1]:12.4f}{err[3]:10.4f}{np.sqrt(np.mean(true[:, 0]**2)):11.4f}"
+              f"{np.sqrt(np.mean(true[:, 2]**2)):9.4f}{us:9.1f}"
+              f"{'' if ok else '  (mất cân bằng)'}  [{time.perf_counter() - t0:.1f}s]")
+    return 0
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+# instrument.py - Đo thời gian từng giai đoạn của vòng lặp (controller, tích phân, vẽ, đồ thị, Tk)
+# Chi phí thấp: mỗi mẫu chỉ là một phép ghi vào bộ đệm vòng NumPy cấp phát trước.
+
+import csv
+import json
+import time
+
+import numpy as np
+
+
+class StageTimer:
+    """Cửa sổ trượt các khoảng thời gian (giây) của một giai đoạn, kèm bộ đếm trễ hạn."""
+    def __init__(self, window=1000, deadline=None):
+        self.samples = np.zeros(window)
+        self.window = window
+        self.deadline = deadline
+        self.count = 0
+        self.misses = 0
+        self.max_all = 0.0
+
+    def record(self, dt):
+        self.samples[self.count % self.window] = dt
+        self.count += 1
+        if dt > self.max_all:
+            self.max_all = dt
+        if self.deadline is not None and dt > self.deadline:
+            self.misses += 1
+
+    def reset(self):
+        self.count = 0
+        self.misses = 0
+        self.max_all = 0.0
+
+    def stats(self):
+        n = min(self.count, self.window)
+        if n == 0:
+            return {'count': 0, 'p50': 0.0, 'p99': 0.0, 'max': 0.0, 'max_all': 0.0, 'misses': 0}
+        s = self.samples[:n].copy()
+        p50, p99 = np.percentile(s, (50, 99))
+        return {
+            'count': self.count,
+            'p50': float(p50),
+            'p99': float(p99),
+            'max': float(s.max()),
+            'max_all': self.max_all,
+            'misses': self.misses,
+        }
+
+
+class _StageContext:
+    __slots__ = ('timer', 't0')
+
+    def __init__(self, timer):
+        self.timer = timer
+
+    def __enter__(self):
+        self.t0 = time.perf_counter()
+
+    def __exit__(self, *exc):
+        self.timer.record(time.perf_counter() - self.t0)
+
+
+class Profiler:
+    """
+    Tập hợp StageTimer theo tên giai đoạn.
+        with profiler.stage('draw'): ...          # hoặc
+        profiler.record('draw', t1 - t0)
+    Thống kê (p50/p99/max, số lần trễ hạn) đọc bằng summary(), xuất file bằng export()
+    hoặc gửi tới các hàm callback đã đăng ký bằng emit().
+    """
+    def __init__(self, window=1000):
+        self.window = window
+        self.timers = {}
+        self._contexts = {}
+        self._listeners = []
+
+    def add_stage(self, name, deadline=None):
+        self.timers[name] = StageTimer(self.window, deadline)
+        self._contexts[name] = _StageContext(self.timers[name])
+        return self.timers[name]
+
+    def timer(self, name):
+        t = self.timers.get(name)
+        return t if t is not None else self.add_stage(name)
+
+    def record(self, name, dt):
+        self.timer(name).record(dt)
+
+    def stage(self, name):
+        if name not in self._contexts:
+            self.add_stage(name)
+        return self._contexts[name]
+
+    def reset(self):
+        for t in self.timers.values():
+            t.reset()
+
+    def summary(self):
+        return {name: t.stats() for name, t in self.timers.items()}
+
+    def format_lines(self):
+        """Các dòng văn bản gọn cho HUD (đơn vị ms)."""
+        lines = []
+        for name, s in self.summary().items():
+            line = f"{name:<11s} p50 {s['p50'] * 1e3:6.2f} | p99 {s['p99'] * 1e3:6.2f} | max {s['max'] * 1e3:6.2f} ms"
+            if self.timers[name].deadline is not None:
+                line += f" | trễ: {s['misses']}"
+            lines.append(line)
+        return lines
+
+    def add_listener(self, callback):
+        """callback(summary_dict) được gọi mỗi lần emit()."""
+        self._listeners.append(callback)
+
+    def emit(self):
+        summary = self.summary()
+        for cb in self._listeners:
+            cb(summary)
+        return summary
+
+    def export(self, path):
+        """Xuất thống kê: .csv (một hàng mỗi giai đoạn) hoặc JSON (mặc định)."""
+        summary = self.summary()
+        if path.lower().endswith('.csv'):
+            with open(path, 'w', newline='') as f:
+                writer = csv.writer(f)
+                writer.writerow(['stage', 'count', 'p50_s', 'p99_s', 'max_s', 'max_all_s', 'misses', 'deadline_s'])
+                for name, s in summary.items():
+                    writer.writerow([name, s['count'], s['p50'], s['p99'], s['max'], s['max_all'], s['misses'],
+                                     self.timers[name].deadline])
+        else:
+            with open(path, 'w') as f:
+                json.dump({'time': time.time(), 'stages': summary}, f, indent=2)
+        return summary
@@ -0,0 +1,316 @@
+# integrators.py - Các bộ tích phân có thể lựa chọn thay cho RK4 bước cố định
+#   RK4               : bước cố định, 4 lần gọi dynamics mỗi bước (như CartPoleSystem.rk4_step)
+#   SemiImplicitEuler : Euler bán ẩn (symplectic), 1 lần gọi mỗi bước - rẻ nhất, bảo toàn năng lượng tốt
+#   DormandPrince     : RK5(4) thích nghi có ước lượng sai số, nội suy liên tục (dense output)
+# Tất cả hỗ trợ phát hiện sự kiện (đổ con lắc, chạm cuối ray) và đếm số lần gọi hàm (nfev).
+#
+# So sánh chi phí / sai số trên kịch bản đẩy ±15N:
+#   python integrators.py
+
+import math
+
+import numpy as np
+
+
+# ----------------------------------------------------------------------
+# Sự kiện
+# ----------------------------------------------------------------------
+class Event:
+    """
+    Sự kiện g(y) = 0 (phát hiện khi g đổi dấu trong một bước).
+    terminal:  dừng tích phân khi xảy ra
+    direction: 0 = mọi chiều, -1 = chỉ khi g giảm qua 0, +1 = chỉ khi g tăng qua 0
+    """
+    def __init__(self, name, func, terminal=True, direction=0):
+        self.name = name
+        self.func = func
+        self.terminal = terminal
+        self.direction = direction
+
+    def __call__(self, y):
+        return self.func(y)
+
+    def crossed(self, g0, g1):
+        if self.direction < 0:
+            return g0 > 0 >= g1
+        if self.direction > 0:
+            return g0 < 0 <= g1
+        return (g0 > 0 >= g1) or (g0 < 0 <= g1)
+
+
+def pole_fall(limit=math.pi / 2):
+    """Con lắc đổ: |theta| vượt limit."""
+    return Event('pole_fall', lambda y: limit - abs(y[0]), terminal=True, direction=-1)
+
+
+def track_end(x_limit):
+    """Xe chạm cuối ray: |x| vượt x_limit."""
+    return Event('track_end', lambda y: x_limit - abs(y[2]), terminal=True, direction=-1)
+
+
+class IntegrationResult:
+    def __init__(self, t, y, nfev, steps, rejected, events, terminated):
+        self.t = t                  # thời điểm cuối (hoặc thời điểm sự kiện dừng)
+        self.y = y                  # trạng thái tại t
+        self.nfev = nfev            # số lần gọi hàm vế phải trong lần tích phân này
+        self.steps = steps          # số bước được chấp nhận
+        self.rejected = rejected    # số bước bị từ chối (chỉ với bộ thích nghi)
+        self.events = events        # danh sách (tên, t, y)
+        self.terminated = terminated
+
+
+def _locate(event, interp, t0, t1, g0, tol=1e-10, max_iter=60):
+    """Tìm nghiệm g(interp(t)) = 0 trên [t0, t1] bằng chia đôi (không tốn thêm nfev)."""
+    a, b, ga = t0, t1, g0
+    for _ in range(max_iter):
+        m = 0.5 * (a + b)
+        gm = event(interp(m))
+        if (ga > 0) == (gm > 0) and gm != 0:
+            a, ga = m, gm
+        else:
+            b = m
+        if b - a < tol:
+            break
+    return b
+
+
+class _Integrator:
+    name = ''
+
+    def __init__(self):
+        self.nfev = 0   # tổng số lần gọi hàm từ khi tạo (cộng dồn qua mọi lần integrate)
+
+    def _check_events(self, events, g_prev, t0, y0, t1, y1, interp, found):
+        """Cập nhật found, trả về (t_dừng, y_dừng) nếu có sự kiện terminal, ngược lại None."""
+        stop = None
+        for i, ev in enumerate(events):
+            g1 = ev(y1)
+            if ev.crossed(g_prev[i], g1):
+                te = _locate(ev, interp, t0, t1, g_prev[i])
+                ye = interp(te)
+                found.append((ev.name, te, ye))
+                if ev.terminal and (stop is None or te < stop[0]):
+                    stop = (te, ye)
+            g_prev[i] = g1
+        return stop
+
+
+class RK4(_Integrator):
+    name = 'rk4'
+
+    def __init__(self, h=0.02):
+        super().__init__()
+        self.h = h
+
+    def _step(self, f, y, h):
+        k1 = f(y)
+        k2 = f(y + 0.5 * h * k1)
+        k3 = f(y + 0.5 * h * k2)
+        k4 = f(y + h * k3)
+        return y + (h / 6.0) * (k1 + 2 * k2 + 2 * k3 + k4)
+
+    def integrate(self, f, y0, T, events=()):
+        """Tích phân y' = f(y) từ 0 tới T (lực giữ không đổi - ZOH)."""
+        n = max(1, int(math.ceil(T / self.h - 1e-9)))
+        h = T / n
+        y = np.asarray(y0, dtype=float)
+        t = 0.0
+        g_prev = [ev(y) for ev in events]
+        found = []
+        for k in range(n):
+            y_new = self._step(f, y, h)
+            self.nfev += 4
+            if events:
+                ya, ta = y, t
+                interp = lambda s, ya=ya, yb=y_new, ta=ta: ya + (yb - ya) * ((s - ta) / h)
+                stop = self._check_events(events, g_prev, t, y, t + h, y_new, interp, found)
+                if stop is not None:
+                    # Chỉ tính các bước đã thực hiện (k + 1), không phải cả khoảng T
+                    return IntegrationResult(stop[0], stop[1], 4 * (k + 1), k + 1, 0, found, True)
+            y = y_new
+            t += h
+        return IntegrationResult(T, y, 4 * n, n, 0, found, False)
+
+
+class SemiImplicitEuler(_Integrator):
+    """
+    Euler bán ẩn (symplectic Euler) cho trạng thái [theta, theta_dot, x, x_dot]:
+    cập nhật vận tốc bằng gia tốc tại trạng thái hiện tại, sau đó cập nhật vị trí bằng vận tốc mới.
+    """
+    name = 'semi_implicit'
+
+    def __init__(self, h=0.002):
+        super().__init__()
+        self.h = h
+
+    def integrate(self, f, y0, T, events=()):
+        n = max(1, int(math.ceil(T / self.h - 1e-9)))
+        h = T / n
+        y = np.array(y0, dtype=float)
+        t = 0.0
+        g_prev = [ev(y) for ev in events]
+        found = []
+        for k in range(n):
+            d = f(y)
+            y_new = y.copy()
+            y_new[1] += h * d[1]
+            y_new[3] += h * d[3]
+            y_new[0] += h * y_new[1]
+            y_new[2] += h * y_new[3]
+            if events:
+                ya, ta = y, t
+                interp = lambda s, ya=ya, yb=y_new, ta=ta: ya + (yb - ya) * ((s - ta) / h)
+                stop = self._check_events(events, g_prev, t, y, t + h, y_new, interp, found)
+                if stop is not None:
+                    self.nfev += k + 1
+                    return IntegrationResult(stop[0], stop[1], k + 1, k + 1, 0, found, True)
+            y = y_new
+            t += h
+        self.nfev += n
+        return IntegrationResult(T, y, n, n, 0, found, False)
+
+
+class DormandPrince(_Integrator):
+    """
+    Dormand–Prince RK5(4) thích nghi (FSAL: 6 lần gọi mỗi bước được chấp nhận).
+    Bước tự co lại khi có nhiễu/va đập và giãn ra khi gần cân bằng.
+    Bước cuối (h_last) được giữ lại để lần integrate() kế tiếp khởi động nhanh.
+    """
+    name = 'dopri5'
+
+    C = np.array([0, 1 / 5, 3 / 10, 4 / 5, 8 / 9, 1])
+    A = [
+        [],
+        [1 / 5],
+        [3 / 40, 9 / 40],
+        [44 / 45, -56 / 15, 32 / 9],
+        [19372 / 6561, -25360 / 2187, 64448 / 6561, -212 / 729],
+        [9017 / 3168, -355 / 33, 46732 / 5247, 49 / 176, -5103 / 18656],
+    ]
+    B = np.array([35 / 384, 0, 500 / 1113, 125 / 192, -2187 / 6784, 11 / 84, 0])
+    E = np.array([-71 / 57600, 0, 71 / 16695, -71 / 1920, 17253 / 339200, -22 / 525, 1 / 40])
+    # Hệ số nội suy liên tục bậc 4 (y(t0 + s*h) = y0 + h * K^T P [s, s^2, s^3, s^4])
+    P = np.array([
+        [1, -8048581381 / 2820520608, 8663915743 / 2820520608, -12715105075 / 11282082432],
+        [0, 0, 0, 0],
+        [0, 131558114200 / 32700410799, -68118460800 / 10900136933, 87487479700 / 32700410799],
+        [0, -1754552775 / 470086768, 14199869525 / 1410260304, -10690763975 / 1880347072],
+        [0, 127303824393 / 49829197408, -318862633887 / 49829197408, 701980252875 / 199316789632],
+        [0, -282668133 / 205662961, 2019193451 / 616988883, -1453857185 / 822651844],
+        [0, 40617522 / 29380423, -110615467 / 29380423, 69997945 / 29380423],
+    ])
+
+    def __init__(self, rtol=1e-6, atol=1e-9, h_init=0.005, h_max=0.1, h_min=1e-8):
+        super().__init__()
+        self.rtol = rtol
+        self.atol = atol
+        self.h_init = h_init
+        self.h_max = h_max
+        self.h_min = h_min
+        self.h_last = None
+
+    def dense(self, t0, y0, h, K):
+        """Hàm nội suy y(t) trong bước [t0, t0 + h]."""
+        Q = K.T @ self.P
+
+        def interp(t):
+            s = (t - t0) / h
+            return y0 + h * (Q @ np.array([s, s * s, s ** 3, s ** 4]))
+        return interp
+
+    def integrate(self, f, y0, T, events=()):
+        y = np.array(y0, dtype=float)
+        t = 0.0
+        h_prop = min(self.h_last or self.h_init, self.h_max)   # bước đề xuất kế tiếp
+        K = np.empty((7, y.size))
+        K[0] = f(y)
+        nfev = 1
+        steps = rejected = 0
+        g_prev = [ev(y) for ev in events]
+        found = []
+
+        while t < T:
+            # Bước cuối bị cắt cho vừa T thì không làm nhỏ bước đề xuất
+            h = min(h_prop, T - t)
+            truncated = h < h_prop
+            for i in range(1, 6):
+                K[i] = f(y + h * np.dot(self.A[i], K[:i]))
+            y_new = y + h * np.dot(self.B[:6], K[:6])
+            K[6] = f(y_new)
+            nfev += 6
+
+            scale = self.atol + self.rtol * np.maximum(np.abs(y), np.abs(y_new))
+            err = math.sqrt(np.mean((h * np.dot(self.E, K) / scale) ** 2))
+
+            if err <= 1.0 or h <= self.h_min:
+                steps += 1
+                if events:
+                    interp = self.dense(t, y, h, K.copy())
+                    stop = self._check_events(events, g_prev, t, y, t + h, y_new, interp, found)
+                    if stop is not None:
+                        self.nfev += nfev
+                        self.h_last = h_prop
+                        return IntegrationResult(stop[0], stop[1], nfev, steps, rejected, found, True)
+                t += h
+                y = y_new
+                K[0] = K[6]     # FSAL: đạo hàm cuối bước là đạo hàm đầu bước sau
+                h_new = h * (10.0 if err == 0 else min(10.0, 0.9 * err ** -0.2))
+                h_prop = max(h_prop, h_new) if truncated else h_new
+            else:
+                rejected += 1
+                h_prop = h * max(0.2, 0.9 * err ** -0.2)
+            h_prop = min(max(h_prop, self.h_min), self.h_max)
+
+        self.nfev += nfev
+        self.h_last = h_prop
+        return IntegrationResult(t, y, nfev, steps, rejected, found, False)
+
+
+INTEGRATORS = {
+    'rk4': RK4,
+    'semi_implicit': SemiImplicitEuler,
+    'dopri5': DormandPrince,
+}
+
+
+def make_integrator(name, **kwargs):
+    try:
+        return INTEGRATORS[name](**kwargs)
+    except KeyError:
+        raise ValueError(f"Bộ tích phân không hỗ trợ: {name} (có: {', '.join(INTEGRATORS)})")
+
+
+def main():
+    from conf import PhysParam
+    from plant import CartPoleSystem
+    from controller import LQRController, DEFAULT_Q, DEFAULT_R
+    from engine import SimEngine
+
+    p = PhysParam()
+    plant = CartPoleSystem(p)
+    ctrl = LQRController(plant)
+    ctrl.compute_gains(DEFAULT_Q, DEFAULT_R, verbose=False)
+
+    def push(t):
+        # Đẩy phải 15N trong 0.3s, rồi đẩy trái 15N
+        return 15.0 if 1.0 <= t < 1.3 else (-15.0 if 3.0 <= t < 3.3 else 0.0)
+
+    engine = SimEngine(p, ctrl)
+    ref = engine.run([0.1, 0, 0, 0], 6.0, external_force=push,
+                     integrator=DormandPrince(rtol=1e-12, atol=1e-14))
+
+    candidates = [
+        RK4(h=0.02), RK4(h=0.005),
+        SemiImplicitEuler(h=0.002), SemiImplicitEuler(h=0.0005),
+        DormandPrince(rtol=1e-3, atol=1e-6), DormandPrince(rtol=1e-6, atol=1e-9),
+    ]
+    print(f"{'integrator':<16s}{'params':<24s}{'nfev':>8s}{'max |err|':>14s}")
+    for integ in candidates:
+        traj = engine.run([0.1, 0, 0, 0], 6.0, external_force=push, integrator=integ)
+        err = np.abs(traj.states - ref.states).max()
+        params = f"h={integ.h}" if hasattr(integ, 'h') else f"rtol={integ.rtol:g}"
+        print(f"{integ.name:<16s}{params:<24s}{integ.nfev:>8d}{err:>14.3e}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,182 @@
+# live_plot.py - Đồ thị thời gian thực: bộ đệm vòng NumPy + blitting + giảm mẫu min/max
+
+import numpy as np
+
+
+class RingBuffer:
+    """
+    Bộ đệm vòng cấp phát trước, mỗi mẫu gồm n_channels giá trị (vd. [t, theta, dtheta, x, dx]).
+    Ghi O(1), không cấp phát mới khi chạy.
+    """
+    def __init__(self, capacity, n_channels):
+        self.capacity = int(capacity)
+        self.data = np.empty((self.capacity, n_channels))
+        self.head = 0   # vị trí ghi kế tiếp
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def append(self, row):
+        self.data[self.head] = row
+        self.head = (self.head + 1) % self.capacity
+        if self.size < self.capacity:
+            self.size += 1
+
+    def clear(self):
+        self.head = 0
+        self.size = 0
+
+    def last(self):
+        return self.data[(self.head - 1) % self.capacity]
+
+    def view(self):
+        """Trả về các mẫu theo thứ tự thời gian (không sao chép khi bộ đệm chưa quay vòng)."""
+        if self.size < self.capacity:
+            return self.data[:self.size]
+        return np.concatenate((self.data[self.head:], self.data[:self.head]))
+
+
+def minmax_decimate(t, y, max_points):
+    """
+    Giảm mẫu giữ hình dạng: chia thành các nhóm, mỗi nhóm giữ điểm min và max (theo đúng thứ tự thời gian).
+    Đỉnh nhọn ngắn vẫn hiện trên đồ thị dù chỉ vẽ khoảng max_points điểm.
+    """
+    n = len(t)
+    if n <= max_points:
+        return t, y
+    bins = max_points // 2
+    size = n // bins
+    m = bins * size
+    yb = y[:m].reshape(bins, size)
+    rows = np.arange(bins)
+    i_min = np.argmin(yb, axis=1)
+    i_max = np.argmax(yb, axis=1)
+    first = np.minimum(i_min, i_max)
+    second = np.maximum(i_min, i_max)
+
+    idx = np.empty(2 * bins, dtype=np.intp)
+    idx[0::2] = rows * size + first
+    idx[1::2] = rows * size + second
+    # Phần dư cuối giữ nguyên để điểm mới nhất luôn được vẽ
+    idx = np.concatenate((idx, np.arange(m, n)))
+    return t[idx], y[idx]
+
+
+class LivePlot:
+    """
+    Quản lý các đường đồ thị trên FigureCanvasTkAgg bằng blitting:
+    - Nền (trục, lưới, nhãn) được vẽ đầy đủ một lần và lưu lại (copy_from_bbox).
+    - Mỗi khung hình chỉ khôi phục nền và vẽ lại các đường (draw_artist + blit).
+    - Giới hạn trục chỉ thay đổi khi dữ liệu vượt ra ngoài hoặc co lại đáng kể (trễ - hysteresis),
+      lúc đó mới vẽ lại toàn bộ hình.
+    """
+    def __init__(self, canvas_agg, lines, history_len=3000, window=None, max_points=800,
+                 margin=0.15, shrink_ratio=0.25, page=0.25):
+        """
+        canvas_agg: FigureCanvasTkAgg
+        lines:      danh sách Line2D, mỗi đường ứng với một kênh dữ liệu
+        history_len: số mẫu lưu trong bộ đệm vòng
+        window:     độ rộng cửa sổ thời gian hiển thị (giây), None = toàn bộ lịch sử
+        max_points: số điểm tối đa vẽ cho mỗi đường (sau giảm mẫu)
+        margin:     khoảng đệm thêm khi mở rộng trục Y (tỷ lệ theo biên độ)
+        shrink_ratio: chỉ thu hẹp trục Y khi dữ liệu chiếm ít hơn tỷ lệ này
+        page:       khi thời gian vượt trục X, dịch trục thêm một đoạn page * window
+        """
+        self.canvas = canvas_agg
+        self.fig = canvas_agg.figure
+        self.lines = list(lines)
+        self.axes = [ln.axes for ln in self.lines]
+        self.buffer = RingBuffer(history_len, 1 + len(self.lines))
+        self.window = window
+        self.max_points = max_points
+        self.margin = margin
+        self.shrink_ratio = shrink_ratio
+        self.page = page
+
+        self.background = None
+        self.full_redraws = 0
+        self.blits = 0
+
+        for ln in self.lines:
+            ln.set_animated(True)
+        self._cid = self.canvas.mpl_connect('draw_event', self._on_draw)
+
+    def _on_draw(self, event):
+        # Sau mỗi lần vẽ đầy đủ (khởi tạo, đổi kích thước cửa sổ, đổi trục) lưu lại nền
+        self.background = self.canvas.copy_from_bbox(self.fig.bbox)
+        self._draw_lines()
+
+    def _draw_lines(self):
+        for ax, ln in zip(self.axes, self.lines):
+            ax.draw_artist(ln)
+
+    def set_history_len(self, history_len):
+        """Đổi độ dài lịch sử, giữ lại các mẫu mới nhất."""
+        old = self.buffer.view()[-int(history_len):]
+        self.buffer = RingBuffer(history_len, self.buffer.data.shape[1])
+        for row in old:
+            self.buffer.append(row)
+
+    def push(self, t, values):
+        """Thêm một mẫu: thời điểm t và giá trị của từng đường."""
+        self.buffer.append((t, *values))
+
+    def clear(self):
+        self.buffer.clear()
+        for ln in self.lines:
+            ln.set_data([], [])
+        self.canvas.draw()
+
+    def _update_xlim(self, t_first, t_last):
+        lo, hi = self.axes[0].get_xlim()
+        span = self.window or max(t_last - t_first, 1e-3)
+        # Chỉ dịch trục X khi dữ liệu ra khỏi khung hoặc khoảng trống bên trái quá lớn
+        if t_last > hi or t_first < lo or (t_first - lo) > self.page * (hi - lo):
+            new_lo = max(t_last - span, t_first)
+            new_hi = new_lo + span * (1 + self.page)
+            for ax in self.axes:
+                ax.set_xlim(new_lo, new_hi)
+            return True
+        return False
+
+    def _update_ylim(self, ax, y):
+        lo, hi = ax.get_ylim()
+        y_min = float(y.min())
+        y_max = float(y.max())
+        span = max(y_max - y_min, 1e-6)
+        grow = y_min < lo or y_max > hi
+        shrink = span < self.shrink_ratio * (hi - lo)
+        if grow or shrink:
+            pad = self.margin * span
+            ax.set_ylim(y_min - pad, y_max + pad)
+            return True
+        return False
+
+    def refresh(self):
+        """Cập nhật dữ liệu cho các đường và vẽ lại (blit nếu trục không đổi)."""
+        if self.buffer.size == 0:
+            return
+        data = self.buffer.view()
+        t = data[:, 0]
+        if self.window:
+            start = np.searchsorted(t, t[-1] - self.window)
+            data = data[start:]
+            t = data[:, 0]
+
+        rescale = self._update_xlim(t[0], t[-1])
+        for k, (ax, ln) in enumerate(zip(self.axes, self.lines)):
+            y = data[:, k + 1]
+            td, yd = minmax_decimate(t, y, self.max_points)
+            ln.set_data(td, yd)
+            rescale |= self._update_ylim(ax, y)
+
+        if rescale or self.background is None:
+            # Vẽ đầy đủ; _on_draw sẽ lưu lại nền và vẽ các đường
+            self.full_redraws += 1
+            self.canvas.draw()
+        else:
+            self.blits += 1
+            self.canvas.restore_region(self.background)
+            self._draw_lines()
+        self.canvas.blit(self.fig.bbox)
@@ -1,14 +1,23 @@
 import tkinter as tk
-from tkinter import ttk, messagebox
+from tkinter import ttk, messagebox, filedialog
 import matplotlib.pyplot as plt
 from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
-import collections
+import os
+import time
 import numpy as np
 
 from conf import PhysParam, SimParam
 from plant import CartPoleSystem
-from controller import LQRController
+from controller import LQRController, DEFAULT_Q, DEFAULT_R
+from mpc import MPCController
+from swingup import SwingUpController, BALANCE
 from visualizer import CartPoleVisualizer
+from live_plot import LivePlot
+from scheduler import MultiRateScheduler
+from telemetry import TelemetryLink
+from estimator import make_estimator
+from recorder import RunRecorder, RunLog, ReplayPlayer
+from instrument import Profiler
 
 class MainApp:
     def __init__(self, root):
@@ -20,9 +29,11 @@ class MainApp:
         self.root.geometry(f"{SimParam.WIN_WIDTH + self.side_panel_width}x{SimParam.WIN_HEIGHT + 30}")
 
         # --- KHỞI TẠO HỆ THỐNG ---
-        self.phys_param = PhysParam()
+        self.phys_param = PhysParam(verbose=True)
         self.plant = CartPoleSystem(self.phys_param)
-        self.controller = LQRController(self.plant)
+        self.lqr = LQRController(self.plant)
+        self.mpc = None     # MPCController (tạo khi bật lần đầu)
+        self.controller = self.lqr
         
         # Tính LQR lần đầu
         self.recalc_lqr()
@@ -33,25 +44,53 @@ class MainApp:
         self.time = 0.0
         self.manual_force = 0.0 
 
-        # Cấu hình đồ thị mượt (300 điểm)
-        self.history_len = 300 
-        self.t_data = collections.deque(maxlen=self.history_len)
-        self.theta_data = collections.deque(maxlen=self.history_len)
-        self.dtheta_data = collections.deque(maxlen=self.history_len)
-        self.x_data = collections.deque(maxlen=self.history_len)
-        self.dx_data = collections.deque(maxlen=self.history_len)
+        # Bộ lập lịch đa tốc độ: vật lý 1kHz (luồng nền), điều khiển 50Hz (ZOH), GUI ~60 FPS
+        self.physics_hz = 1000.0
+        self.display_interval_ms = 16
+        self.scheduler = MultiRateScheduler(self.plant, self.controller, physics_hz=self.physics_hz)
+        self.scheduler.reset(self.state)
+
+        # Đo thời gian từng giai đoạn; trễ hạn tính theo chu kỳ lấy mẫu PhysParam.dt
+        dt = self.phys_param.dt
+        self.profiler = Profiler(window=1000)
+        for name, deadline in (("controller", None), ("integration", None), ("draw", None),
+                               ("plot", None), ("tk_latency", dt), ("frame", dt)):
+            self.profiler.add_stage(name, deadline)
+        self.scheduler.profiler = self.profiler
+        self._last_tick = None
+        self._hud_frames = 0
+        self._prof_text = ""
+
+        # Đường truyền UART thật (None khi chưa kết nối)
+        self.link = None
+        self.estimator = None       # Ước lượng trạng thái đầy đủ từ phép đo [theta, x]
+        self.hw_delay = 0           # Trễ đo của thiết bị (số mẫu 1 kHz), nhập ở ô "Trễ" cạnh Baud
+        self._hw_snapshot = None
+
+        # Ghi log (memmap) và phát lại
+        self.log_dir = "logs"
+        self.recorder = None
+        self.player = None
+        self._scale_busy = False
+
+        # Cấu hình đồ thị: lưu một mẫu mỗi khung hình GUI vào bộ đệm vòng, vẽ tối đa 30 FPS
+        self.history_len = 3000     # Số mẫu lưu (mỗi khung hình một mẫu, ~50s ở 60 FPS)
+        self.plot_window = 20.0     # Cửa sổ thời gian hiển thị (giây)
+        self.plot_interval = 0.033  # Chu kỳ vẽ lại đồ thị (giây)
+        self.last_plot_time = None
 
         self.setup_ui()
 
     def recalc_lqr(self):
-        # Tính lại bộ điều khiển
-        Q = [100.0, 1.0, 10.0, 1.0]
-        R = 0.1
-        self.controller.compute_gains(Q, R)
+        # Tính lại bộ điều khiển (MPC dựng lại ma trận dự báo theo thông số mới)
+        self.lqr.compute_gains(DEFAULT_Q, DEFAULT_R)
+        if self.mpc is not None:
+            self.mpc.compute_gains(DEFAULT_Q, DEFAULT_R)
 
     def apply_force(self, force):
-        # Hàm nhận lực từ nút bấm
+        # Hàm nhận lực từ nút bấm (luồng vật lý đọc ở chu kỳ điều khiển kế tiếp)
         self.manual_force = force
+        self.scheduler.manual_force = force
 
     def setup_ui(self):
         main_pane = ttk.PanedWindow(self.root, orient=tk.HORIZONTAL)
@@ -63,11 +102,8 @@ class MainApp:
         
         self.canvas = tk.Canvas(left_frame, bg=SimParam.COLOR_BG, width=SimParam.WIN_WIDTH, height=SimParam.WIN_HEIGHT)
         self.canvas.pack(fill=tk.BOTH, expand=True)
-        self.viz = CartPoleVisualizer(self.canvas)
-        
-        # Ép visualizer dùng chung bộ tham số với MainApp ngay từ đầu
-        if hasattr(self.viz, 'phys'):
-            self.viz.phys = self.phys_param
+        # Visualizer dùng chung bộ tham số với MainApp ngay từ đầu
+        self.viz = CartPoleVisualizer(self.canvas, self.phys_param)
 
         self.hud_label = tk.Label(left_frame, text="SẴN SÀNG", bg="black", fg="#00ff00", font=("Consolas", 11), justify=tk.LEFT)
         self.hud_label.place(x=10, y=10)
@@ -101,7 +137,46 @@ class MainApp:
         self.entry_mock.pack(side=tk.LEFT, padx=5)
         ttk.Button(f2, text="NẠP DỮ LIỆU", command=self.mock_uart_send).pack(side=tk.LEFT)
 
-        # 2. Simulation Control
+        # Cổng nối tiếp thật: nhận khung [Góc, Xe] nhị phân, gửi lực điều khiển ngược lại
+        f3 = ttk.Frame(uart_grp); f3.pack(fill=tk.X, pady=2)
+        ttk.Label(f3, text="Cổng:").pack(side=tk.LEFT)
+        self.entry_port = ttk.Entry(f3, width=14)
+        self.entry_port.insert(0, "/dev/ttyUSB0")
+        self.entry_port.pack(side=tk.LEFT, padx=5)
+        ttk.Label(f3, text="Baud:").pack(side=tk.LEFT)
+        self.entry_baud = ttk.Entry(f3, width=8)
+        self.entry_baud.insert(0, "460800")
+        self.entry_baud.pack(side=tk.LEFT, padx=5)
+        ttk.Label(f3, text="Trễ [mẫu]:").pack(side=tk.LEFT)
+        self.entry_delay = ttk.Entry(f3, width=4)
+        self.entry_delay.insert(0, str(self.hw_delay))
+        self.entry_delay.pack(side=tk.LEFT, padx=5)
+        self.btn_connect = ttk.Button(f3, text="KẾT NỐI", command=self.toggle_serial)
+        self.btn_connect.pack(side=tk.LEFT)
+
+        # 2. Ghi & Phát lại
+        rec_grp = ttk.LabelFrame(parent, text="Ghi & Phát lại", padding=5)
+        rec_grp.pack(fill=tk.X, padx=5, pady=5)
+
+        f4 = ttk.Frame(rec_grp); f4.pack(fill=tk.X, pady=2)
+        self.record_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(f4, text="Ghi log khi chạy", variable=self.record_var).pack(side=tk.LEFT)
+        ttk.Button(f4, text="MỞ LOG", command=self.open_replay).pack(side=tk.LEFT, padx=5)
+        ttk.Button(f4, text="PHÁT / TẠM DỪNG", command=self.toggle_replay).pack(side=tk.LEFT)
+        ttk.Button(f4, text="THOÁT", command=self.close_replay).pack(side=tk.LEFT, padx=5)
+        ttk.Label(f4, text="Tốc độ:").pack(side=tk.LEFT)
+        self.speed_var = tk.StringVar(value="1")
+        speed_box = ttk.Combobox(f4, textvariable=self.speed_var, width=5,
+                                 values=["0.25", "0.5", "1", "2", "5", "10", "50", "100"])
+        speed_box.pack(side=tk.LEFT, padx=5)
+        speed_box.bind("<<ComboboxSelected>>", lambda e: self.set_replay_speed())
+        speed_box.bind("<Return>", lambda e: self.set_replay_speed())
+
+        self.seek_var = tk.DoubleVar(value=0.0)
+        self.seek_scale = ttk.Scale(rec_grp, from_=0.0, to=1.0, variable=self.seek_var, command=self.on_seek)
+        self.seek_scale.pack(fill=tk.X, pady=2)
+
+        # 3. Simulation Control
         sim_grp = ttk.LabelFrame(parent, text="Điều khiển Mô phỏng", padding=5)
         sim_grp.pack(fill=tk.X, padx=5, pady=5)
         
@@ -110,8 +185,9 @@ class MainApp:
         ttk.Button(btn_frame, text="CHẠY", command=self.start_sim).pack(side=tk.LEFT, fill=tk.X, expand=True)
         ttk.Button(btn_frame, text="DỪNG", command=self.stop_sim).pack(side=tk.LEFT, fill=tk.X, expand=True)
         ttk.Button(btn_frame, text="RESET", command=self.reset_sim).pack(side=tk.LEFT, fill=tk.X, expand=True)
+        ttk.Button(sim_grp, text="XUẤT THỐNG KÊ HIỆU NĂNG", command=self.export_profile).pack(fill=tk.X, pady=(5, 0))
 
-        # [FIX 1] 3. Tác động ngoại lực (ĐÃ THÊM LẠI)
+        # [FIX 1] 4. Tác động ngoại lực (ĐÃ THÊM LẠI)
         force_grp = ttk.LabelFrame(parent, text="Tác động Ngoại lực", padding=5)
         force_grp.pack(fill=tk.X, padx=5, pady=5)
 
@@ -127,7 +203,7 @@ class MainApp:
         btn_right.bind('<ButtonPress-1>', lambda e: self.apply_force(15))
         btn_right.bind('<ButtonRelease-1>', lambda e: self.apply_force(0))
 
-        # 4. Đồ thị
+        # 5. Đồ thị
         graph_grp = ttk.LabelFrame(parent, text="Thông số thời gian thực", padding=5)
         graph_grp.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
 
@@ -141,6 +217,9 @@ class MainApp:
         self.lines['dx'], = self.ax4.plot([], [], 'c', lw=1.5); self.ax4.set_title("Vận tốc Xe", fontsize=9, fontweight='bold'); self.ax4.grid(True)
 
         self.canvas_agg = FigureCanvasTkAgg(self.fig, master=graph_grp)
+        self.live_plot = LivePlot(self.canvas_agg,
+                                  [self.lines['theta'], self.lines['dtheta'], self.lines['x'], self.lines['dx']],
+                                  history_len=self.history_len, window=self.plot_window)
         self.canvas_agg.draw()
         self.canvas_agg.get_tk_widget().pack(fill=tk.BOTH, expand=True)
 
@@ -169,12 +248,70 @@ class MainApp:
             ent.grid(row=i, column=1, sticky=tk.E, pady=8, padx=10)
             self.entries[param_name] = ent
 
+        # LQR rời rạc khớp chu kỳ lấy mẫu dt (bộ điều khiển thực chạy ở 50Hz)
+        self.discrete_var = tk.BooleanVar(value=self.lqr.discrete)
+        ttk.Checkbutton(parent, text=f"LQR rời rạc (ZOH, dt = {self.phys_param.dt}s)", variable=self.discrete_var,
+                        command=self.toggle_discrete).pack(pady=5)
+
+        # MPC có giới hạn lực và đường ray (thay cho LQR khi bật)
+        self.mpc_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(parent, text="MPC (giới hạn lực ±20N, đường ray ±0.5m, 30 bước)", variable=self.mpc_var,
+                        command=self.select_controller).pack(pady=5)
+
+        # Swing-up: bắt đầu từ vị trí treo xuống (như trên mô hình thật), bơm năng lượng rồi bắt bằng LQR/MPC
+        self.swingup_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(parent, text="Swing-up (bắt đầu treo xuống)", variable=self.swingup_var,
+                        command=self.toggle_swingup).pack(pady=5)
+
+        # Độ dài lịch sử đồ thị (số mẫu)
+        hist_frame = ttk.Frame(parent)
+        hist_frame.pack(padx=20, pady=5, fill=tk.X)
+        ttk.Label(hist_frame, text="Lịch sử đồ thị [mẫu]", font=("Arial", 10)).grid(row=0, column=0, sticky=tk.W)
+        self.entry_history = ttk.Entry(hist_frame, font=("Arial", 10))
+        self.entry_history.insert(0, str(self.history_len))
+        self.entry_history.grid(row=0, column=1, sticky=tk.E, padx=10)
+
         btn_update = ttk.Button(parent, text="CẬP NHẬT NGAY LẬP TỨC", command=self.update_params)
         btn_update.pack(pady=20, fill=tk.X, padx=40)
         
         lbl_info = ttk.Label(parent, text="Lưu ý: Hình dạng con lắc và Bộ điều khiển sẽ thay đổi theo.", foreground="gray")
         lbl_info.pack()
 
+    def toggle_discrete(self):
+        self.lqr.discrete = self.discrete_var.get()
+        self.recalc_lqr()
+
+    def select_controller(self):
+        # Bộ cân bằng: LQR hoặc MPC; swing-up bọc ngoài bộ cân bằng khi được bật
+        if self.mpc_var.get():
+            if self.mpc is None:
+                self.mpc = MPCController(self.plant)
+                self.mpc.compute_gains(DEFAULT_Q, DEFAULT_R)
+            balance = self.mpc
+        else:
+            balance = self.lqr
+        if self.swingup_var.get():
+            self.controller = SwingUpController(self.plant, balance=balance)
+        else:
+            self.controller = balance
+        self.scheduler.controller = self.controller
+        if self.link is not None:
+            # Đang nối phần cứng: chọn lại bộ lọc theo bộ điều khiển mới, tiếp nối ước lượng hiện tại
+            estimator = self.make_hw_estimator()
+            if type(estimator) is not type(self.estimator):
+                estimator.handoff(self.estimator)
+                self.estimator = estimator
+
+    def toggle_swingup(self):
+        self.select_controller()
+        self.reset_sim()
+
+    def initial_state(self):
+        # Swing-up: con lắc treo xuống (theta = pi); ngược lại gần thẳng đứng như trước
+        if self.swingup_var.get():
+            return np.array([np.pi, 0.0, 0.0, 0.0])
+        return np.array([0.1, 0.0, 0.0, 0.0])
+
     def update_params(self):
         try:
             # 1. Lấy dữ liệu từ GUI
@@ -186,12 +323,13 @@ class MainApp:
             
             # 2. Tính lại thông số dẫn xuất
             p = self.phys_param
-            p.m_total = p.m_pole + p.m_ball
-            p.l_cm = (p.m_pole * (p.L / 2) + p.m_ball * p.L) / p.m_total
-            J_pole = (1/3) * p.m_pole * (p.L**2)
-            J_ball = p.m_ball * (p.L**2)
-            p.J = J_pole + J_ball
+            p.update_derived()
             
+            history_len = int(self.entry_history.get())
+            if history_len != self.history_len:
+                self.history_len = history_len
+                self.live_plot.set_history_len(history_len)
+
             # 3. Tính lại LQR
             self.recalc_lqr()
             
@@ -209,68 +347,264 @@ class MainApp:
         except ValueError:
             messagebox.showerror("Lỗi nhập liệu", "Vui lòng chỉ nhập số thực.")
 
+    def toggle_serial(self):
+        if self.link is not None:
+            self.disconnect_serial()
+            return
+        try:
+            self.stop_sim()
+            self.hw_delay = int(self.entry_delay.get())
+            if self.hw_delay < 0:
+                raise ValueError("trễ đo phải >= 0")
+            self.estimator = self.make_hw_estimator()
+            self._hw_snapshot = None
+            # Ghi log phiên phần cứng (luồng I/O ghi trong on_hw_measurement)
+            if self.record_var.get() and self.recorder is None:
+                self.open_recorder()
+            self.link = TelemetryLink(self.entry_port.get().strip(), int(self.entry_baud.get()),
+                                      on_measurement=self.on_hw_measurement)
+            self.link.start()
+        except (OSError, ValueError, RuntimeError) as e:
+            self.link = None
+            self.close_recorder()
+            messagebox.showerror("Lỗi UART", f"Không mở được cổng: {e}")
+            return
+        self.btn_connect.config(text="NGẮT KẾT NỐI")
+        self.running = True
+        self.loop()
+
+    def make_hw_estimator(self):
+        # Swing-up đi xa điểm cân bằng -> cần EKF; còn lại Kalman ổn định là đủ
+        return make_estimator(self.plant, isinstance(self.controller, SwingUpController),
+                              delay=self.hw_delay)
+
+    def disconnect_serial(self):
+        if self.link is not None:
+            # Dừng luồng I/O trước rồi mới đóng log để không còn lượt ghi nào
+            self.link.stop()
+            self.link = None
+            self.close_recorder()
+        self.running = False
+        self.btn_connect.config(text="KẾT NỐI")
+
+    def on_hw_measurement(self, t, theta, x):
+        # Chạy trong luồng I/O: bộ lọc Kalman ước lượng vận tốc (và bù trễ đo), tính và gửi lực ngay
+        state = self.estimator.update(t, theta, x)
+        manual = self.manual_force
+        u = self.controller.get_action(state) + manual
+        self.link.send_control(u)
+        self.estimator.command(u)
+        recorder = self.recorder
+        if recorder is not None:
+            recorder.append(t, state, u, manual)
+        self._hw_snapshot = (t, state)
+
+    # ------------------------------------------------------------------
+    # Ghi log / Phát lại
+    # ------------------------------------------------------------------
+    def open_recorder(self):
+        os.makedirs(self.log_dir, exist_ok=True)
+        path = os.path.join(self.log_dir, time.strftime("run_%Y%m%d_%H%M%S.cplog"))
+        self.recorder = RunRecorder(path, self.phys_param, self.controller.K)
+        self.scheduler.recorder = self.recorder
+
+    def close_recorder(self):
+        if self.recorder is not None:
+            self.scheduler.recorder = None
+            self.recorder.close()
+            self.recorder = None
+
+    def open_replay(self):
+        path = filedialog.askopenfilename(initialdir=self.log_dir, filetypes=[("Cart-pole log", "*.cplog")])
+        if not path:
+            return
+        try:
+            log = RunLog(path)
+        except (OSError, ValueError) as e:
+            messagebox.showerror("Lỗi log", str(e))
+            return
+        if len(log) == 0:
+            messagebox.showerror("Lỗi log", "File log không có dữ liệu.")
+            return
+
+        self.stop_sim()
+        self.player = ReplayPlayer(log, self.get_replay_speed())
+        # Vẽ theo thông số đã ghi trong log
+        self.viz.phys = log.phys_param()
+        self.seek_scale.config(from_=self.player.t_start, to=self.player.t_end)
+        self.last_plot_time = None
+        self.live_plot.clear()
+        self.player.play()
+        self.running = True
+        self.loop()
+
+    def toggle_replay(self):
+        if self.player is None:
+            return
+        if self.player.playing:
+            self.player.pause()
+        else:
+            self.player.play()
+
+    def close_replay(self):
+        if self.player is None:
+            return
+        self.player = None
+        self.running = False
+        self.viz.phys = self.phys_param
+        self.time, self.state, _ = self.scheduler.snapshot()
+        self.viz.draw(self.state)
+        self.update_hud()
+
+    def get_replay_speed(self):
+        try:
+            return max(float(self.speed_var.get()), 1e-3)
+        except ValueError:
+            return 1.0
+
+    def set_replay_speed(self):
+        if self.player is not None:
+            self.player.set_speed(self.get_replay_speed())
+
+    def on_seek(self, value):
+        if self.player is None or self._scale_busy:
+            return
+        self.player.seek(float(value))
+        self.last_plot_time = None
+        self.live_plot.clear()
+        if not self.running:
+            self.time, self.state, _ = self.player.current()
+            self.update_gui_components()
+
+    def export_profile(self):
+        path = filedialog.asksaveasfilename(defaultextension=".json",
+                                            filetypes=[("JSON", "*.json"), ("CSV", "*.csv")])
+        if path:
+            self.profiler.export(path)
+
+    def on_close(self):
+        self.stop_sim()
+        self.disconnect_serial()
+        self.close_recorder()
+        self.root.destroy()
+
     def start_sim(self):
+        if self.link is not None or self.player is not None:
+            return
         if not self.running:
             self.running = True
+            self._last_tick = None
+            if self.record_var.get() and self.recorder is None:
+                self.open_recorder()
+            self.scheduler.start()
             self.loop()
 
     def stop_sim(self):
         self.running = False
+        self.scheduler.stop()
 
     def reset_sim(self):
         self.stop_sim()
-        self.state = np.array([0.1, 0.0, 0.0, 0.0])
+        if self.link is None:
+            # Phiên phần cứng vẫn chạy thì giữ log tới khi ngắt kết nối
+            self.close_recorder()
+        self.state = self.initial_state()
+        if isinstance(self.controller, SwingUpController):
+            self.controller.reset()
+        if self.mpc is not None:
+            # Bỏ khởi động ấm và thống kê của lần chạy trước
+            self.mpc.reset()
         self.time = 0
-        self.t_data.clear(); self.theta_data.clear(); self.dtheta_data.clear()
-        self.x_data.clear(); self.dx_data.clear()
+        self.scheduler.reset(self.state)
+        self.last_plot_time = None
         self.viz.draw(self.state)
-        self.canvas_agg.draw()
+        self.live_plot.clear()
         self.update_hud()
 
     def loop(self):
+        # Vòng lặp hiển thị: chỉ đọc bản chụp trạng thái mới nhất từ luồng vật lý
         if not self.running:
             return
 
-        dt = self.phys_param.dt
-        u = self.controller.get_action(self.state) + self.manual_force
-        self.state = self.plant.rk4_step(self.state, u, dt)
-        self.time += dt
+        # Độ trễ lập lịch của Tk: thời gian chờ thực tế vượt quá chu kỳ yêu cầu trong after()
+        t_frame = time.perf_counter()
+        if self._last_tick is not None:
+            late = t_frame - self._last_tick - self.display_interval_ms / 1000.0
+            self.profiler.record("tk_latency", max(late, 0.0))
+
+        if self.player is not None:
+            # Chế độ phát lại: lấy mẫu theo vị trí phát, cập nhật thanh tua
+            self.time, self.state, _ = self.player.current()
+            self._scale_busy = True
+            self.seek_var.set(self.time)
+            self._scale_busy = False
+        elif self.link is not None:
+            if not self.link.connected:
+                # Luồng I/O đã dừng vì lỗi: ngắt kết nối và báo thay vì hiển thị số liệu cũ
+                error = self.link.error
+                self.disconnect_serial()
+                messagebox.showerror("Lỗi UART", f"Đường truyền dừng: {error!r}")
+                return
+            # Chế độ phần cứng: hiển thị trạng thái đo được mới nhất
+            if self._hw_snapshot is not None:
+                self.time, self.state = self._hw_snapshot
+        else:
+            self.time, self.state, _ = self.scheduler.snapshot()
 
         self.update_gui_components()
-        self.root.after(int(dt*1000), self.loop)
+        self._last_tick = time.perf_counter()
+        self.profiler.record("frame", self._last_tick - t_frame)
+        self.root.after(self.display_interval_ms, self.loop)
 
     def update_gui_components(self):
-        self.viz.draw(self.state)
+        with self.profiler.stage("draw"):
+            self.viz.draw(self.state)
         self.update_hud()
 
-        # Update Graph 30 FPS (0.033s)
-        if len(self.t_data) == 0 or (self.time - self.t_data[-1] >= 0.033): 
-            self.t_data.append(self.time)
-            self.theta_data.append(self.state[0])
-            self.dtheta_data.append(self.state[1])
-            self.x_data.append(self.state[2])
-            self.dx_data.append(self.state[3])
-            
-            self.lines['theta'].set_data(self.t_data, self.theta_data)
-            self.lines['dtheta'].set_data(self.t_data, self.dtheta_data)
-            self.lines['x'].set_data(self.t_data, self.x_data)
-            self.lines['dx'].set_data(self.t_data, self.dx_data)
-            
-            for ax in [self.ax1, self.ax2, self.ax3, self.ax4]:
-                ax.relim(); ax.autoscale_view()
-            
-            self.canvas_agg.draw_idle()
+        # Lưu mọi khung hình; chỉ vẽ lại đồ thị tối đa 30 FPS (0.033s)
+        self.live_plot.push(self.time, self.state)
+        if self.last_plot_time is None or (self.time - self.last_plot_time >= self.plot_interval):
+            self.last_plot_time = self.time
+            with self.profiler.stage("plot"):
+                self.live_plot.refresh()
 
     def update_hud(self):
         t, dt, x, dx = self.state
         txt = f"THÔNG SỐ THỜI GIAN THỰC:\nTheta: {t:.4f} rad | dTheta: {dt:.4f} rad/s\nPos X: {x:.4f} m   | Vel dX: {dx:.4f} m/s"
+        if self.player is not None:
+            p = self.player
+            txt += f"\nPHÁT LẠI: {self.time:.2f}/{p.t_end:.2f}s | x{p.speed:g} | {len(p.log)} mẫu"
+        elif self.link is not None:
+            s = self.link.stats()
+            txt += (f"\nUART: {s['frames']} khung | CRC lỗi: {s['crc_errors']} | Mất: {s['lost']} | "
+                    f"Gửi: {s['sent']} | Bỏ: {s['tx_dropped']}")
+            e = self.estimator.stats()
+            txt += f"\nƯớc lượng: {type(self.estimator).__name__} | p99 {e['p99'] * 1e6:.0f}us/mẫu"
+        else:
+            s = self.scheduler.stats()
+            txt += f"\nVật lý: {s['physics_hz']:.0f}Hz | Điều khiển: {s['control_hz']:.0f}Hz | Overrun: {s['overruns']}"
+
+        # Thống kê hiệu năng: tính lại percentile khoảng 2 lần mỗi giây
+        if self._hud_frames % 30 == 0:
+            lines = self.profiler.format_lines()
+            if isinstance(self.controller, SwingUpController):
+                mode = "CÂN BẰNG" if self.controller.mode == BALANCE else "BƠM NĂNG LƯỢNG"
+                lines.append(f"Swing-up: {mode} | chuyển pha: {self.controller.switches}")
+            if getattr(self.controller, 'balance', self.controller) is self.mpc:
+                m = self.mpc.stats()
+                lines.append(f"MPC: p99 {m['p99'] * 1e3:.2f}ms | max {m['max_all'] * 1e3:.2f}ms | "
+                             f"trễ hạn {m['misses']} | không hội tụ {m['unconverged']}")
+            self._prof_text = "\n".join(lines)
+        self._hud_frames += 1
+        txt += "\n" + self._prof_text
         self.hud_label.config(text=txt)
 
     def mock_uart_send(self):
         try:
             val = [float(v) for v in self.entry_mock.get().split(',')]
-            self.state = np.array([val[0], 0.0, val[1], 0.0])
             self.stop_sim()
+            self.state = np.array([val[0], 0.0, val[1], 0.0])
+            self.scheduler.set_state(self.state)
             self.update_gui_components()
         except:
             messagebox.showerror("Lỗi", "Nhập sai định dạng!")
@@ -278,4 +612,5 @@ class MainApp:
 if __name__ == "__main__":
     root = tk.Tk()
     app = MainApp(root)
+    root.protocol("WM_DELETE_WINDOW", app.on_close)
     root.mainloop()
\ No newline at end of file
@@ -0,0 +1,313 @@
+# mpc.py - Bộ điều khiển dự báo mô hình (MPC) tuyến tính có ràng buộc
+# Mô hình: get_state_space_matrices() rời rạc hóa ZOH theo PhysParam.dt.
+# Bài toán QP dạng rút gọn (condensed, dự báo tiền ổn định bằng K của LQR rời rạc) giải bằng ADMM thuần NumPy:
+#   min 0.5 v'Hv   với   l(e0) <= C v <= u(e0)   (giới hạn lực + giới hạn vị trí xe trên đường ray)
+# Mọi ma trận phụ thuộc thông số (H, C, nghịch đảo hệ KKT) tính lại chỉ khi PhysParam đổi;
+# mỗi chu kỳ chỉ cập nhật cận l, u và khởi động ấm từ lời giải trước (dịch 1 bước).
+
+import time
+
+import numpy as np
+
+from controller import DEFAULT_Q, DEFAULT_R, discretize_zoh
+from instrument import StageTimer
+
+
+class MPCController:
+    """
+    MPC tuyến tính: giao diện giống LQRController (compute_gains / get_action / K)
+    để dùng trực tiếp với SimEngine, MultiRateScheduler và GUI.
+    Chi phí cuối là nghiệm DARE nên khi không có ràng buộc nào chạm biên,
+    lực bước đầu trùng với LQR rời rạc u = -K_d (x - target).
+    """
+    def __init__(self, plant, horizon=30, u_max=20.0, x_limits=(-0.5, 0.5), slack_weight=10.0,
+                 rho=500.0, sigma=1e-6, alpha=1.6, max_iter=200, eps_abs=1e-4, eps_rel=1e-4,
+                 check_every=5, timing_window=1000):
+        """
+        plant: CartPoleSystem
+        horizon: số bước dự báo N (mỗi bước PhysParam.dt)
+        u_max: giới hạn lực |u| <= u_max (N)
+        x_limits: (x_min, x_max) vị trí xe cho phép (m); None -> bỏ ràng buộc đường ray
+        slack_weight: trọng số phạt vượt biên đường ray (ràng buộc mềm, tương đối theo h); nhỏ -> ưu tiên
+                      giữ con lắc hơn giữ xe trong đường ray khi không thể thỏa cả hai. Quá lớn (~1e3) thì
+                      QP thà bỏ con lắc để giữ xe trong ray, ADMM cũng khó hội tụ và hệ phân kỳ.
+        rho, sigma, alpha: tham số ADMM (phạt - tương đối theo Hessian h = R + Bd'P Bd, điều hòa, hệ số quá giãn)
+        max_iter, eps_abs, eps_rel: điều kiện dừng ADMM
+        check_every: kiểm tra hội tụ sau mỗi bao nhiêu vòng lặp (kiểm tra tốn thêm 2 phép nhân ma trận)
+        """
+        self.plant = plant
+        self.horizon = horizon
+        self.u_max = u_max
+        self.x_limits = x_limits
+        self.slack_weight = slack_weight
+        self.rho = rho
+        self.sigma = sigma
+        self.alpha = alpha
+        self.max_iter = max_iter
+        self.eps_abs = eps_abs
+        self.eps_rel = eps_rel
+        self.check_every = check_every
+        self.discrete = True    # MPC luôn làm việc trên mô hình rời rạc (giữ thuộc tính cho tương thích GUI)
+
+        self.Q_diag = list(DEFAULT_Q)
+        self.R_val = DEFAULT_R
+        self.K = None           # Độ lợi LQR rời rạc (chi phí cuối, và cho recorder / hiển thị)
+        self._version = None    # PhysParam.version lúc dựng ma trận
+
+        # Thống kê thời gian giải (deadline = chu kỳ lấy mẫu)
+        self.timer = StageTimer(window=timing_window, deadline=plant.p.dt)
+        self.last_iters = 0
+        self.unconverged = 0
+        self._reset_warm_start()
+
+    def _reset_warm_start(self):
+        self._v = None
+        self._z = None
+        self._y = None
+        self._U_ok = None       # Lời giải hội tụ gần nhất và số bước đã dịch kể từ đó (dự phòng)
+        self._U_age = 0
+
+    def compute_gains(self, Q_diag, R_val, verbose=True):
+        """Lưu trọng số Q, R và dựng lại toàn bộ ma trận dự báo. Trả về K LQR rời rạc."""
+        self.Q_diag = list(Q_diag)
+        self.R_val = R_val
+        self._build()
+
+        if verbose:
+            print("--- MPC Built ---")
+            print(f"Horizon: {self.horizon} x {self.plant.p.dt}s | |u| <= {self.u_max} N | x in {self.x_limits}")
+            print(f"Terminal LQR K: {self.K}")
+        return self.K
+
+    def _build(self):
+        import scipy.linalg
+
+        p = self.plant.p
+        N = self.horizon
+        A, B = self.plant.get_state_space_matrices()
+        Ad, Bd = discretize_zoh(A, B, p.dt)
+        Q = np.diag(self.Q_diag)
+        R = np.array([[self.R_val]])
+
+        # Chi phí cuối P (DARE) -> MPC không ràng buộc trùng LQR rời rạc
+        P = scipy.linalg.solve_discrete_are(Ad, Bd, Q, R)
+        self.K = np.linalg.solve(R + Bd.T @ P @ Bd, Bd.T @ P @ Ad)
+
+        # Dự báo tiền ổn định (pre-stabilized): u_k = -K e_k + c_k, tối ưu theo phần bù c.
+        # Mô hình hở không ổn định (con lắc ngược) làm dạng rút gọn theo U rất xấu điều kiện;
+        # với vòng kín Acl = Ad - Bd K và chi phí cuối P thì
+        #   J = e0' P e0 + sum c_k' (R + Bd' P Bd) c_k
+        # -> Hessian theo c là đường chéo, nghiệm không ràng buộc c = 0 (đúng LQR rời rạc).
+        Acl = Ad - Bd @ self.K
+        # E = Sx e0 + Su c, E = [e0; e1; ...; eN]
+        Sx = np.empty((4 * (N + 1), 4))
+        Su = np.zeros((4 * (N + 1), N))
+        Ak = np.eye(4)
+        AkB = []
+        for k in range(N + 1):
+            Sx[4 * k:4 * k + 4] = Ak        # Acl^k
+            AkB.append(Ak @ Bd)             # Acl^k Bd
+            Ak = Acl @ Ak
+        for k in range(1, N + 1):
+            for j in range(k):
+                Su[4 * k:4 * k + 4, j] = AkB[k - 1 - j][:, 0]
+
+        h = (R + Bd.T @ P @ Bd).item()
+        H = h * np.eye(N)
+
+        # Lực thực u = -K E[0:N] + c = u_max * (Cu c + Sx_u e0)
+        Kblk = np.kron(np.eye(N), self.K)
+        self._Sx_u = -Kblk @ Sx[:4 * N] / self.u_max
+        Cu = (np.eye(N) - Kblk @ Su[:4 * N]) / self.u_max
+
+        # Biến quyết định v = [c; s]: s là biến bù của ràng buộc vị trí (ràng buộc mềm,
+        # phạt bậc hai slack_weight) để QP luôn khả thi, kể cả khi xe đã sát biên mà lực không đủ kéo về.
+        # Các hàng ràng buộc được chuẩn hóa về cỡ 1 để ADMM hội tụ đều: hàng lực rồi hàng vị trí e1..eN.
+        if self.x_limits is None:
+            C = Cu
+        else:
+            x_min, x_max = self.x_limits
+            self._x_scale = 1.0 / max(abs(x_min), abs(x_max))
+            self._Sx_pos = Sx[6::4] * self._x_scale
+            Z = np.zeros((N, N))
+            H = np.block([[H, Z], [Z, self.slack_weight * h * np.eye(N)]])
+            C = np.block([[Cu, Z], [Su[6::4] * self._x_scale, np.eye(N)]])
+        nv = H.shape[0]
+        self._H = H
+        self._C = C
+        self._Ct = np.ascontiguousarray(C.T)
+        self._nv = nv
+        self._m = C.shape[0]
+
+        # Hệ tuyến tính của bước cập nhật v: (H + sigma I + rho C'C) v = ...
+        # Phân tích Cholesky một lần cho mỗi bộ thông số; kích thước nhỏ nên lưu luôn
+        # nghịch đảo để mỗi vòng lặp chỉ còn phép nhân ma trận-vector.
+        self._rho = self.rho * h
+        Mkkt = H + self.sigma * np.eye(nv) + self._rho * (C.T @ C)
+        cho = scipy.linalg.cho_factor(Mkkt)
+        self._Minv = scipy.linalg.cho_solve(cho, np.eye(nv))
+        self._MinvCt = self._Minv @ self._Ct
+
+        self._version = p.version
+        self._reset_warm_start()
+
+    def _bounds(self, e0, x_target):
+        """Cận l, u (đã chuẩn hóa) cho trạng thái sai lệch e0."""
+        N = self.horizon
+        free_u = self._Sx_u @ e0            # Lực (chuẩn hóa) khi c = 0
+        lo = np.empty(self._m)
+        hi = np.empty(self._m)
+        lo[:N] = -1.0 - free_u
+        hi[:N] = 1.0 - free_u
+        if self.x_limits is not None:
+            x_min, x_max = self.x_limits
+            free = self._Sx_pos @ e0            # Vị trí dự báo khi c = 0 (đã chuẩn hóa)
+            lo[N:] = (x_min - x_target) * self._x_scale - free
+            hi[N:] = (x_max - x_target) * self._x_scale - free
+        return lo, hi
+
+    @staticmethod
+    def _shift(v, N):
+        """Dịch từng khối N phần tử đi 1 bước, lặp lại phần tử cuối (khởi động ấm)."""
+        w = v.reshape(-1, N)
+        return np.concatenate((w[:, 1:], w[:, -1:]), axis=1).ravel()
+
+    def solve(self, e0, x_target=0.0):
+        """
+        Giải QP cho trạng thái sai lệch e0 = state - target.
+        Trả về (U, converged): chuỗi lực tối ưu trên toàn chân trời.
+        """
+        N = self.horizon
+        rho = self._rho
+        sigma = self.sigma
+        alpha = self.alpha
+        H = self._H
+        C = self._C
+        Ct = self._Ct
+        Minv = self._Minv
+        MinvCt = self._MinvCt
+        lo, hi = self._bounds(e0, x_target)
+
+        # Khởi động ấm: dịch lời giải trước 1 bước; lần đầu dùng nghiệm không ràng buộc (c = 0)
+        if self._v is None:
+            v = np.zeros(self._nv)
+            z = np.clip(C @ v, lo, hi)
+            y = np.zeros(self._m)
+        else:
+            v = self._shift(self._v, N)
+            z = self._shift(self._z, N)
+            y = self._shift(self._y, N)
+
+        eps_abs = self.eps_abs
+        eps_rel = self.eps_rel
+        check_every = self.check_every
+        converged = False
+        it = 0
+        for it in range(1, self.max_iter + 1):
+            v = Minv @ (sigma * v) + MinvCt @ (rho * z - y)
+            Cv = C @ v
+            Cv_relax = alpha * Cv + (1.0 - alpha) * z
+            z_new = np.clip(Cv_relax + y / rho, lo, hi)
+            y = y + rho * (Cv_relax - z_new)
+            z = z_new
+
+            if it % check_every == 0:
+                Hv = H @ v
+                Cty = Ct @ y
+                r_prim = np.abs(Cv - z).max()
+                r_dual = np.abs(Hv + Cty).max()
+                tol_prim = eps_abs + eps_rel * max(np.abs(Cv).max(), np.abs(z).max())
+                tol_dual = eps_abs + eps_rel * max(np.abs(Hv).max(), np.abs(Cty).max())
+                if r_prim <= tol_prim and r_dual <= tol_dual:
+                    converged = True
+                    break
+
+        self.last_iters = it
+        if not converged:
+            self.unconverged += 1
+        self._v, self._z, self._y = v, z, y
+        U = self.u_max * (Cv[:N] + self._Sx_u @ e0)
+        return U, converged
+
+    def get_action(self, state):
+        """Lực bước đầu của lời giải MPC (luôn kẹp trong [-u_max, u_max])."""
+        t0 = time.perf_counter()
+        p = self.plant.p
+        if self._version != p.version:
+            # Thông số vật lý (hoặc dt) đổi -> dựng lại ma trận dự báo
+            self._build()
+            self.timer.deadline = p.dt
+
+        target = p.target_state
+        e0 = np.asarray(state, dtype=float) - target
+        U, converged = self.solve(e0, float(target[2]))
+        if converged:
+            self._U_ok = U
+            self._U_age = 0
+            u = float(U[0])
+        else:
+            # ADMM chưa hội tụ (hết max_iter): không dùng nghiệm dở dang. Dùng lời giải hội tụ
+            # trước đó dịch thời gian nếu còn trong chân trời, không thì LQR rời rạc kẹp lực.
+            self._U_age += 1
+            if self._U_ok is not None and self._U_age < self.horizon:
+                u = float(self._U_ok[self._U_age])
+            else:
+                u = -float(self.K[0] @ e0)
+        u = min(max(u, -self.u_max), self.u_max)
+        self.timer.record(time.perf_counter() - t0)
+        return u
+
+    def reset(self):
+        """Xóa khởi động ấm và thống kê (vd. khi đặt lại mô phỏng)."""
+        self._reset_warm_start()
+        self.timer.reset()
+        self.unconverged = 0
+
+    def stats(self):
+        """Thống kê thời gian giải (giây) + số vòng lặp ADMM lần gần nhất, số lần không hội tụ."""
+        s = self.timer.stats()
+        s['deadline'] = self.timer.deadline
+        s['iters'] = self.last_iters
+        s['unconverged'] = self.unconverged
+        return s
+
+
+def main(argv=None):
+    """Kiểm tra nhanh: so sánh với LQR rời rạc và in thống kê thời gian giải."""
+    import argparse
+
+    from conf import PhysParam
+    from plant import CartPoleSystem
+    from controller import LQRController
+    from engine import SimEngine
+
+    ap = argparse.ArgumentParser(description="MPC có ràng buộc: mô phỏng và thống kê thời gian giải")
+    ap.add_argument("--x0", type=float, nargs=4, default=[0.4, 0.0, 0.0, 0.0])
+    ap.add_argument("-t", "--duration", type=float, default=10.0)
+    ap.add_argument("-N", "--horizon", type=int, default=30)
+    ap.add_argument("--u-max", type=float, default=20.0)
+    ap.add_argument("--x-max", type=float, default=0.5)
+    args = ap.parse_args(argv)
+
+    p = PhysParam()
+    plant = CartPoleSystem(p)
+    mpc = MPCController(plant, horizon=args.horizon, u_max=args.u_max, x_limits=(-args.x_max, args.x_max))
+    mpc.compute_gains(DEFAULT_Q, DEFAULT_R, verbose=False)
+    lqr = LQRController(plant, discrete=True)
+    lqr.compute_gains(DEFAULT_Q, DEFAULT_R, verbose=False)
+
+    for name, ctrl in (("LQR (rời rạc)", lqr), ("MPC", mpc)):
+        traj = SimEngine(p, ctrl).run(args.x0, args.duration)
+        print(f"{name:14s} |u|max = {np.abs(traj.controls).max():7.3f} N   "
+              f"|x|max = {np.abs(traj.states[:, 2]).max():6.3f} m   "
+              f"|theta| cuối = {abs(traj.states[-1, 0]):.2e}")
+
+    s = mpc.stats()
+    print(f"Thời gian giải: p50 {s['p50'] * 1e3:.3f} ms | p99 {s['p99'] * 1e3:.3f} ms | "
+          f"max {s['max_all'] * 1e3:.3f} ms | trễ hạn {s['misses']}/{s['count']} (deadline {s['deadline'] * 1e3:.0f} ms) | "
+          f"không hội tụ {s['unconverged']}")
+    return 0
+
+
+if __name__ == "__main__":
+    main()
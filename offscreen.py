@@ -0,0 +1,391 @@
+# offscreen.py - Dựng hình không cần Tk: vẽ thẳng vào mảng NumPy (H, W, 3) rồi ghi GIF / video / PNG
+# Dùng chung hình học (visualizer.cart_pole_geometry) và màu, tỷ lệ của SimParam với GUI.
+# Mọi chi tiết được khử răng cưa (độ phủ / khoảng cách tới biên) và chỉ tính trên hộp bao của nó,
+# nền tĩnh chỉ sao chép nên một khung 1000x700 mất cỡ 1-2 ms, khung thu nhỏ còn nhanh hơn.
+# Nhiều quỹ đạo (.cplog, .npz từ `cli.py run --out`, hoặc các lần đổ trong CSV của sweep.py)
+# được dựng song song trên nhiều tiến trình.
+#
+# Định dạng ra theo phần mở rộng:
+#   .gif           -> Pillow (tùy chọn)
+#   .mp4/.avi/...  -> imageio + ffmpeg (tùy chọn)
+#   thư mục        -> chuỗi PNG (không cần thư viện ngoài, tự nén bằng zlib)
+#
+# Cách dùng:
+#   python offscreen.py logs/*.cplog --out-dir videos --ext .gif
+#   python offscreen.py --sweep sweep_results.csv --out-dir failures     # chỉ các lần đổ
+
+import argparse
+import os
+import struct
+import time
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from conf import SimParam, PhysParam
+from visualizer import cart_pole_geometry
+
+# Màu Tk dùng trong visualizer không có trong SimParam
+TK_COLORS = {'gray': '#bebebe', 'white': '#ffffff', 'black': '#000000'}
+
+
+def hex_rgb(color):
+    """'#RRGGBB' hoặc tên màu Tk -> mảng float32 (3,)."""
+    color = TK_COLORS.get(color, color)
+    return np.array([int(color[i:i + 2], 16) for i in (1, 3, 5)], dtype=np.float32)
+
+
+class FrameRasterizer:
+    """
+    Vẽ cart-pole lên bộ đệm (H, W, 3) uint8, cùng bố cục với CartPoleVisualizer.
+    downsample: hệ số thu nhỏ (tọa độ hình học nhân 1/downsample, vẽ trực tiếp ở độ phân giải nhỏ;
+                nhờ khử răng cưa nên chi tiết nhỏ hơn 1 pixel vẫn hiện đúng).
+    """
+    def __init__(self, L=None, width=SimParam.WIN_WIDTH, height=SimParam.WIN_HEIGHT, downsample=1,
+                 progress_bar=True):
+        self.L = L if L is not None else PhysParam().L
+        self.width = width
+        self.height = height
+        self.floor_y = height / 2 + 100
+        self.zoom = 1.0 / max(downsample, 1)
+        self.out_w = max(int(round(width * self.zoom)), 1)
+        self.out_h = max(int(round(height * self.zoom)), 1)
+        self.progress_bar = progress_bar
+
+        self.c_bg = hex_rgb(SimParam.COLOR_BG)
+        self.c_cart = hex_rgb(SimParam.COLOR_CART)
+        self.c_pole = hex_rgb(SimParam.COLOR_POLE)
+        self.c_mass = hex_rgb(SimParam.COLOR_MASS)
+        self.c_gray = hex_rgb('gray')
+        self.c_white = hex_rgb('white')
+
+        # Nền tĩnh (màu nền + đường ray) vẽ một lần, mỗi khung chỉ sao chép (uint8, rẻ)
+        self._background = np.empty((self.out_h, self.out_w, 3), dtype=np.uint8)
+        self._background[:] = self.c_bg
+        z = self.zoom
+        self._rect(self._background, 0, (self.floor_y - 1) * z, width * z, (self.floor_y + 1) * z, self.c_gray)
+        self._buf = self._background.copy()
+
+    # ------------------------------------------------------------------
+    # Hình cơ bản (tọa độ pixel đầu ra, cùng quy ước với canvas Tk)
+    # ------------------------------------------------------------------
+    def _box(self, x0, y0, x1, y1):
+        """Hộp bao nguyên đã kẹp trong khung: (c0, r0, c1, r1) hoặc None nếu ngoài khung."""
+        c0 = max(int(np.floor(x0)), 0)
+        r0 = max(int(np.floor(y0)), 0)
+        c1 = min(int(np.ceil(x1)) + 1, self.out_w)
+        r1 = min(int(np.ceil(y1)) + 1, self.out_h)
+        if c0 >= c1 or r0 >= r1:
+            return None
+        return c0, r0, c1, r1
+
+    def _blend(self, buf, box, alpha, color):
+        # Trộn màu chỉ trong hộp bao (tính bằng float32 rồi ghi lại uint8)
+        c0, r0, c1, r1 = box
+        region = buf[r0:r1, c0:c1].astype(np.float32)
+        region += alpha[..., None] * (color - region)
+        buf[r0:r1, c0:c1] = region + 0.5
+
+    def _rect(self, buf, x0, y0, x1, y1, color):
+        """Hình chữ nhật đặc, độ phủ từng pixel tính tách theo hàng / cột (khử răng cưa)."""
+        box = self._box(x0, y0, x1, y1)
+        if box is None:
+            return
+        c0, r0, c1, r1 = box
+        cols = np.arange(c0, c1, dtype=np.float32)
+        rows = np.arange(r0, r1, dtype=np.float32)
+        cov_x = np.clip(np.minimum(cols + 1, x1) - np.maximum(cols, x0), 0.0, 1.0)
+        cov_y = np.clip(np.minimum(rows + 1, y1) - np.maximum(rows, y0), 0.0, 1.0)
+        self._blend(buf, box, np.outer(cov_y, cov_x), color)
+
+    def _ellipse(self, buf, x0, y0, x1, y1, fill, outline=None, width=1.0):
+        """Hình tròn nội tiếp hộp (x0, y0, x1, y1) như create_oval, khử răng cưa."""
+        box = self._box(x0 - width, y0 - width, x1 + width, y1 + width)
+        if box is None:
+            return
+        c0, r0, c1, r1 = box
+        cx, cy = (x0 + x1) / 2, (y0 + y1) / 2
+        r = (x1 - x0) / 2
+        yy, xx = np.ogrid[r0:r1, c0:c1]
+        dist = np.sqrt((xx + 0.5 - cx)**2 + (yy + 0.5 - cy)**2)
+        self._blend(buf, box, np.clip(r + 0.5 - dist, 0.0, 1.0), fill)
+        if outline is not None:
+            ring = np.clip(width / 2 + 0.5 - np.abs(dist - r), 0.0, 1.0)
+            self._blend(buf, box, ring, outline)
+
+    def _segment(self, buf, x0, y0, x1, y1, color, width):
+        """Đoạn thẳng dày đầu tròn (capstyle='round'), khử răng cưa."""
+        h = width / 2
+        box = self._box(min(x0, x1) - h - 1, min(y0, y1) - h - 1, max(x0, x1) + h + 1, max(y0, y1) + h + 1)
+        if box is None:
+            return
+        c0, r0, c1, r1 = box
+        yy, xx = np.ogrid[r0:r1, c0:c1]
+        px = xx + 0.5 - x0
+        py = yy + 0.5 - y0
+        dx, dy = x1 - x0, y1 - y0
+        ll = dx * dx + dy * dy
+        s = np.clip((px * dx + py * dy) / ll, 0.0, 1.0) if ll > 0 else 0.0
+        dist = np.sqrt((px - s * dx)**2 + (py - s * dy)**2)
+        self._blend(buf, box, np.clip(h + 0.5 - dist, 0.0, 1.0), color)
+
+    # ------------------------------------------------------------------
+    def render(self, state, progress=None):
+        """
+        Một khung hình cho trạng thái [theta, theta_dot, x, x_dot].
+        progress: None hoặc tỷ lệ 0..1 (vẽ thanh tiến độ ở mép trên).
+        Trả về mảng uint8 (out_h, out_w, 3) mới.
+        """
+        buf = self._buf
+        buf[:] = self._background
+        z = self.zoom
+        g = {k: tuple(v * z for v in c) for k, c in
+             cart_pole_geometry(state[0], state[2], self.L, self.width, self.floor_y).items()}
+
+        x0, y0, x1, y1 = g['cart']
+        self._rect(buf, x0 - z, y0 - z, x1 + z, y1 + z, self.c_white)     # viền width=2
+        self._rect(buf, x0 + z, y0 + z, x1 - z, y1 - z, self.c_cart)
+        self._ellipse(buf, *g['wheel_l'], self.c_gray)
+        self._ellipse(buf, *g['wheel_r'], self.c_gray)
+        self._segment(buf, *g['pole'], self.c_pole, 6 * z)
+        self._ellipse(buf, *g['mass'], self.c_mass, outline=self.c_white, width=2 * z)
+        if self.progress_bar and progress is not None:
+            self._rect(buf, 0, 0, max(progress, 0.0) * self.out_w, max(4 * z, 1.0), self.c_white)
+        return buf.copy()
+
+    def render_trajectory(self, t, states, fps=30.0, speed=1.0):
+        """
+        Lấy mẫu quỹ đạo (t, states) theo khung hình thời gian thực (chia speed), sinh từng khung.
+        Mẫu dùng cho mỗi khung là mẫu cuối cùng có thời điểm <= thời điểm khung (như ReplayPlayer).
+        """
+        t = np.asarray(t, dtype=float)
+        t0, t1 = t[0], t[-1]
+        n_frames = max(int((t1 - t0) * fps / speed) + 1, 1)
+        times = t0 + np.arange(n_frames) * (speed / fps)
+        idx = np.clip(np.searchsorted(t, times, side='right') - 1, 0, len(t) - 1)
+        span = max(t1 - t0, 1e-9)
+        for i, k in enumerate(idx):
+            state = states[k]
+            if not np.isfinite(state).all():
+                break
+            yield self.render(state, (times[i] - t0) / span)
+
+
+# ----------------------------------------------------------------------
+# Ghi file
+# ----------------------------------------------------------------------
+def encode_png(frame):
+    """Mã hóa PNG RGB 8-bit bằng zlib (không cần thư viện ảnh)."""
+    h, w, _ = frame.shape
+    raw = np.zeros((h, w * 3 + 1), dtype=np.uint8)      # byte đầu mỗi dòng: bộ lọc 0 (None)
+    raw[:, 1:] = frame.reshape(h, w * 3)
+
+    def chunk(tag, data):
+        return (struct.pack('>I', len(data)) + tag + data
+                + struct.pack('>I', zlib.crc32(tag + data) & 0xffffffff))
+
+    return (b'\x89PNG\r\n\x1a\n'
+            + chunk(b'IHDR', struct.pack('>IIBBBBB', w, h, 8, 2, 0, 0, 0))
+            + chunk(b'IDAT', zlib.compress(raw.tobytes(), 6))
+            + chunk(b'IEND', b''))
+
+
+def write_png_sequence(frames, directory):
+    os.makedirs(directory, exist_ok=True)
+    n = 0
+    for n, frame in enumerate(frames, 1):
+        with open(os.path.join(directory, f"frame_{n - 1:05d}.png"), 'wb') as f:
+            f.write(encode_png(frame))
+    return n
+
+
+def write_gif(frames, path, fps):
+    from PIL import Image
+    # Cảnh chỉ có vài màu (+ pha trộn ở biên): bảng màu lấy từ khung đầu, dùng chung cho mọi khung
+    # (lượng tử hóa riêng từng khung chậm hơn ~20 lần)
+    images = []
+    palette = None
+    for f in frames:
+        img = Image.fromarray(f)
+        if palette is None:
+            palette = img.quantize(colors=64, method=Image.Quantize.MEDIANCUT)
+        images.append(img.quantize(palette=palette, dither=Image.Dither.NONE))
+    if not images:
+        return 0
+    images[0].save(path, save_all=True, append_images=images[1:], duration=int(round(1000 / fps)),
+                   loop=0, optimize=False)
+    return len(images)
+
+
+def write_video(frames, path, fps):
+    import imageio
+    n = 0
+    with imageio.get_writer(path, fps=fps, macro_block_size=1) as writer:
+        for n, frame in enumerate(frames, 1):
+            writer.append_data(frame)
+    return n
+
+
+def write_frames(frames, path, fps=30.0):
+    """
+    Ghi chuỗi khung theo phần mở rộng của path (xem đầu file). Thiếu thư viện tùy chọn
+    -> ghi chuỗi PNG vào thư mục cùng tên. Trả về (đường dẫn thực tế, số khung).
+    """
+    root, ext = os.path.splitext(path)
+    ext = ext.lower()
+    if ext:
+        try:
+            if ext == '.gif':
+                return path, write_gif(frames, path, fps)
+            return path, write_video(frames, path, fps)
+        except ImportError:
+            path = root
+    return path, write_png_sequence(frames, path)
+
+
+# ----------------------------------------------------------------------
+# Nguồn quỹ đạo
+# ----------------------------------------------------------------------
+def load_trajectory(path):
+    """(t, states, L) từ .cplog (RunLog) hoặc .npz (cli.py run --out)."""
+    if path.endswith('.npz'):
+        with np.load(path) as data:
+            return data['t'], data['states'], PhysParam().L
+    from recorder import RunLog
+    log = RunLog(path)
+    return np.array(log.t), np.array(log.states), log.params['L']
+
+
+def simulate_config(config, x0, duration, discrete=False):
+    """Chạy lại một cấu hình của sweep.py (vd. một lần đổ) -> (t, states, L)."""
+    from controller import LQRController, DEFAULT_Q, DEFAULT_R
+    from engine import SimEngine
+    from plant import CartPoleSystem
+    from integrators import pole_fall
+    from sweep import make_param, FALL_ANGLE
+
+    p = make_param(config)
+    ctrl = LQRController(CartPoleSystem(p), discrete=discrete)
+    ctrl.compute_gains(config.get('Q_diag', DEFAULT_Q), config.get('R_val', DEFAULT_R), verbose=False)
+    # Dừng tại lúc đổ (cùng ngưỡng với sweep) để quỹ đạo phân kỳ không tràn số
+    traj = SimEngine(p, controller=ctrl).run(np.asarray(x0, dtype=float), duration,
+                                             events=(pole_fall(FALL_ANGLE),))
+    return traj.t, traj.states, p.L
+
+
+def sweep_jobs(csv_path, failed_only=True):
+    """
+    Đọc CSV của sweep.py -> danh sách dict {'config', 'x0', 'duration', 'discrete'}
+    (chỉ các lần đổ nếu failed_only). Điều kiện chạy lấy từ các cột cùng tên do sweep.py ghi;
+    CSV cũ không có các cột này -> giá trị None.
+    """
+    import csv
+    import json
+    from sweep import PHYS_FIELDS
+    runs = []
+    with open(csv_path, newline='') as f:
+        for row in csv.DictReader(f):
+            if failed_only and row.get('fell') not in ('True', '1', 'true'):
+                continue
+            config = {k: float(row[k]) for k in PHYS_FIELDS if row.get(k) not in (None, '')}
+            for k in ('Q_diag', 'R_val'):
+                if row.get(k) not in (None, ''):
+                    config[k] = json.loads(row[k])
+            has = {k: row.get(k) not in (None, '') for k in ('x0', 'duration', 'discrete')}
+            runs.append({
+                'config': config,
+                'x0': json.loads(row['x0']) if has['x0'] else None,
+                'duration': float(row['duration']) if has['duration'] else None,
+                'discrete': row['discrete'] in ('True', '1', 'true') if has['discrete'] else None,
+            })
+    return runs
+
+
+def render_job(job):
+    """
+    Dựng và ghi một quỹ đạo (chạy trong tiến trình con).
+    job: dict với 'out' và một trong 'path' (file log) hoặc 'config' (+ 'x0', 'duration', 'discrete');
+         tùy chọn 'fps', 'speed', 'downsample'.
+    Trả về (đường dẫn ra, số khung, giây).
+    """
+    t0 = time.perf_counter()
+    if 'path' in job:
+        t, states, L = load_trajectory(job['path'])
+    else:
+        t, states, L = simulate_config(job['config'], job['x0'], job['duration'], job.get('discrete', False))
+    fps = job.get('fps', 30.0)
+    raster = FrameRasterizer(L, downsample=job.get('downsample', 1))
+    frames = raster.render_trajectory(t, states, fps=fps, speed=job.get('speed', 1.0))
+    out, n = write_frames(frames, job['out'], fps)
+    return out, n, time.perf_counter() - t0
+
+
+def render_many(jobs, workers=None):
+    """Dựng song song danh sách job (mỗi job một tiến trình con); trả về kết quả theo thứ tự."""
+    if workers == 1 or len(jobs) <= 1:
+        return [render_job(j) for j in jobs]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(render_job, jobs))
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Dựng quỹ đạo ra GIF / video / PNG không cần Tk")
+    ap.add_argument("logs", nargs='*', help="File .cplog hoặc .npz")
+    ap.add_argument("--sweep", default=None, help="CSV kết quả của sweep.py")
+    ap.add_argument("--all", action="store_true", help="Dựng mọi dòng của --sweep (mặc định chỉ lần đổ)")
+    ap.add_argument("--x0", type=float, nargs=4, default=None,
+                    help="Trạng thái đầu cho --sweep (mặc định: cột x0 trong CSV)")
+    ap.add_argument("-t", "--duration", type=float, default=None,
+                    help="Thời gian mô phỏng cho --sweep (mặc định: cột duration trong CSV)")
+    ap.add_argument("--discrete", action="store_true", default=None,
+                    help="LQR rời rạc cho --sweep (mặc định: cột discrete trong CSV)")
+    ap.add_argument("--limit", type=int, default=None, help="Số quỹ đạo tối đa")
+    ap.add_argument("--out-dir", default="renders")
+    ap.add_argument("--ext", default=".gif", help=".gif, .mp4, ... hoặc '' (chuỗi PNG)")
+    ap.add_argument("--fps", type=float, default=30.0)
+    ap.add_argument("--speed", type=float, default=1.0, help="Hệ số tốc độ phát")
+    ap.add_argument("--downsample", type=int, default=2, help="Hệ số thu nhỏ khung hình")
+    ap.add_argument("--workers", type=int, default=None)
+    args = ap.parse_args(argv)
+
+    common = {'fps': args.fps, 'speed': args.speed, 'downsample': args.downsample}
+    jobs = []
+    for path in args.logs:
+        name = os.path.splitext(os.path.basename(path))[0]
+        jobs.append(dict(common, path=path, out=os.path.join(args.out_dir, name + args.ext)))
+    if args.sweep:
+        fallback = {'x0': [0.1, 0.0, 0.0, 0.0], 'duration': 10.0, 'discrete': False}   # Mặc định của sweep.py
+        missing = set()
+        for i, run in enumerate(sweep_jobs(args.sweep, failed_only=not args.all)):
+            for k, override in (('x0', args.x0), ('duration', args.duration), ('discrete', args.discrete)):
+                if override is not None:
+                    run[k] = override
+                elif run[k] is None:
+                    missing.add(k)
+                    run[k] = fallback[k]
+            jobs.append(dict(common, **run, out=os.path.join(args.out_dir, f"sweep_{i:05d}{args.ext}")))
+        if missing:
+            print(f"CẢNH BÁO: CSV thiếu cột {sorted(missing)} (sweep.py cũ) -> dùng mặc định "
+                  f"{ {k: fallback[k] for k in sorted(missing)} }; quỹ đạo dựng lại có thể khác lần chạy gốc. "
+                  f"Chỉ định bằng --x0 / -t / --discrete.")
+    if not args.logs and not args.sweep:
+        ap.error("cần file log hoặc --sweep")
+    if not jobs:
+        print("Không có quỹ đạo nào để dựng (CSV không có lần đổ; dùng --all để dựng mọi dòng)")
+        return 0
+    jobs = jobs[:args.limit]
+
+    os.makedirs(args.out_dir, exist_ok=True)
+    t0 = time.perf_counter()
+    results = render_many(jobs, args.workers)
+    total = sum(n for _, n, _ in results)
+    for out, n, sec in results:
+        print(f"  {out}: {n} khung ({sec:.1f}s)")
+    elapsed = time.perf_counter() - t0
+    print(f"{len(results)} quỹ đạo, {total} khung trong {elapsed:.1f}s ({total / max(elapsed, 1e-9):.0f} khung/s)")
+    return 0
+
+
+if __name__ == "__main__":
+    main()
@@ -35,17 +35,18 @@ class CartPoleSystem:
         # Hàng 1: theta_dot = theta_dot (0, 1, 0, 0)
         # Hàng 2: theta_ddot = ...
         #   Hệ số góc theta: m*g*l*(M+m) / Det
-        #   Hệ số ma sát (nếu có): m*l*d / Det (nhưng ở đây d thường = 0)
+        #   Hệ số ma sát (theo x_dot): m*l*d / Det (d = 0 -> bằng 0)
         # Hàng 3: x_dot = x_dot (0, 0, 0, 1)
         # Hàng 4: x_ddot = ...
         #   Hệ số góc theta: - (m*l)^2 * g / Det
+        #   Hệ số ma sát (theo x_dot): - J*d / Det
         
         # Lưu ý: Cấu trúc biến trạng thái là [theta, theta_dot, x, x_dot]
         A = np.array([
             [0, 1, 0, 0],
-            [m * g * l * (M + m) / Det, 0, 0, 0],
+            [m * g * l * (M + m) / Det, 0, 0, m * l * d / Det],
             [0, 0, 0, 1],
-            [- (m * l)**2 * g / Det, 0, 0, 0]
+            [- (m * l)**2 * g / Det, 0, 0, - J * d / Det]
         ])
 
         # 4. Ma trận B (4x1)
@@ -60,6 +61,22 @@ class CartPoleSystem:
 
         return A, B
 
+    def linearize(self, theta, theta_dot=0.0, force=0.0, eps=1e-6):
+        """
+        Tuyến tính hóa động lực học phi tuyến tại điểm làm việc bất kỳ
+        (theta, theta_dot, lực force) bằng Jacobian số (sai phân trung tâm) của dynamics().
+        Tại theta = theta_dot = force = 0 kết quả trùng với get_state_space_matrices().
+        Trả về A (4x4), B (4x1).
+        """
+        x0 = np.array([theta, theta_dot, 0.0, 0.0])
+        A = np.empty((4, 4))
+        for j in range(4):
+            dx = np.zeros(4)
+            dx[j] = eps
+            A[:, j] = (self.dynamics(x0 + dx, force) - self.dynamics(x0 - dx, force)) / (2 * eps)
+        B = ((self.dynamics(x0, force + eps) - self.dynamics(x0, force - eps)) / (2 * eps)).reshape(4, 1)
+        return A, B
+
     def dynamics(self, state, force):
         """
         Phương trình vi phân phi tuyến (Non-linear Dynamics) để mô phỏng chính xác.
@@ -75,24 +92,25 @@ class CartPoleSystem:
         l = self.p.l_cm
         J = self.p.J
         g = self.p.g
+        d = self.p.d
         
         theta, theta_dot, x, x_dot = state
         sin_t = math.sin(theta)
         cos_t = math.cos(theta)
         
-        # Hệ phương trình Lagrange đầy đủ (Không tuyến tính hóa):
-        # 1. (M+m)*x_ddot + m*l*cos(t)*theta_ddot - m*l*sin(t)*theta_dot^2 = F
+        # Hệ phương trình Lagrange đầy đủ (Không tuyến tính hóa), ma sát nhớt d của xe:
+        # 1. (M+m)*x_ddot + m*l*cos(t)*theta_ddot - m*l*sin(t)*theta_dot^2 = F - d*x_dot
         # 2. m*l*cos(t)*x_ddot + J*theta_ddot - m*g*l*sin(t) = 0
         
         # Viết lại dưới dạng Ax = b để giải tìm (x_ddot, theta_ddot):
-        # [ M+m      m*l*cos ] [x_ddot    ]   [ F + m*l*sin*theta_dot^2 ]
+        # [ M+m      m*l*cos ] [x_ddot    ]   [ F - d*x_dot + m*l*sin*theta_dot^2 ]
         # [ m*l*cos  J       ] [theta_ddot] = [ m*g*l*sin               ]
         
         # Định thức D (Phụ thuộc vào góc theta)
         D = (M + m) * J - (m * l * cos_t)**2
         
         # Các vế phải (Right hand side)
-        rhs_1 = force + m * l * sin_t * (theta_dot**2) # Vế phải pt 1
+        rhs_1 = force - d * x_dot + m * l * sin_t * (theta_dot**2) # Vế phải pt 1
         rhs_2 = m * g * l * sin_t                      # Vế phải pt 2
         
         # Giải quy tắc Cramer:
@@ -112,4 +130,316 @@ class CartPoleSystem:
         k4 = self.dynamics(state + dt * k3, force)
         
         new_state = state + (dt / 6.0) * (k1 + 2*k2 + 2*k3 + k4)
-        return new_state
\ No newline at end of file
+        return new_state
+
+    # ------------------------------------------------------------------
+    # CHẾ ĐỘ LÔ (BATCH): mô phỏng N hệ cùng lúc bằng NumPy
+    # ------------------------------------------------------------------
+    def dynamics_batch(self, states, forces, params=None):
+        """
+        Phiên bản vector hóa của dynamics() cho N trạng thái cùng lúc.
+        Input:
+            states: mảng (N, 4), mỗi hàng là [theta, theta_dot, x, x_dot]
+            forces: scalar hoặc mảng (N,) - lực điều khiển từng hàng
+            params: None (dùng self.p cho mọi hàng) hoặc dict từ batch_params(),
+                    mỗi khóa 'M', 'm_total', 'l_cm', 'J', 'g', 'd' là scalar hoặc mảng (N,)
+        Output:
+            d_states: mảng (N, 4)
+        """
+        if params is None:
+            M, m, l, J, g, d = self.p.M, self.p.m_total, self.p.l_cm, self.p.J, self.p.g, self.p.d
+        else:
+            M, m, l, J, g = (params[k] for k in ('M', 'm_total', 'l_cm', 'J', 'g'))
+            d = params.get('d', 0.0)
+
+        theta = states[:, 0]
+        theta_dot = states[:, 1]
+        sin_t = np.sin(theta)
+        cos_t = np.cos(theta)
+
+        # Cùng hệ phương trình Lagrange như dynamics(), giải Cramer theo từng hàng
+        ml = m * l
+        ml_cos = ml * cos_t
+        D = (M + m) * J - ml_cos**2
+
+        rhs_1 = forces - d * states[:, 3] + ml * sin_t * theta_dot**2
+        rhs_2 = ml * g * sin_t
+
+        d_states = np.empty_like(states)
+        d_states[:, 0] = theta_dot
+        d_states[:, 1] = ((M + m) * rhs_2 - rhs_1 * ml_cos) / D
+        d_states[:, 2] = states[:, 3]
+        d_states[:, 3] = (rhs_1 * J - rhs_2 * ml_cos) / D
+        return d_states
+
+    def rk4_step_batch(self, states, forces, dt, params=None):
+        """
+        RK4 cho N hệ cùng lúc (giữ lực không đổi trong một bước, giống rk4_step).
+        states: (N, 4); forces: scalar hoặc (N,); params: xem dynamics_batch().
+        """
+        states = np.asarray(states, dtype=float)
+        k1 = self.dynamics_batch(states, forces, params)
+        k2 = self.dynamics_batch(states + 0.5 * dt * k1, forces, params)
+        k3 = self.dynamics_batch(states + 0.5 * dt * k2, forces, params)
+        k4 = self.dynamics_batch(states + dt * k3, forces, params)
+
+        # Cộng dồn tại chỗ để tránh tạo thêm mảng tạm
+        k2 += k3
+        k2 *= 2.0
+        k1 += k2
+        k1 += k4
+        k1 *= dt / 6.0
+        return states + k1
+
+
+class FastCartPole:
+    """
+    Nhân tích phân RK4 vô hướng cho một hệ, không cấp phát mảng trong mỗi bước.
+    - Các tích hằng số ((M+m), m*l, m*g*l, J, ...) được tính trước và chỉ tính lại
+      khi PhysParam thay đổi (theo PhysParam.version).
+    - Toàn bộ phép tính dùng số thực Python; kết quả ghi vào bộ đệm đầu ra dùng lại.
+    Cùng phương trình với CartPoleSystem.dynamics()/rk4_step() nhưng thứ tự phép tính khác,
+    nên kết quả chỉ khớp tới sai số làm tròn (~1e-15), KHÔNG trùng từng bit: so sánh hồi quy
+    giữa hai cách tích phân phải dùng dung sai (np.allclose), không dùng ==.
+    """
+    __slots__ = ('p', '_version', 'Mm', 'ml', 'mgl', 'J', 'd', 'MmJ', 'ml2', 'out')
+
+    def __init__(self, params):
+        self.p = params
+        self._version = None
+        self.out = np.zeros(4)
+        self._refresh()
+
+    def _refresh(self):
+        p = self.p
+        m = p.m_total
+        self.Mm = p.M + m
+        self.ml = m * p.l_cm
+        self.mgl = self.ml * p.g
+        self.J = p.J
+        self.d = p.d
+        self.MmJ = self.Mm * p.J
+        self.ml2 = self.ml * self.ml
+        self._version = p.version
+
+    def _acc(self, theta, theta_dot, force):
+        # Trả về (theta_ddot, x_ddot) - giải Cramer như dynamics()
+        s = math.sin(theta)
+        c = math.cos(theta)
+        ml_c = self.ml * c
+        D = self.MmJ - self.ml2 * c * c
+        rhs_1 = force + self.ml * s * theta_dot * theta_dot
+        rhs_2 = self.mgl * s
+        return (self.Mm * rhs_2 - rhs_1 * ml_c) / D, (rhs_1 * self.J - rhs_2 * ml_c) / D
+
+    def step_tuple(self, theta, theta_dot, x, x_dot, force, dt):
+        """Một bước RK4 trên số thực, trả về tuple (theta, theta_dot, x, x_dot)."""
+        if self._version != self.p.version:
+            self._refresh()
+        acc = self._acc
+        d = self.d
+        h2 = 0.5 * dt
+
+        # Ma sát nhớt của xe gộp vào lực ở từng nấc: force - d * x_dot
+        a1, b1 = acc(theta, theta_dot, force - d * x_dot)
+        w2 = theta_dot + h2 * a1
+        v2 = x_dot + h2 * b1
+        a2, b2 = acc(theta + h2 * theta_dot, w2, force - d * v2)
+        w3 = theta_dot + h2 * a2
+        v3 = x_dot + h2 * b2
+        a3, b3 = acc(theta + h2 * w2, w3, force - d * v3)
+        w4 = theta_dot + dt * a3
+        v4 = x_dot + dt * b3
+        a4, b4 = acc(theta + dt * w3, w4, force - d * v4)
+
+        k = dt / 6.0
+        return (theta + k * (theta_dot + 2 * w2 + 2 * w3 + w4),
+                theta_dot + k * (a1 + 2 * a2 + 2 * a3 + a4),
+                x + k * (x_dot + 2 * v2 + 2 * v3 + v4),
+                x_dot + k * (b1 + 2 * b2 + 2 * b3 + b4))
+
+    def step(self, state, force, dt, out=None):
+        """
+        Một bước RK4, ghi kết quả vào `out` (mặc định self.out - bị ghi đè ở bước sau,
+        cần copy nếu muốn giữ). out có thể chính là state (cập nhật tại chỗ).
+        """
+        if out is None:
+            out = self.out
+        th, w, x, v = state.tolist() if isinstance(state, np.ndarray) else state
+        out[0], out[1], out[2], out[3] = self.step_tuple(th, w, x, v, force, dt)
+        return out
+
+
+def batch_params(params_list):
+    """
+    Gom danh sách các PhysParam thành dict mảng (N,) để truyền vào
+    CartPoleSystem.dynamics_batch() / rk4_step_batch() khi mỗi hàng có thông số riêng.
+    """
+    keys = ('M', 'm_total', 'l_cm', 'J', 'g', 'd')
+    return {k: np.array([getattr(p, k) for p in params_list], dtype=float) for k in keys}
+
+
+# ----------------------------------------------------------------------
+# XE + CHUỖI N KHÂU (con lắc ngược đôi, ba, ...)
+# ----------------------------------------------------------------------
+def _chain_accelerations(sin_t, cos_t, theta_dot, x_dot, force, links, M, g, d):
+    """
+    Gia tốc (theta_ddot_1..N, x_ddot) của xe + N khâu bằng đệ quy vật thể khớp nối
+    (articulated body) phẳng, O(N) thay vì lập và giải ma trận khối lượng N+1 x N+1.
+    Dùng được cho cả số thực (một hệ) lẫn mảng NumPy (N hệ cùng lúc): chỉ có + - * /.
+
+    Ký hiệu cho khâu i: e = (sin, cos) hướng dọc khâu, t = (cos, -sin) = de/dtheta,
+    A_i là gia tốc khớp dưới P_i, F_i là lực khâu i-1 (hoặc xe) tác dụng lên khâu i.
+    1. Quét ngược (i = N..1): phần chuỗi từ khâu i trở lên thỏa F_i = K_i A_i + b_i
+       (K_i: quán tính khớp nối 2x2). Phương trình moment quanh P_i của khâu i
+           -J theta_ddot + m l_cm (e x A_i) = -L e x F_{i+1} - m g l_cm sin
+       với F_{i+1} = K_{i+1} (A_i + L (theta_ddot t - theta_dot^2 e)) + b_{i+1}
+       cho theta_ddot = (h . A_i + beta) / D; thay vào phương trình Newton của khâu i
+       được K_i, b_i.
+    2. Xe: M x_ddot = F - d x_dot - F_1,x với A_1 = (x_ddot, 0).
+    3. Quét xuôi (i = 1..N): theta_ddot_i, rồi A_{i+1} = A_i + L (theta_ddot t - theta_dot^2 e).
+    """
+    n = len(links)
+    kxx = kxy = kyx = kyy = 0.0
+    bx = by = 0.0
+    coeffs = [None] * n
+    for i in range(n - 1, -1, -1):
+        link = links[i]
+        m, L, lc, J = link.m, link.L, link.l_cm, link.J
+        s, c, w = sin_t[i], cos_t[i], theta_dot[i]
+        w2 = w * w
+        # K' e, K' t, K'^T v với v = (-c, s) (e x a = v . a)
+        Ke_x = kxx * s + kxy * c
+        Ke_y = kyx * s + kyy * c
+        Kt_x = kxx * c - kxy * s
+        Kt_y = kyx * c - kyy * s
+        D = J - L * L * (s * Kt_y - c * Kt_x)
+        h_x = -m * lc * c + L * (-kxx * c + kyx * s)
+        h_y = m * lc * s + L * (-kxy * c + kyy * s)
+        beta = m * lc * g * s - L * L * w2 * (s * Ke_y - c * Ke_x) + L * (s * by - c * bx)
+        coeffs[i] = (h_x, h_y, beta, D)
+
+        # F_i = m (A_i + l_cm (theta_ddot t - w^2 e)) + (0, m g) + F_{i+1}
+        q_x = m * lc * c + L * Kt_x
+        q_y = -m * lc * s + L * Kt_y
+        qd_x = q_x / D
+        qd_y = q_y / D
+        kxx, kxy, kyx, kyy = (m + kxx + qd_x * h_x, kxy + qd_x * h_y,
+                              kyx + qd_y * h_x, m + kyy + qd_y * h_y)
+        bx, by = (qd_x * beta - m * lc * w2 * s - L * w2 * Ke_x + bx,
+                  qd_y * beta - m * lc * w2 * c + m * g - L * w2 * Ke_y + by)
+
+    x_ddot = (force - d * x_dot - bx) / (M + kxx)
+
+    theta_ddot = [None] * n
+    ax, ay = x_ddot, 0.0
+    for i in range(n):
+        h_x, h_y, beta, D = coeffs[i]
+        a = (h_x * ax + h_y * ay + beta) / D
+        theta_ddot[i] = a
+        L = links[i].L
+        s, c, w = sin_t[i], cos_t[i], theta_dot[i]
+        w2 = w * w
+        ax = ax + L * (a * c - w2 * s)
+        ay = ay + L * (-a * s - w2 * c)
+    return theta_ddot, x_ddot
+
+
+class NLinkCartPole:
+    """
+    Xe + chuỗi N khâu cứng nối khớp quay tự do (conf.NLinkParam).
+    Cùng giao diện với CartPoleSystem (dynamics, rk4_step, *_batch, linearize,
+    get_state_space_matrices) nên dùng trực tiếp được với LQRController.
+    Vector trạng thái: [theta_1, theta_dot_1, ..., theta_N, theta_dot_N, x, x_dot].
+    Chi phí mỗi lần tính đạo hàm tăng tuyến tính theo N (xem _chain_accelerations).
+    """
+    def __init__(self, params):
+        self.p = params     # NLinkParam
+
+    @property
+    def n_states(self):
+        return 2 * self.p.n + 2
+
+    def dynamics(self, state, force):
+        """
+        Đạo hàm trạng thái phi tuyến.
+        Output: [theta_dot_1, theta_ddot_1, ..., theta_dot_N, theta_ddot_N, x_dot, x_ddot]
+        """
+        p = self.p
+        values = state.tolist() if isinstance(state, np.ndarray) else list(state)
+        thetas = values[0:-2:2]
+        theta_dot = values[1:-2:2]
+        x_dot = values[-1]
+        sin_t = [math.sin(th) for th in thetas]
+        cos_t = [math.cos(th) for th in thetas]
+        theta_ddot, x_ddot = _chain_accelerations(sin_t, cos_t, theta_dot, x_dot, force,
+                                                  p.links, p.M, p.g, p.d)
+        out = np.empty(len(values))
+        out[0:-2:2] = theta_dot
+        out[1:-2:2] = theta_ddot
+        out[-2] = x_dot
+        out[-1] = x_ddot
+        return out
+
+    def rk4_step(self, state, force, dt):
+        """RK4 giữ lực không đổi trong một bước, như CartPoleSystem.rk4_step()."""
+        k1 = self.dynamics(state, force)
+        k2 = self.dynamics(state + 0.5 * dt * k1, force)
+        k3 = self.dynamics(state + 0.5 * dt * k2, force)
+        k4 = self.dynamics(state + dt * k3, force)
+        return state + (dt / 6.0) * (k1 + 2*k2 + 2*k3 + k4)
+
+    def dynamics_batch(self, states, forces, params=None):
+        """
+        Phiên bản vector hóa cho N hệ: states (N, 2n+2), forces scalar hoặc (N,).
+        params được bỏ qua (mọi hàng dùng self.p), giữ để cùng chữ ký với CartPoleSystem.
+        """
+        p = self.p
+        thetas = states[:, 0:-2:2]
+        sin_t = np.sin(thetas).T
+        cos_t = np.cos(thetas).T
+        theta_dot = states[:, 1:-2:2]
+        theta_ddot, x_ddot = _chain_accelerations(sin_t, cos_t, theta_dot.T, states[:, -1], forces,
+                                                  p.links, p.M, p.g, p.d)
+        d_states = np.empty_like(states)
+        d_states[:, 0:-2:2] = theta_dot
+        d_states[:, 1:-2:2] = np.stack(theta_ddot, axis=1)
+        d_states[:, -2] = states[:, -1]
+        d_states[:, -1] = x_ddot
+        return d_states
+
+    def rk4_step_batch(self, states, forces, dt, params=None):
+        """RK4 cho N hệ cùng lúc; xem CartPoleSystem.rk4_step_batch()."""
+        states = np.asarray(states, dtype=float)
+        k1 = self.dynamics_batch(states, forces, params)
+        k2 = self.dynamics_batch(states + 0.5 * dt * k1, forces, params)
+        k3 = self.dynamics_batch(states + 0.5 * dt * k2, forces, params)
+        k4 = self.dynamics_batch(states + dt * k3, forces, params)
+        k2 += k3
+        k2 *= 2.0
+        k1 += k2
+        k1 += k4
+        k1 *= dt / 6.0
+        return states + k1
+
+    def linearize(self, state=None, force=0.0, eps=1e-6):
+        """
+        Jacobian số (sai phân trung tâm) của dynamics() tại trạng thái `state`
+        (mặc định: mọi khâu thẳng đứng, đứng yên). Trả về A (2n+2 x 2n+2), B (2n+2 x 1).
+        Các cột được tính cùng lúc bằng dynamics_batch().
+        """
+        ns = self.n_states
+        x0 = np.zeros(ns) if state is None else np.asarray(state, dtype=float)
+        E = eps * np.eye(ns)
+        X = np.vstack([x0 + E, x0 - E, x0, x0])
+        F = np.full(2 * ns + 2, float(force))
+        F[-2] += eps
+        F[-1] -= eps
+        dX = self.dynamics_batch(X, F)
+        A = ((dX[:ns] - dX[ns:2 * ns]) / (2 * eps)).T
+        B = ((dX[-2] - dX[-1]) / (2 * eps)).reshape(ns, 1)
+        return A, B
+
+    def get_state_space_matrices(self):
+        """A, B tuyến tính hóa quanh điểm cân bằng thẳng đứng (mọi khâu hướng lên)."""
+        return self.linearize()
@@ -0,0 +1,211 @@
+# recorder.py - Ghi dữ liệu chạy vào file nhị phân ánh xạ bộ nhớ (memmap) và phát lại
+#
+# Cấu trúc file (.cplog, little-endian):
+#   Header HEADER_SIZE byte:
+#       magic 'CPLOG\0\0\0' | version u32 | header_size u32 | n_fields u32 | pad u32 | count u64
+#       PhysParam: M, m_pole, m_ball, L, g, d, m_total, l_cm, J, dt (10 x f64) | K (4 x f64)
+#   Bản ghi cố định: n_fields x f64 = [t, theta, theta_dot, x, x_dot, u, manual_force]
+# Đọc lại bằng np.memmap: truy cập hàng triệu mẫu không cần sao chép (zero-copy).
+
+import struct
+import time
+
+import numpy as np
+
+MAGIC = b'CPLOG\x00\x00\x00'
+VERSION = 1
+HEADER_SIZE = 256
+FIELDS = ('t', 'theta', 'theta_dot', 'x', 'x_dot', 'u', 'manual')
+PARAM_FIELDS = ('M', 'm_pole', 'm_ball', 'L', 'g', 'd', 'm_total', 'l_cm', 'J', 'dt')
+
+_HEAD = struct.Struct('<8sIIIIQ')
+_PARAMS = struct.Struct('<%dd' % (len(PARAM_FIELDS) + 4))
+_COUNT_OFFSET = 24
+
+
+class RunRecorder:
+    """
+    Ghi nối tiếp bản ghi vào file memmap. File được mở rộng theo từng khối (chunk) bản ghi.
+    Số bản ghi trong header được cập nhật mỗi lần mở rộng, khi đóng và định kỳ mỗi `sync_every`
+    bản ghi (dữ liệu được đẩy xuống file trước) -> nếu chương trình chết / mất điện, RunLog vẫn
+    đọc được gần hết phiên chạy (mất tối đa sync_every bản ghi cuối, ~1 s ở 1 kHz).
+    """
+    def __init__(self, path, phys_param, K=None, chunk=65536, sync_every=1000):
+        self.path = path
+        self.chunk = chunk
+        self.sync_every = sync_every
+        self.count = 0
+        self._next_sync = sync_every
+        self.n_fields = len(FIELDS)
+
+        K = np.zeros(4) if K is None else np.asarray(K, dtype=float).ravel()
+        params = [float(getattr(phys_param, k)) for k in PARAM_FIELDS]
+        header = bytearray(HEADER_SIZE)
+        _HEAD.pack_into(header, 0, MAGIC, VERSION, HEADER_SIZE, self.n_fields, 0, 0)
+        _PARAMS.pack_into(header, _HEAD.size, *params, *K)
+
+        self._file = open(path, 'w+b')
+        self._file.write(header)
+        self._capacity = 0
+        self._mm = None
+        self._grow()
+
+    def _grow(self):
+        if self._mm is not None:
+            self._mm.flush()
+            del self._buf, self._mm
+        self._capacity += self.chunk
+        self._file.truncate(HEADER_SIZE + self._capacity * self.n_fields * 8)
+        self._write_count()
+        self._mm = np.memmap(self._file, dtype='<f8', mode='r+', offset=HEADER_SIZE,
+                             shape=(self._capacity, self.n_fields))
+        # View ndarray thường: ghi từng hàng nhanh hơn qua lớp con memmap
+        self._buf = self._mm.view(np.ndarray)
+
+    def _write_count(self):
+        self._file.seek(_COUNT_OFFSET)
+        self._file.write(struct.pack('<Q', self.count))
+        self._file.flush()
+
+    def append(self, t, state, u, manual=0.0):
+        if self.count >= self._capacity:
+            self._grow()
+        s0, s1, s2, s3 = state
+        self._buf[self.count] = (t, s0, s1, s2, s3, u, manual)
+        self.count += 1
+        if self.count >= self._next_sync:
+            self.sync()
+
+    def sync(self):
+        """Đẩy dữ liệu đã ghi xuống file rồi mới cập nhật số bản ghi trong header."""
+        self._mm.flush()
+        self._write_count()
+        self._next_sync = self.count + self.sync_every
+
+    def close(self):
+        if self._file is None:
+            return
+        self._mm.flush()
+        del self._buf, self._mm
+        self._mm = None
+        # Cắt bỏ phần cấp phát dư
+        self._file.truncate(HEADER_SIZE + self.count * self.n_fields * 8)
+        self._write_count()
+        self._file.close()
+        self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class RunLog:
+    """Đọc file .cplog qua memmap (chỉ đọc). Các thuộc tính cột là view, không sao chép."""
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            header = f.read(HEADER_SIZE)
+        magic, version, header_size, n_fields, _, count = _HEAD.unpack_from(header, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{path}: không phải file log cart-pole")
+        if version != VERSION:
+            raise ValueError(f"{path}: phiên bản log {version} không hỗ trợ")
+        values = _PARAMS.unpack_from(header, _HEAD.size)
+        self.params = dict(zip(PARAM_FIELDS, values[:len(PARAM_FIELDS)]))
+        self.K = np.array(values[len(PARAM_FIELDS):]).reshape(1, 4)
+        self.count = count
+        if count:
+            self.data = np.memmap(path, dtype='<f8', mode='r', offset=header_size, shape=(count, n_fields))
+        else:
+            self.data = np.empty((0, n_fields))
+
+    def __len__(self):
+        return self.count
+
+    @property
+    def t(self):
+        return self.data[:, 0]
+
+    @property
+    def states(self):
+        return self.data[:, 1:5]
+
+    @property
+    def u(self):
+        return self.data[:, 5]
+
+    @property
+    def manual(self):
+        return self.data[:, 6]
+
+    @property
+    def duration(self):
+        return float(self.data[-1, 0] - self.data[0, 0]) if self.count else 0.0
+
+    def index_at(self, t):
+        """Chỉ số mẫu cuối cùng có thời điểm <= t (tìm nhị phân)."""
+        i = int(np.searchsorted(self.t, t, side='right')) - 1
+        return min(max(i, 0), self.count - 1)
+
+    def phys_param(self):
+        """Dựng lại PhysParam từ header."""
+        from conf import PhysParam
+        p = PhysParam()
+        for k, v in self.params.items():
+            setattr(p, k, v)
+        return p
+
+
+class ReplayPlayer:
+    """
+    Ánh xạ đồng hồ thực -> vị trí trong log với hệ số tốc độ bất kỳ, hỗ trợ tua (seek) và tạm dừng.
+    Không phụ thuộc Tk: GUI chỉ gọi current() ở mỗi khung hình.
+    """
+    def __init__(self, log, speed=1.0):
+        self.log = log
+        self.speed = speed
+        self.t_start = float(log.t[0]) if len(log) else 0.0
+        self.t_end = float(log.t[-1]) if len(log) else 0.0
+        self._t_base = self.t_start
+        self._wall_base = None  # None = đang tạm dừng
+
+    @property
+    def playing(self):
+        return self._wall_base is not None
+
+    def play(self):
+        if self._wall_base is None:
+            self._wall_base = time.perf_counter()
+
+    def pause(self):
+        self._t_base = self.position()
+        self._wall_base = None
+
+    def set_speed(self, speed):
+        self._t_base = self.position()
+        if self._wall_base is not None:
+            self._wall_base = time.perf_counter()
+        self.speed = speed
+
+    def seek(self, t):
+        self._t_base = min(max(t, self.t_start), self.t_end)
+        if self._wall_base is not None:
+            self._wall_base = time.perf_counter()
+
+    def position(self):
+        if self._wall_base is None:
+            return self._t_base
+        t = self._t_base + (time.perf_counter() - self._wall_base) * self.speed
+        return min(t, self.t_end)
+
+    @property
+    def finished(self):
+        return self.position() >= self.t_end
+
+    def current(self):
+        """(t, state, u) tại vị trí phát hiện tại."""
+        i = self.log.index_at(self.position())
+        row = self.log.data[i]
+        return float(row[0]), np.array(row[1:5]), float(row[5])
@@ -0,0 +1,381 @@
+# roa.py - Bản đồ miền hút (Region of Attraction) của bộ LQR trên mô hình phi tuyến
+# Quét lưới dày hoặc mẫu ngẫu nhiên các trạng thái đầu (theta, theta_dot, x, x_dot),
+# chạy vòng kín u = -K (x - target) bằng CartPoleSystem.rk4_step_batch, dừng sớm từng điểm khi
+# đã đổ (|theta| > fall_angle, vượt đường ray) hoặc đã vào vùng lân cận điểm cân bằng.
+# Kết quả được lưu đệm (npz) theo khóa băm của thông số vật lý, K và cấu hình quét.
+#
+# Cách dùng:
+#   python roa.py --theta -1.2 1.2 1001 --theta-dot -8 8 1001 --png roa.png
+#   python roa.py --random 200000 --theta -1 1 --theta-dot -6 6 --x -0.5 0.5 --x-dot -2 2
+
+import argparse
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from conf import PhysParam
+from plant import CartPoleSystem
+from controller import LQRController, DEFAULT_Q, DEFAULT_R
+
+# Mã kết quả từng điểm
+DIVERGED = 0
+STABLE = 1
+UNDECIDED = 2   # Hết thời gian mô phỏng mà chưa đổ, chưa vào vùng cân bằng
+
+AXES = ('theta', 'theta_dot', 'x', 'x_dot')
+DEFAULT_TOL = (0.01, 0.05, 0.01, 0.05)  # Vùng lân cận điểm cân bằng coi là đã hội tụ
+DEFAULT_CACHE_DIR = ".roa_cache"
+CACHE_VERSION = 1   # Tăng khi thay đổi thuật toán phân loại để bộ đệm cũ tự mất hiệu lực
+
+
+def classify(p, X0, K, duration=10.0, dt=None, fall_angle=np.pi / 2, x_limit=None,
+             u_max=None, tol=DEFAULT_TOL, check_every=5):
+    """
+    Phân loại N trạng thái đầu X0 (N, 4) dưới luật u = -K (x - target).
+    Mỗi check_every bước, các điểm đã quyết định (đổ / hội tụ) bị loại khỏi lô
+    nên chi phí tỷ lệ với số điểm còn "sống", không phải với N * số bước.
+    Trả về (outcome int8 (N,), decide_time float32 (N,) - nan nếu UNDECIDED).
+    """
+    plant = CartPoleSystem(p)
+    if dt is None:
+        dt = p.dt
+    n = int(round(duration / dt))
+    K = np.asarray(K, dtype=float).ravel()
+    target = p.target_state
+    tol = np.asarray(tol, dtype=float)
+
+    N = len(X0)
+    outcome = np.full(N, UNDECIDED, dtype=np.int8)
+    decide_time = np.full(N, np.nan, dtype=np.float32)
+    idx = np.arange(N)
+    X = np.array(X0, dtype=float)
+
+    for k in range(n):
+        u = -((X - target) @ K)
+        if u_max is not None:
+            np.clip(u, -u_max, u_max, out=u)
+        X = plant.rk4_step_batch(X, u, dt)
+
+        if (k + 1) % check_every and k != n - 1:
+            continue
+        with np.errstate(invalid='ignore'):
+            bad = ~np.isfinite(X).all(axis=1) | (np.abs(X[:, 0]) > fall_angle)
+            if x_limit is not None:
+                bad |= np.abs(X[:, 2]) > x_limit
+            good = ~bad & (np.abs(X - target) <= tol).all(axis=1)
+        done = bad | good
+        if done.any():
+            t = (k + 1) * dt
+            outcome[idx[bad]] = DIVERGED
+            outcome[idx[good]] = STABLE
+            decide_time[idx[done]] = t
+            keep = ~done
+            idx = idx[keep]
+            X = X[keep]
+            if not len(idx):
+                break
+    return outcome, decide_time
+
+
+def _classify_chunk(phys, target, X0, K, kwargs):
+    p = PhysParam()
+    for k, v in phys.items():
+        setattr(p, k, v)
+    p.update_derived()
+    p.target_state = np.array(target)
+    return classify(p, X0, K, **kwargs)
+
+
+def _phys_dict(p):
+    return {k: float(getattr(p, k)) for k in ('M', 'm_pole', 'm_ball', 'L', 'g', 'd', 'dt')}
+
+
+class RoAResult:
+    """
+    Kết quả quét. Chế độ lưới: axes là danh sách 4 mảng giá trị (mảng 1 phần tử = cố định),
+    outcome/decide_time có hình dạng lưới. Chế độ ngẫu nhiên: axes = None, points (N, 4).
+    """
+    def __init__(self, outcome, decide_time, meta, axes=None, points=None):
+        self.outcome = outcome
+        self.decide_time = decide_time
+        self.meta = meta
+        self.axes = axes
+        self.points = points
+
+    @property
+    def is_grid(self):
+        return self.axes is not None
+
+    def save(self, path):
+        arrays = {'outcome': self.outcome, 'decide_time': self.decide_time,
+                  'meta': np.array(json.dumps(self.meta))}
+        if self.is_grid:
+            for name, a in zip(AXES, self.axes):
+                arrays['axis_' + name] = a
+        else:
+            arrays['points'] = self.points
+        # Ghi file tạm rồi đổi tên: tiến trình khác không bao giờ đọc phải file ghi dở
+        tmp = path + ".tmp.npz"
+        np.savez_compressed(tmp, **arrays)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as f:
+            meta = json.loads(str(f['meta']))
+            if 'points' in f:
+                return cls(f['outcome'], f['decide_time'], meta, points=f['points'])
+            axes = [f['axis_' + name] for name in AXES]
+            return cls(f['outcome'], f['decide_time'], meta, axes=axes)
+
+
+def cache_key(meta):
+    """Khóa băm nội dung: thông số vật lý, K, lưới/mẫu, tiêu chí phân loại."""
+    blob = json.dumps(meta, sort_keys=True).encode()
+    return hashlib.sha256(blob).hexdigest()[:24]
+
+
+def compute_roa(p, K, axes=None, points=None, duration=10.0, fall_angle=np.pi / 2, x_limit=None,
+                u_max=None, tol=DEFAULT_TOL, workers=None, chunk_size=50000, cache_dir=DEFAULT_CACHE_DIR,
+                verbose=True):
+    """
+    Quét lưới (axes: 4 mảng giá trị) hoặc tập điểm (points: (N, 4)) song song trên mọi lõi.
+    cache_dir: thư mục lưu đệm (None -> không dùng bộ đệm).
+    """
+    if (axes is None) == (points is None):
+        raise ValueError("Cần đúng một trong hai: axes (lưới) hoặc points (mẫu)")
+    K = np.asarray(K, dtype=float).ravel()
+    kwargs = {'duration': duration, 'fall_angle': fall_angle, 'x_limit': x_limit,
+              'u_max': u_max, 'tol': list(tol)}
+
+    if axes is not None:
+        axes = [np.atleast_1d(np.asarray(a, dtype=float)) for a in axes]
+        shape = tuple(len(a) for a in axes)
+        grid_id = [a.tolist() if len(a) <= 3 else hashlib.sha256(a.tobytes()).hexdigest() for a in axes]
+    else:
+        points = np.asarray(points, dtype=float)
+        shape = (len(points),)
+        grid_id = hashlib.sha256(points.tobytes()).hexdigest()
+
+    meta = {'version': CACHE_VERSION, 'phys': _phys_dict(p), 'target': p.target_state.tolist(),
+            'K': K.tolist(), 'grid': grid_id, **kwargs}
+    path = None
+    if cache_dir is not None:
+        os.makedirs(cache_dir, exist_ok=True)
+        path = os.path.join(cache_dir, f"roa_{cache_key(meta)}.npz")
+        if os.path.exists(path):
+            if verbose:
+                print(f"Dùng kết quả đã lưu đệm: {path}")
+            return RoAResult.load(path)
+
+    if axes is not None:
+        mesh = np.meshgrid(*axes, indexing='ij')
+        X0 = np.column_stack([m.ravel() for m in mesh])
+    else:
+        X0 = points
+
+    t0 = time.perf_counter()
+    N = len(X0)
+    outcome = np.empty(N, dtype=np.int8)
+    decide_time = np.empty(N, dtype=np.float32)
+    starts = range(0, N, chunk_size)
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as pool:
+        futures = [pool.submit(_classify_chunk, meta['phys'], meta['target'], X0[i:i + chunk_size], K, kwargs)
+                   for i in starts]
+        for i, f in zip(starts, futures):
+            o, d = f.result()
+            outcome[i:i + len(o)] = o
+            decide_time[i:i + len(o)] = d
+    if verbose:
+        print(f"Đã phân loại {N:,} điểm trong {time.perf_counter() - t0:.1f}s")
+
+    if axes is not None:
+        result = RoAResult(outcome.reshape(shape), decide_time.reshape(shape), meta, axes=axes)
+    else:
+        result = RoAResult(outcome, decide_time, meta, points=X0)
+    if path is not None:
+        result.save(path)
+    return result
+
+
+def boundary_mask(stable):
+    """Ô ổn định có ít nhất một ô kề (theo từng trục lưới) không ổn định."""
+    mask = np.zeros_like(stable)
+    for ax in range(stable.ndim):
+        if stable.shape[ax] < 2:
+            continue
+        diff = np.diff(stable.astype(np.int8), axis=ax) != 0
+        lo = [slice(None)] * stable.ndim
+        hi = [slice(None)] * stable.ndim
+        lo[ax] = slice(0, -1)
+        hi[ax] = slice(1, None)
+        mask[tuple(lo)] |= diff
+        mask[tuple(hi)] |= diff
+    return mask & stable
+
+
+def roa_stats(result):
+    """
+    Thống kê miền hút:
+      stable_fraction, diverged, undecided, thời gian quyết định (p50/p99) cho điểm ổn định,
+      phạm vi ổn định theo từng trục, và (lưới) số ô biên, tỷ lệ biên / ô ổn định,
+      thể tích (diện tích) miền ổn định theo đơn vị vật lý.
+    """
+    out = result.outcome
+    stable = out == STABLE
+    n = out.size
+    stats = {
+        'points': int(n),
+        'stable_fraction': float(stable.mean()),
+        'diverged': int((out == DIVERGED).sum()),
+        'undecided': int((out == UNDECIDED).sum()),
+    }
+    if not result.is_grid and n:
+        # Sai số chuẩn của tỷ lệ ước lượng bằng Monte Carlo
+        f = stats['stable_fraction']
+        stats['stable_fraction_stderr'] = float(np.sqrt(f * (1 - f) / n))
+    if stable.any():
+        t = result.decide_time[stable]
+        stats['settle_time'] = {'p50': float(np.percentile(t, 50)), 'p99': float(np.percentile(t, 99))}
+
+    extent = {}
+    if result.is_grid:
+        for ax, (name, a) in enumerate(zip(AXES, result.axes)):
+            if len(a) < 2:
+                continue
+            other = tuple(i for i in range(out.ndim) if i != ax)
+            any_stable = stable.any(axis=other) if other else stable
+            if any_stable.any():
+                extent[name] = [float(a[any_stable].min()), float(a[any_stable].max())]
+        border = boundary_mask(stable)
+        cell = 1.0
+        for a in result.axes:
+            if len(a) >= 2:
+                cell *= (a[-1] - a[0]) / (len(a) - 1)
+        stats['boundary_cells'] = int(border.sum())
+        stats['boundary_fraction'] = float(border.sum() / max(stable.sum(), 1))
+        stats['stable_volume'] = float(stable.sum() * cell)
+        # Điểm ổn định chạm mép lưới -> lưới chưa bao hết miền hút
+        edge = np.zeros_like(stable)
+        for ax in range(out.ndim):
+            if out.shape[ax] >= 2:
+                sl = [slice(None)] * out.ndim
+                for i in (0, -1):
+                    sl[ax] = i
+                    edge[tuple(sl)] = True
+        stats['touches_grid_edge'] = bool((stable & edge).any())
+    elif stable.any():
+        pts = result.points[stable]
+        for i, name in enumerate(AXES):
+            extent[name] = [float(pts[:, i].min()), float(pts[:, i].max())]
+    stats['extent'] = extent
+    return stats
+
+
+def render(result, path, dpi=120):
+    """
+    Vẽ bản đồ ổn định ra ảnh. Lưới 2 trục thay đổi: ảnh kết quả + đường biên;
+    nhiều hơn 2 trục: tỷ lệ ổn định chiếu lên 2 trục thay đổi đầu tiên.
+    Mẫu ngẫu nhiên: tán xạ trên (theta, theta_dot).
+    """
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+
+    fig, ax = plt.subplots(figsize=(8, 6))
+    if result.is_grid:
+        varying = [i for i, a in enumerate(result.axes) if len(a) >= 2]
+        if len(varying) < 2:
+            raise ValueError("Cần ít nhất 2 trục thay đổi để vẽ bản đồ")
+        i, j = varying[:2]
+        # Bỏ các trục cố định, lấy trung bình theo các trục thay đổi còn lại
+        stable = (result.outcome == STABLE).reshape([len(result.axes[k]) for k in varying]).astype(float)
+        other = tuple(range(2, stable.ndim))
+        frac = stable.mean(axis=other) if other else stable
+        a_i, a_j = result.axes[i], result.axes[j]
+        im = ax.imshow(frac.T, origin='lower', aspect='auto', cmap='RdYlGn', vmin=0, vmax=1,
+                       extent=(a_i[0], a_i[-1], a_j[0], a_j[-1]), interpolation='nearest')
+        ax.contour(a_i, a_j, frac.T, levels=[0.5], colors='k', linewidths=0.8)
+        fig.colorbar(im, ax=ax, label="tỷ lệ ổn định" if other else "ổn định")
+        ax.set_xlabel(AXES[i])
+        ax.set_ylabel(AXES[j])
+    else:
+        pts = result.points
+        stable = result.outcome == STABLE
+        ax.scatter(pts[~stable, 0], pts[~stable, 1], s=1, c='tab:red', label="đổ / chưa quyết định")
+        ax.scatter(pts[stable, 0], pts[stable, 1], s=1, c='tab:green', label="ổn định")
+        ax.set_xlabel(AXES[0])
+        ax.set_ylabel(AXES[1])
+        ax.legend(loc='upper right', markerscale=8)
+
+    s = roa_stats(result)
+    ax.set_title(f"Miền hút LQR: {s['stable_fraction']:.1%} ổn định trên {s['points']:,} điểm")
+    fig.tight_layout()
+    fig.savefig(path, dpi=dpi)
+    plt.close(fig)
+
+
+def _axis(values, n_default):
+    """[v] -> cố định; [lo, hi] -> n_default điểm; [lo, hi, n] -> n điểm."""
+    if len(values) == 1:
+        return np.array(values, dtype=float)
+    n = int(values[2]) if len(values) > 2 else n_default
+    return np.linspace(values[0], values[1], n)
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Bản đồ miền hút (RoA) của bộ LQR")
+    ap.add_argument("--theta", type=float, nargs='+', default=[-1.2, 1.2, 401], help="v | lo hi [n]")
+    ap.add_argument("--theta-dot", type=float, nargs='+', default=[-8.0, 8.0, 401], help="v | lo hi [n]")
+    ap.add_argument("--x", type=float, nargs='+', default=[0.0], help="v | lo hi [n]")
+    ap.add_argument("--x-dot", type=float, nargs='+', default=[0.0], help="v | lo hi [n]")
+    ap.add_argument("--n", type=int, default=101, help="Số điểm mặc định cho trục chỉ có lo hi")
+    ap.add_argument("--random", type=int, default=None, help="Lấy N mẫu đều trong hộp thay cho lưới")
+    ap.add_argument("--seed", type=int, default=None)
+    ap.add_argument("--Q", type=float, nargs=4, default=DEFAULT_Q)
+    ap.add_argument("--R", type=float, default=DEFAULT_R)
+    ap.add_argument("--discrete", action="store_true", help="LQR rời rạc (ZOH)")
+    ap.add_argument("-t", "--duration", type=float, default=10.0)
+    ap.add_argument("--fall-angle", type=float, default=np.pi / 2)
+    ap.add_argument("--x-limit", type=float, default=None, help="Vượt |x| này coi như thất bại (m)")
+    ap.add_argument("--u-max", type=float, default=None, help="Bão hòa lực (N)")
+    ap.add_argument("--workers", type=int, default=None)
+    ap.add_argument("--cache-dir", default=DEFAULT_CACHE_DIR)
+    ap.add_argument("--no-cache", action="store_true")
+    ap.add_argument("--png", default=None, help="Ghi ảnh bản đồ ổn định")
+    ap.add_argument("--json", default=None, help="Ghi thống kê ra file JSON")
+    args = ap.parse_args(argv)
+
+    p = PhysParam()
+    ctrl = LQRController(CartPoleSystem(p), discrete=args.discrete)
+    K = ctrl.compute_gains(args.Q, args.R, verbose=False)
+
+    ranges = [args.theta, args.theta_dot, args.x, args.x_dot]
+    axes = points = None
+    if args.random:
+        rng = np.random.default_rng(args.seed)
+        points = np.column_stack([rng.uniform(r[0], r[1], args.random) if len(r) > 1 else np.full(args.random, r[0])
+                                  for r in ranges])
+    else:
+        axes = [_axis(r, args.n) for r in ranges]
+
+    result = compute_roa(p, K, axes=axes, points=points, duration=args.duration, fall_angle=args.fall_angle,
+                         x_limit=args.x_limit, u_max=args.u_max, workers=args.workers,
+                         cache_dir=None if args.no_cache else args.cache_dir)
+    stats = roa_stats(result)
+    print(json.dumps(stats, indent=2))
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(stats, f, indent=2)
+    if args.png:
+        render(result, args.png)
+        print(f"Đã lưu ảnh: {args.png}")
+    return 0
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,453 @@
+# scenario.py - Kịch bản mô phỏng khai báo bằng JSON + bộ chạy cả thư mục có lưu đệm kết quả
+# Một kịch bản mô tả: thông số vật lý, bộ điều khiển (loại, trọng số Q/R, ...), trạng thái đầu,
+# lịch lực nhiễu theo thời gian (xung như nút ĐẨY TRÁI/PHẢI), thời gian mô phỏng và kỳ vọng
+# (ngưỡng chỉ tiêu) để dùng làm bộ kiểm thử hồi quy.
+# Kết quả được lưu đệm theo khóa băm của nội dung kịch bản (đã chuẩn hóa, bỏ tên và kỳ vọng)
+# cộng mã băm mã nguồn các module mô phỏng: kịch bản không đổi và mã không đổi -> bỏ qua khi chạy lại.
+#
+# Ví dụ (scenarios/push_right.json):
+#   {
+#     "params": {"M": 0.5, "L": 0.3},
+#     "controller": {"type": "lqr", "Q": [100, 1, 10, 1], "R": 0.1},
+#     "x0": [0.0, 0.0, 0.0, 0.0],
+#     "duration": 8.0,
+#     "disturbances": [{"t": 1.0, "duration": 0.2, "force": 15.0}],
+#     "expect": {"fell": false, "settling_time": {"max": 4.0}}
+#   }
+#
+# Cách dùng:
+#   python scenario.py scenarios/                # chạy mọi *.json (đệ quy), bỏ qua kết quả đã lưu đệm
+#   python scenario.py scenarios/ --force --save-traj --report report.json
+
+import argparse
+import glob
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+DEFAULT_CACHE_DIR = ".scenario_cache"
+CACHE_VERSION = 1   # Tăng khi đổi định dạng kết quả để bộ đệm cũ tự mất hiệu lực
+
+# Module ảnh hưởng tới kết quả mô phỏng: đổi nội dung file nào -> mọi khóa lưu đệm đổi theo
+SOURCE_FILES = ('conf.py', 'plant.py', 'controller.py', 'engine.py', 'integrators.py', 'mpc.py',
+                'swingup.py', 'sweep.py', 'scenario.py')
+
+PARAM_FIELDS = ('M', 'm_pole', 'm_ball', 'L', 'g', 'd', 'dt')
+CONTROLLERS = ('lqr', 'mpc', 'swingup')
+# Khóa cho phép trong "controller" theo từng loại (ngoài 'type')
+CONTROLLER_KEYS = {
+    'lqr': ('Q', 'R', 'discrete'),
+    'swingup': ('Q', 'R', 'discrete'),
+    'mpc': ('Q', 'R', 'discrete', 'horizon', 'u_max', 'x_max'),
+}
+MPC_DEFAULTS = {'horizon': 30, 'u_max': 20.0, 'x_max': 0.5}
+METRICS = ('settling_time', 'peak_angle', 'max_force', 'fell')
+
+
+def _defaults():
+    from conf import PhysParam
+    from controller import DEFAULT_Q, DEFAULT_R
+    p = PhysParam()
+    return {
+        'params': {k: getattr(p, k) for k in PARAM_FIELDS},
+        'controller': {'type': 'lqr', 'Q': list(DEFAULT_Q), 'R': DEFAULT_R, 'discrete': False},
+        'x0': [0.1, 0.0, 0.0, 0.0],     # Như trạng thái đầu của GUI
+        'duration': 10.0,
+        'disturbances': [],
+        'integrator': 'fixed',
+        'stop_on_fall': True,
+        'track_limit': None,
+    }
+
+
+def normalize(raw):
+    """
+    Điền giá trị mặc định và kiểm tra kịch bản. Trả về dict mới (JSON được, thứ tự khóa ổn định).
+    Khóa không biết -> ValueError (tránh gõ sai tên bị bỏ qua âm thầm).
+    """
+    s = _defaults()
+    extra = set(raw) - set(s) - {'name', 'expect'}
+    if extra:
+        raise ValueError(f"Khóa không hợp lệ: {sorted(extra)}")
+
+    params = raw.get('params', {})
+    bad = set(params) - set(PARAM_FIELDS)
+    if bad:
+        raise ValueError(f"Thông số không hợp lệ: {sorted(bad)} (cho phép {PARAM_FIELDS})")
+    s['params'].update({k: float(v) for k, v in params.items()})
+
+    raw_ctrl = raw.get('controller', {})
+    ctrl = s['controller']
+    ctype = raw_ctrl.get('type', ctrl['type'])
+    if ctype not in CONTROLLERS:
+        raise ValueError(f"controller.type phải là một trong {CONTROLLERS}")
+    bad = set(raw_ctrl) - {'type'} - set(CONTROLLER_KEYS[ctype])
+    if bad:
+        raise ValueError(f"controller '{ctype}': khóa không hợp lệ {sorted(bad)} "
+                         f"(cho phép {CONTROLLER_KEYS[ctype]})")
+    if ctype == 'mpc':
+        ctrl.update(MPC_DEFAULTS)
+    ctrl.update(raw_ctrl)
+    ctrl['Q'] = [float(q) for q in ctrl['Q']]
+    ctrl['R'] = float(ctrl['R'])
+    ctrl['discrete'] = bool(ctrl['discrete'])
+    if len(ctrl['Q']) != 4:
+        raise ValueError("controller.Q cần 4 phần tử")
+    if ctype == 'mpc':
+        ctrl['horizon'] = int(ctrl['horizon'])
+        ctrl['u_max'] = float(ctrl['u_max'])
+        ctrl['x_max'] = None if ctrl['x_max'] is None else float(ctrl['x_max'])
+
+    s['x0'] = [float(v) for v in raw.get('x0', s['x0'])]
+    if len(s['x0']) != 4:
+        raise ValueError("x0 cần 4 phần tử [theta, theta_dot, x, x_dot]")
+    s['duration'] = float(raw.get('duration', s['duration']))
+
+    pulses = []
+    for d in raw.get('disturbances', []):
+        if 'force' not in d or 't' not in d:
+            raise ValueError("Mỗi nhiễu cần 't' (giây) và 'force' (N); 'duration' tùy chọn")
+        pulses.append({'t': float(d['t']), 'duration': float(d.get('duration', s['params']['dt'])),
+                       'force': float(d['force'])})
+    s['disturbances'] = sorted(pulses, key=lambda d: d['t'])
+
+    for k in ('integrator', 'stop_on_fall', 'track_limit'):
+        if k in raw:
+            s[k] = raw[k]
+    from integrators import INTEGRATORS
+    if s['integrator'] != 'fixed' and s['integrator'] not in INTEGRATORS:
+        raise ValueError(f"integrator phải là 'fixed' hoặc một trong {tuple(INTEGRATORS)}")
+    return s
+
+
+_CODE_HASH = None
+
+
+def code_version(root=None):
+    """Mã băm nội dung SOURCE_FILES (bỏ khác biệt CRLF/LF), tính một lần mỗi tiến trình."""
+    global _CODE_HASH
+    if _CODE_HASH is None or root is not None:
+        root = root or os.path.dirname(os.path.abspath(__file__))
+        h = hashlib.sha256()
+        for name in SOURCE_FILES:
+            with open(os.path.join(root, name), 'rb') as f:
+                h.update(name.encode() + b'\0' + f.read().replace(b'\r\n', b'\n') + b'\0')
+        _CODE_HASH = h.hexdigest()
+    return _CODE_HASH
+
+
+def cache_key(scenario):
+    """Khóa băm của kịch bản đã chuẩn hóa (không gồm tên / kỳ vọng) + phiên bản mã."""
+    blob = json.dumps({'version': CACHE_VERSION, 'code': code_version(), 'scenario': scenario},
+                      sort_keys=True).encode()
+    return hashlib.sha256(blob).hexdigest()[:24]
+
+
+def disturbance_schedule(pulses, dt, n):
+    """Lực nhiễu theo từng chu kỳ điều khiển (n,): xung [t, t + duration) giữ theo ZOH."""
+    force = np.zeros(n)
+    for d in pulses:
+        k0 = int(round(d['t'] / dt))
+        k1 = max(int(round((d['t'] + d['duration']) / dt)), k0 + 1)
+        force[max(k0, 0):max(min(k1, n), 0)] += d['force']
+    return force
+
+
+def build(scenario):
+    """PhysParam và bộ điều khiển (đã tính gain) cho kịch bản đã chuẩn hóa."""
+    from conf import PhysParam
+    from plant import CartPoleSystem
+    from controller import LQRController
+
+    p = PhysParam()
+    for k, v in scenario['params'].items():
+        setattr(p, k, v)
+    p.update_derived()
+    plant = CartPoleSystem(p)
+
+    c = scenario['controller']
+    if c['type'] == 'mpc':
+        from mpc import MPCController
+        x_max = c['x_max']
+        ctrl = MPCController(plant, horizon=c['horizon'], u_max=c['u_max'],
+                             x_limits=(-x_max, x_max) if x_max is not None else None)
+    elif c['type'] == 'swingup':
+        from swingup import SwingUpController
+        ctrl = SwingUpController(plant, balance=LQRController(plant, discrete=c['discrete']))
+    else:
+        ctrl = LQRController(plant, discrete=c['discrete'])
+    ctrl.compute_gains(c['Q'], c['R'], verbose=False)
+    return p, ctrl
+
+
+def simulate(scenario):
+    """
+    Chạy kịch bản đã chuẩn hóa -> engine.Trajectory.
+    Với swingup, traj.modes (n,) ghi pha của bộ điều khiển (SWING / BALANCE) tại mỗi chu kỳ điều khiển;
+    các bộ điều khiển khác có traj.modes = None.
+    """
+    from engine import SimEngine
+
+    p, ctrl = build(scenario)
+    n = int(round(scenario['duration'] / p.dt))
+    force = disturbance_schedule(scenario['disturbances'], p.dt, n + 1)
+    external = (lambda t: force[int(round(t / p.dt))]) if scenario['disturbances'] else None
+
+    swingup = scenario['controller']['type'] == 'swingup'
+    modes = []
+    if swingup:
+        get_action = ctrl.get_action
+
+        def logged(state):
+            u = get_action(state)
+            modes.append(ctrl.mode)
+            return u
+        ctrl.get_action = logged
+
+    integrator = None
+    events = []
+    # Swing-up bắt đầu ở góc treo (|theta| > FALL_ANGLE): sự kiện đổ chỉ có nghĩa sau khi bắt được,
+    # nên không dùng ở đây; evaluate() xét đổ trên đoạn quỹ đạo sau lần chuyển sang giữ thăng bằng.
+    stop_on_fall = scenario['stop_on_fall'] and not swingup
+    if scenario['integrator'] != 'fixed' or stop_on_fall or scenario['track_limit']:
+        from integrators import make_integrator, pole_fall, track_end
+        if scenario['integrator'] != 'fixed':
+            integrator = make_integrator(scenario['integrator'])
+        if stop_on_fall:
+            from sweep import FALL_ANGLE
+            events.append(pole_fall(FALL_ANGLE))
+        if scenario['track_limit']:
+            events.append(track_end(float(scenario['track_limit'])))
+    traj = SimEngine(p, ctrl).run(scenario['x0'], scenario['duration'], external_force=external,
+                                  integrator=integrator, events=tuple(events))
+    traj.modes = np.array(modes, dtype=int) if swingup else None
+    return traj
+
+
+def _handoff(modes):
+    """Chỉ số chu kỳ bắt đầu đoạn BALANCE cuối cùng (giữ tới hết quỹ đạo), None nếu kết thúc ở SWING."""
+    from swingup import BALANCE
+    if len(modes) == 0 or modes[-1] != BALANCE:
+        return None
+    swing = np.flatnonzero(modes != BALANCE)
+    return int(swing[-1]) + 1 if len(swing) else 0
+
+
+def evaluate(scenario):
+    """
+    Mô phỏng và tính chỉ tiêu (cùng định nghĩa với sweep.rollout_metrics).
+    Swing-up: settling_time / peak_angle / fell tính trên đoạn sau lần bắt cuối cùng (góc quy về [-pi, pi)),
+    không bắt được hoặc kết thúc ở pha SWING tính là đổ; có thêm chỉ tiêu catch_time.
+    """
+    from engine import Trajectory
+    from sweep import rollout_metrics
+
+    traj = simulate(scenario)
+    if traj.modes is None:
+        k0, states = 0, traj.states
+    else:
+        from swingup import wrap_angle
+        k0 = _handoff(traj.modes)
+        states = traj.states.copy()
+        states[:, 0] = wrap_angle(states[:, 0])
+    if k0 is None:
+        metrics = {'settling_time': None, 'peak_angle': float(np.nanmax(np.abs(states[:, 0]))),
+                   'max_force': float(np.nanmax(np.abs(traj.controls))), 'fell': True}
+    else:
+        batch = Trajectory(traj.t[k0:], states[k0:, None, :], traj.controls[k0:, None])
+        m = rollout_metrics(batch)
+        metrics = {k: m[k][0].item() for k in METRICS}
+        metrics['max_force'] = float(np.nanmax(np.abs(traj.controls)))
+        if k0 > 0:
+            # Mẫu đầu của đoạn cắt đã ổn định -> rollout_metrics trả 0, thời điểm đúng là lúc bắt
+            metrics['settling_time'] = max(metrics['settling_time'], float(traj.t[k0]))
+    if traj.modes is not None:
+        metrics['catch_time'] = None if k0 is None else float(traj.t[k0])
+    # Dừng sớm do sự kiện (đổ / chạm cuối ray) cũng tính là thất bại
+    terminal = [name for name, _, _ in traj.events]
+    metrics['fell'] = bool(metrics['fell'] or terminal)
+    if metrics['fell']:
+        metrics['settling_time'] = None
+    return traj, {
+        'metrics': {k: (None if isinstance(v, float) and not np.isfinite(v) else v) for k, v in metrics.items()},
+        'final_state': traj.states[-1].tolist(),
+        'events': [{'name': name, 't': float(te)} for name, te, _ in traj.events],
+        'sim_time': float(traj.t[-1]),
+    }
+
+
+def check(result, expect):
+    """
+    So chỉ tiêu với kỳ vọng. expect: {'fell': bool, '<chỉ tiêu>': {'max': x, 'min': y} hoặc số (= max)}.
+    Trả về danh sách mô tả các điều kiện không đạt (rỗng = đạt).
+    """
+    failures = []
+    metrics = result['metrics']
+    for key, rule in (expect or {}).items():
+        if key not in metrics:
+            failures.append(f"{key}: không có chỉ tiêu này")
+            continue
+        value = metrics[key]
+        if isinstance(rule, bool):
+            if value != rule:
+                failures.append(f"{key} = {value}, cần {rule}")
+            continue
+        if not isinstance(rule, dict):
+            rule = {'max': rule}
+        if value is None:
+            failures.append(f"{key} không xác định (chưa ổn định / đã đổ)")
+            continue
+        if 'max' in rule and value > rule['max']:
+            failures.append(f"{key} = {value:.4g} > {rule['max']}")
+        if 'min' in rule and value < rule['min']:
+            failures.append(f"{key} = {value:.4g} < {rule['min']}")
+    return failures
+
+
+# ----------------------------------------------------------------------
+# Chạy thư mục + lưu đệm
+# ----------------------------------------------------------------------
+def load(path):
+    """Đọc file kịch bản -> (tên, kịch bản đã chuẩn hóa, kỳ vọng)."""
+    with open(path) as f:
+        raw = json.load(f)
+    name = raw.get('name') or os.path.splitext(os.path.basename(path))[0]
+    return name, normalize(raw), raw.get('expect', {})
+
+
+def find(paths):
+    """Danh sách file *.json từ các file / thư mục (đệ quy), đã sắp xếp."""
+    files = []
+    for p in paths:
+        if os.path.isdir(p):
+            files.extend(glob.glob(os.path.join(p, '**', '*.json'), recursive=True))
+        else:
+            files.append(p)
+    return sorted(files)
+
+
+def _run_one(job):
+    """
+    Chạy một kịch bản trong tiến trình con và ghi vào bộ đệm. job = (kịch bản, khóa, thư mục, lưu quỹ đạo).
+    Ngoại lệ khi mô phỏng -> kết quả {'error': ...} thay vì ném ra.
+    """
+    scenario, key, cache_dir, save_traj = job
+    t0 = time.perf_counter()
+    try:
+        traj, result = evaluate(scenario)
+    except Exception as e:
+        # Một kịch bản lỗi không được làm hỏng cả lượt chạy: báo lỗi như một mục không đạt (không lưu đệm)
+        return {'error': f"{type(e).__name__}: {e}", 'key': key, 'elapsed': time.perf_counter() - t0}
+    result['elapsed'] = time.perf_counter() - t0
+    result['key'] = key
+    if cache_dir is not None:
+        os.makedirs(cache_dir, exist_ok=True)
+        base = os.path.join(cache_dir, key)
+        if save_traj:
+            np.savez(base + '.npz', t=traj.t, states=traj.states, controls=traj.controls)
+        # Ghi file tạm rồi đổi tên: tiến trình khác không bao giờ đọc phải file dở dang
+        tmp = f"{base}.{os.getpid()}.tmp"
+        with open(tmp, 'w') as f:
+            json.dump({'scenario': scenario, **result}, f, indent=1)
+        os.replace(tmp, base + '.json')
+    return result
+
+
+def run_scenarios(paths, cache_dir=DEFAULT_CACHE_DIR, force=False, save_traj=False, workers=None):
+    """
+    Chạy mọi kịch bản trong paths. Kịch bản đã có kết quả trong bộ đệm (cùng khóa) được bỏ qua,
+    trừ khi force=True. Các kịch bản còn lại chạy song song.
+    Trả về danh sách dict (theo thứ tự file): name, path, key, cached, passed, failures, metrics, ...
+    Kịch bản không đọc được hoặc lỗi khi chạy có thêm khóa "error", metrics = None và passed = False.
+    """
+    entries = []
+    jobs = []
+    for path in find(paths):
+        try:
+            name, scenario, expect = load(path)
+        except (OSError, ValueError, TypeError, AttributeError) as e:
+            # File hỏng / sai khóa: ghi nhận là không đạt, vẫn chạy các kịch bản khác
+            name = os.path.splitext(os.path.basename(path))[0]
+            entries.append({'name': name, 'path': path, 'key': None, 'expect': {}, 'cached': False,
+                            'error': f"{type(e).__name__}: {e}"})
+            continue
+        key = cache_key(scenario)
+        entry = {'name': name, 'path': path, 'key': key, 'expect': expect}
+        cached = os.path.join(cache_dir, key + '.json') if cache_dir is not None else None
+        if not force and cached and os.path.exists(cached) and \
+                (not save_traj or os.path.exists(os.path.join(cache_dir, key + '.npz'))):
+            with open(cached) as f:
+                data = json.load(f)
+            data.pop('scenario', None)
+            entry.update(data, cached=True)
+        else:
+            entry['cached'] = False
+            jobs.append((len(entries), (scenario, key, cache_dir, save_traj)))
+        entries.append(entry)
+
+    if jobs:
+        args = [j for _, j in jobs]
+        if workers == 1 or len(args) == 1:
+            results = [_run_one(a) for a in args]
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                results = list(pool.map(_run_one, args, chunksize=max(1, len(args) // 32)))
+        for (i, _), result in zip(jobs, results):
+            entries[i].update(result)
+
+    for entry in entries:
+        if 'error' in entry:
+            entry['metrics'] = None
+            entry['failures'] = [f"lỗi: {entry['error']}"]
+        else:
+            entry['failures'] = check(entry, entry['expect'])
+        entry['passed'] = not entry['failures']
+    return entries
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Chạy các kịch bản mô phỏng JSON (có lưu đệm kết quả)")
+    ap.add_argument("paths", nargs='+', help="File .json hoặc thư mục kịch bản")
+    ap.add_argument("--cache-dir", default=DEFAULT_CACHE_DIR)
+    ap.add_argument("--no-cache", action="store_true", help="Không đọc / ghi bộ đệm")
+    ap.add_argument("--force", action="store_true", help="Chạy lại kể cả khi đã có trong bộ đệm")
+    ap.add_argument("--save-traj", action="store_true",
+                    help="Lưu quỹ đạo .npz cạnh kết quả (dựng hình được bằng offscreen.py)")
+    ap.add_argument("--workers", type=int, default=None)
+    ap.add_argument("--report", default=None, help="Ghi báo cáo JSON")
+    args = ap.parse_args(argv)
+
+    t0 = time.perf_counter()
+    entries = run_scenarios(args.paths, None if args.no_cache else args.cache_dir, args.force,
+                            args.save_traj, args.workers)
+    elapsed = time.perf_counter() - t0
+
+    for e in entries:
+        m = e['metrics']
+        if m is None:
+            print(f"LỖI {e['name']:28s}       không chạy được")
+        else:
+            settle = f"{m['settling_time']:.2f}s" if m['settling_time'] is not None else "-"
+            print(f"{'OK ' if e['passed'] else 'LỖI'} {e['name']:28s} {'(đệm)' if e['cached'] else '     '} "
+                  f"ổn định {settle:>7s} | góc max {m['peak_angle']:.3f} | lực max {m['max_force']:.1f}N"
+                  f"{' | ĐỔ' if m['fell'] else ''}")
+        for failure in e['failures']:
+            print(f"      - {failure}")
+    n_cached = sum(e['cached'] for e in entries)
+    n_failed = sum(not e['passed'] for e in entries)
+    print(f"{len(entries)} kịch bản ({n_cached} từ bộ đệm, {len(entries) - n_cached} chạy mới) "
+          f"trong {elapsed:.2f}s | không đạt: {n_failed}")
+
+    if args.report:
+        with open(args.report, 'w') as f:
+            json.dump(entries, f, indent=1)
+    return 1 if n_failed else 0
+
+
+if __name__ == "__main__":
+    import sys
+    sys.exit(main())
@@ -0,0 +1,178 @@
+# scheduler.py - Bộ lập lịch đa tốc độ (Multi-rate)
+# Vật lý chạy ở tần số cao (vd. 1kHz) trong luồng nền, bộ điều khiển chạy ở chu kỳ
+# lấy mẫu riêng (PhysParam.dt = 50Hz) với bộ giữ bậc 0 (ZOH), GUI chỉ đọc bản chụp trạng thái mới nhất.
+
+import threading
+import time
+
+import numpy as np
+
+from plant import FastCartPole
+
+
+class MultiRateScheduler:
+    def __init__(self, plant, controller, physics_hz=1000.0, control_dt=None,
+                 tick=0.002, max_lag=0.1, speed=1.0):
+        """
+        plant:      CartPoleSystem
+        controller: đối tượng có get_action(state)
+        physics_hz: tần số tích phân vật lý (số bước con mỗi giây)
+        control_dt: chu kỳ bộ điều khiển (mặc định PhysParam.dt)
+        tick:       chu kỳ đánh thức luồng nền (giây)
+        max_lag:    nếu chậm hơn đồng hồ thực quá ngưỡng này thì bỏ qua phần trễ (resync)
+        speed:      hệ số thời gian (1.0 = thời gian thực)
+        """
+        self.plant = plant
+        self.controller = controller
+        self.kernel = FastCartPole(plant.p)   # bước RK4 không cấp phát, hằng số lưu đệm
+        self.tick = tick
+        self.max_lag = max_lag
+        self.speed = speed
+
+        control_dt = control_dt if control_dt is not None else plant.p.dt
+        # Số bước vật lý trong một chu kỳ điều khiển (làm tròn để chu kỳ điều khiển chính xác)
+        self.substeps = max(1, int(round(control_dt * physics_hz)))
+        self.control_dt = control_dt
+        self.physics_dt = control_dt / self.substeps
+
+        self.manual_force = 0.0     # Ngoại lực từ GUI (gán trực tiếp, nguyên tử)
+        self.recorder = None        # RunRecorder (tùy chọn): ghi mọi bước vật lý
+        self.profiler = None        # instrument.Profiler (tùy chọn): đo 'controller' và 'integration'
+        self._lock = threading.Lock()
+        self._gen = 0               # tăng mỗi lần reset()/set_state() (phát hiện ghi đè giữa một lô bước)
+        self._thread = None
+        self._stop = threading.Event()
+
+        self.reset(np.zeros(4))
+
+    # ------------------------------------------------------------------
+    # Trạng thái dùng chung (bảo vệ bằng khóa)
+    # ------------------------------------------------------------------
+    def reset(self, state, t=0.0):
+        """Đặt lại trạng thái và thống kê; t làm tròn về bội số của bước vật lý (thời gian = k * physics_dt)."""
+        with self._lock:
+            self._state = np.array(state, dtype=float)
+            self._k = int(round(t / self.physics_dt))   # chỉ số bước vật lý
+            self._time = self._k * self.physics_dt
+            self._u = 0.0
+            self._gen += 1
+            self.physics_steps = 0
+            self.control_steps = 0
+            self.overruns = 0       # số đợt trễ hơn một chu kỳ điều khiển (một lần chậm kéo dài tính 1)
+            self.resyncs = 0        # số lần bỏ qua phần trễ vì vượt max_lag
+            self.max_behind = 0.0   # độ trễ lớn nhất so với đồng hồ thực (giây)
+
+    def set_state(self, state):
+        """Gán trạng thái mới (vd. gói tin UART) mà không đổi thời gian."""
+        with self._lock:
+            self._state = np.array(state, dtype=float)
+            self._gen += 1
+
+    def snapshot(self):
+        """Bản chụp (time, state, u) mới nhất cho GUI."""
+        with self._lock:
+            return self._time, self._state.copy(), self._u
+
+    def stats(self):
+        return {
+            'physics_steps': self.physics_steps,
+            'control_steps': self.control_steps,
+            'overruns': self.overruns,
+            'resyncs': self.resyncs,
+            'max_behind': self.max_behind,
+            'physics_hz': 1.0 / self.physics_dt,
+            'control_hz': 1.0 / self.control_dt,
+        }
+
+    # ------------------------------------------------------------------
+    # Luồng nền
+    # ------------------------------------------------------------------
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        if self.running:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="physics", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def advance(self, n_steps):
+        """Tiến n bước vật lý; bộ điều khiển chỉ được gọi ở đầu mỗi chu kỳ điều khiển (ZOH)."""
+        step = self.kernel.step
+        recorder = self.recorder
+        prof = self.profiler
+        clock = time.perf_counter
+        # Khóa chỉ giữ khi chép trạng thái vào / ra: vòng tích phân và get_action() (MPC có thể chậm)
+        # chạy trên bản sao riêng nên snapshot()/set_state() từ GUI không phải chờ cả lô.
+        with self._lock:
+            state, t, u, k = self._state.copy(), self._time, self._u, self._k
+            gen = self._gen
+        manual = self.manual_force
+        controls = 0
+        for _ in range(n_steps):
+            if k % self.substeps == 0:
+                manual = self.manual_force
+                if prof is None:
+                    u = self.controller.get_action(state) + manual
+                else:
+                    t0 = clock()
+                    u = self.controller.get_action(state) + manual
+                    prof.record('controller', clock() - t0)
+                controls += 1
+            if recorder is not None:
+                recorder.append(t, state, u, manual)
+            # Cập nhật tại chỗ trên bản sao riêng
+            if prof is None:
+                step(state, u, self.physics_dt, state)
+            else:
+                t0 = clock()
+                step(state, u, self.physics_dt, state)
+                prof.record('integration', clock() - t0)
+            k += 1
+            t = k * self.physics_dt
+        with self._lock:
+            if self._gen != gen:
+                # reset()/set_state() xảy ra trong lúc tính: trạng thái gán từ ngoài được ưu tiên
+                return
+            self._state, self._time, self._u, self._k = state, t, u, k
+            self.physics_steps += n_steps
+            self.control_steps += controls
+
+    def _run(self):
+        # Mốc thời gian tuyệt đối: số bước cần chạy tính từ đồng hồ thực,
+        # nên sai số của sleep() không tích lũy thành trôi thời gian mô phỏng.
+        wall0 = time.perf_counter()
+        k0 = self._k
+        lagging = False     # đang trong một đợt trễ (đếm overrun một lần mỗi đợt)
+        while not self._stop.is_set():
+            elapsed = (time.perf_counter() - wall0) * self.speed
+            target = k0 + int(elapsed / self.physics_dt)
+            behind = (target - self._k) * self.physics_dt
+            if behind > self.max_behind:
+                self.max_behind = behind
+
+            if behind > self.control_dt:
+                if not lagging:
+                    self.overruns += 1
+                    lagging = True
+            else:
+                lagging = False
+            if behind > self.max_lag:
+                # Không kịp đồng hồ thực: dời mốc thay vì cố đuổi theo (tránh vòng xoáy trễ)
+                self.resyncs += 1
+                wall0 = time.perf_counter()
+                k0 = self._k
+                continue
+
+            n = target - self._k
+            if n > 0:
+                self.advance(n)
+            time.sleep(self.tick)
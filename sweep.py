@@ -0,0 +1,211 @@
+# sweep.py - Quét thông số & Monte Carlo đánh giá độ bền vững (Robustness) của bộ LQR
+# Thay đổi PhysParam (M, m_pole, m_ball, L, g, d) và trọng số Q_diag/R_val theo lưới
+# hoặc phân phối ngẫu nhiên, chạy vòng kín song song trên mọi lõi CPU.
+#
+# Cách dùng:
+#   python sweep.py spec.json --mode grid --out results.csv
+#   python sweep.py spec.json --mode random -n 5000 --seed 1 --out mc.csv
+#
+# spec.json (mỗi khóa là danh sách giá trị cho chế độ grid,
+# hoặc ["uniform", lo, hi] / ["normal", mu, sigma] cho chế độ random):
+#   {"M": [0.4, 0.5, 0.6], "L": ["uniform", 0.25, 0.35],
+#    "Q_diag": [[100, 1, 10, 1], [200, 1, 10, 1]], "R_val": [0.1, 1.0],
+#    "x0": [0.1, 0, 0, 0], "duration": 10, "discrete": false}
+
+import argparse
+import csv
+import itertools
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from conf import PhysParam
+from plant import CartPoleSystem, batch_params
+from controller import LQRController, DEFAULT_Q, DEFAULT_R
+from engine import SimEngine
+
+PHYS_FIELDS = ('M', 'm_pole', 'm_ball', 'L', 'g', 'd')
+SWEEP_FIELDS = PHYS_FIELDS + ('Q_diag', 'R_val')
+
+# Ngưỡng đánh giá
+THETA_TOL = 0.02        # |theta| (rad) coi là đã ổn định
+X_TOL = 0.05            # |x| (m) coi là đã về giữa
+FALL_ANGLE = np.pi / 2  # |theta| vượt ngưỡng này coi như đổ
+
+
+def _sweep_values(spec):
+    return {k: spec[k] for k in SWEEP_FIELDS if k in spec}
+
+
+def grid_configs(spec):
+    """Tích Descartes của mọi danh sách giá trị trong spec."""
+    values = _sweep_values(spec)
+    keys = list(values)
+    return [dict(zip(keys, combo)) for combo in itertools.product(*(values[k] for k in keys))]
+
+
+def _draw(dist, n, rng):
+    kind = dist[0]
+    if kind == "uniform":
+        return rng.uniform(dist[1], dist[2], n)
+    if kind == "normal":
+        return rng.normal(dist[1], dist[2], n)
+    raise ValueError(f"Phân phối không hỗ trợ: {kind}")
+
+
+def random_configs(spec, n, seed=None):
+    """
+    Lấy n mẫu ngẫu nhiên. Khóa có dạng ["uniform"|"normal", a, b] được lấy mẫu,
+    khóa là danh sách thường được chọn ngẫu nhiên đều trong danh sách.
+    """
+    rng = np.random.default_rng(seed)
+    columns = {}
+    for k, v in _sweep_values(spec).items():
+        if isinstance(v[0], str):
+            columns[k] = _draw(v, n, rng).tolist()
+        else:
+            idx = rng.integers(len(v), size=n)
+            columns[k] = [v[i] for i in idx]
+    return [{k: columns[k][i] for k in columns} for i in range(n)]
+
+
+def make_param(config):
+    """Tạo PhysParam từ một cấu hình (các khóa thiếu giữ giá trị mặc định)."""
+    p = PhysParam()
+    for k in PHYS_FIELDS:
+        if k in config:
+            setattr(p, k, float(config[k]))
+    p.update_derived()
+    return p
+
+
+def rollout_metrics(traj, theta_tol=THETA_TOL, x_tol=X_TOL, fall_angle=FALL_ANGLE):
+    """
+    Tính chỉ tiêu cho quỹ đạo lô (states (n+1, N, 4), controls (n+1, N)).
+    Trả về dict các mảng (N,): settling_time (nan nếu không ổn định),
+    peak_angle, max_force, fell.
+    """
+    theta = np.abs(traj.states[:, :, 0])
+    x = np.abs(traj.states[:, :, 2])
+    finite = np.isfinite(theta).all(axis=0)
+
+    with np.errstate(invalid='ignore'):
+        fell = ~finite | (np.nanmax(theta, axis=0) > fall_angle)
+        unsettled = ~((theta <= theta_tol) & (x <= x_tol))
+
+    # Chỉ số mẫu cuối cùng còn chưa ổn định (duyệt ngược theo thời gian)
+    n = len(traj.t)
+    any_unsettled = unsettled.any(axis=0)
+    last = n - 1 - np.argmax(unsettled[::-1], axis=0)
+    settling = np.where(any_unsettled, traj.t[np.minimum(last + 1, n - 1)], 0.0)
+    settling[(last == n - 1) & any_unsettled] = np.nan
+    settling[fell] = np.nan
+
+    return {
+        'settling_time': settling,
+        'peak_angle': np.nanmax(theta, axis=0),
+        'max_force': np.nanmax(np.abs(traj.controls), axis=0),
+        'fell': fell,
+    }
+
+
+def evaluate_chunk(configs, x0, duration, discrete=False):
+    """
+    Đánh giá một nhóm cấu hình trong một tiến trình: giải LQR cho từng cấu hình,
+    sau đó mô phỏng cả nhóm bằng một rollout lô duy nhất.
+    discrete: dùng LQR rời rạc (ZOH theo PhysParam.dt) thay cho LQR liên tục.
+    """
+    params = [make_param(c) for c in configs]
+    K = np.empty((len(configs), 4))
+    for i, (c, p) in enumerate(zip(configs, params)):
+        ctrl = LQRController(CartPoleSystem(p), discrete=discrete)
+        K[i] = ctrl.compute_gains(c.get('Q_diag', DEFAULT_Q), c.get('R_val', DEFAULT_R), verbose=False)
+
+    # Gain đã có sẵn cho từng hàng nên engine chỉ dùng để tích phân lô
+    engine = SimEngine(params[0], controller=ctrl)
+    X0 = np.tile(np.asarray(x0, dtype=float), (len(configs), 1))
+    traj = engine.run_batch(X0, duration, K, params=batch_params(params))
+    metrics = rollout_metrics(traj)
+
+    rows = []
+    for i, c in enumerate(configs):
+        row = dict(c)
+        row.update({k: v[i].item() for k, v in metrics.items()})
+        row['K'] = K[i].tolist()
+        # Điều kiện chạy: đủ để dựng lại đúng quỹ đạo từ một dòng CSV (vd. offscreen.py --sweep)
+        row['x0'] = [float(v) for v in x0]
+        row['duration'] = float(duration)
+        row['discrete'] = bool(discrete)
+        rows.append(row)
+    return rows
+
+
+def run_sweep(configs, x0=(0.1, 0.0, 0.0, 0.0), duration=10.0, workers=None, chunk_size=64, discrete=False):
+    """Chạy toàn bộ cấu hình qua ProcessPoolExecutor, trả về danh sách kết quả."""
+    chunks = [configs[i:i + chunk_size] for i in range(0, len(configs), chunk_size)]
+    rows = []
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as pool:
+        futures = [pool.submit(evaluate_chunk, ch, list(x0), duration, discrete) for ch in chunks]
+        for f in futures:
+            rows.extend(f.result())
+    return rows
+
+
+def summarize(rows):
+    """Thống kê tổng hợp trên toàn bộ lần chạy."""
+    fell = np.array([r['fell'] for r in rows], dtype=bool)
+    summary = {'runs': len(rows), 'fell': int(fell.sum()), 'fall_rate': float(fell.mean()) if rows else 0.0}
+    for key in ('settling_time', 'peak_angle', 'max_force'):
+        v = np.array([r[key] for r in rows], dtype=float)
+        v = v[np.isfinite(v)]
+        if v.size:
+            summary[key] = {
+                'mean': float(v.mean()),
+                'p50': float(np.percentile(v, 50)),
+                'p95': float(np.percentile(v, 95)),
+                'max': float(v.max()),
+            }
+    return summary
+
+
+def write_csv(rows, path):
+    keys = list(rows[0]) if rows else []
+    with open(path, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=keys)
+        writer.writeheader()
+        for r in rows:
+            writer.writerow({k: json.dumps(v) if isinstance(v, list) else v for k, v in r.items()})
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Quét thông số / Monte Carlo cho bộ LQR")
+    ap.add_argument("spec", help="File JSON mô tả không gian quét")
+    ap.add_argument("--mode", choices=("grid", "random"), default="grid")
+    ap.add_argument("-n", type=int, default=1000, help="Số mẫu (chế độ random)")
+    ap.add_argument("--seed", type=int, default=None)
+    ap.add_argument("--workers", type=int, default=None)
+    ap.add_argument("--out", default="sweep_results.csv")
+    args = ap.parse_args(argv)
+
+    with open(args.spec) as f:
+        spec = json.load(f)
+
+    if args.mode == "grid":
+        configs = grid_configs(spec)
+    else:
+        configs = random_configs(spec, args.n, args.seed)
+
+    rows = run_sweep(configs, spec.get('x0', (0.1, 0.0, 0.0, 0.0)), spec.get('duration', 10.0), args.workers,
+                     discrete=spec.get('discrete', False))
+    write_csv(rows, args.out)
+
+    summary = summarize(rows)
+    with open(os.path.splitext(args.out)[0] + "_summary.json", 'w') as f:
+        json.dump(summary, f, indent=2)
+    print(json.dumps(summary, indent=2))
+
+
+if __name__ == "__main__":
+    main()
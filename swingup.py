@@ -0,0 +1,299 @@
+# swingup.py - Đưa con lắc từ vị trí treo lên thẳng đứng: điều khiển năng lượng + bắt bằng LQR
+# Năng lượng con lắc (mốc 0 tại vị trí thẳng đứng đứng yên, dùng l_cm và J của vật rắn trong conf.py):
+#     E = 0.5 * J * theta_dot^2 + m * g * l_cm * (cos(theta) - 1)
+# Treo xuống đứng yên: E = -2 m g l_cm. Luật bơm năng lượng đặt gia tốc xe
+#     a = sat( k_E * (E - E_ref) * sign(theta_dot * cos(theta)) ) - k_x * x - k_v * x_dot
+# (dE/dt = -m l_cm cos(theta) theta_dot a), rồi đổi sang lực bằng tuyến tính hóa phản hồi của xe.
+# Công tắc có trễ (hysteresis): vào LQR khi |theta| < catch_angle, trở lại bơm khi |theta| > release_angle.
+#
+# Đánh giá hàng loạt từ các trạng thái treo xuống:
+#   python swingup.py -n 5000 --seed 1 --out swingup.csv
+
+import argparse
+import csv
+import json
+import math
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from conf import PhysParam
+from plant import CartPoleSystem
+from controller import LQRController, DEFAULT_Q, DEFAULT_R
+
+SWING = 0
+BALANCE = 1
+
+
+def wrap_angle(theta):
+    """Đưa góc về [-pi, pi) (số thực hoặc mảng)."""
+    return (theta + np.pi) % (2 * np.pi) - np.pi
+
+
+def pendulum_energy(theta, theta_dot, p):
+    """Năng lượng con lắc quanh trục quay, bằng 0 ở vị trí thẳng đứng đứng yên."""
+    return 0.5 * p.J * theta_dot**2 + p.m_total * p.g * p.l_cm * (np.cos(theta) - 1.0)
+
+
+class SwingUpController:
+    """
+    Điều khiển lai: bơm năng lượng khi xa vị trí thẳng đứng, LQR khi đủ gần.
+    Giao diện giống LQRController (compute_gains / get_action / K) để dùng với
+    SimEngine, MultiRateScheduler và GUI.
+    """
+    def __init__(self, plant, balance=None, k_energy=40.0, a_max=6.0, k_x=5.0, k_v=3.0,
+                 u_max=20.0, catch_angle=0.35, catch_rate=4.0, release_angle=0.7):
+        """
+        plant: CartPoleSystem
+        balance: bộ điều khiển cân bằng có get_action (mặc định LQRController liên tục)
+        k_energy: hệ số bơm năng lượng (m/s^2 trên mỗi J sai lệch)
+        a_max: giới hạn gia tốc xe khi bơm (m/s^2)
+        k_x, k_v: hồi vị xe về giữa đường ray trong pha bơm
+        u_max: giới hạn lực (N) trong pha bơm
+        catch_angle, catch_rate: vào pha cân bằng khi |theta| < catch_angle và |theta_dot| < catch_rate
+        release_angle: trở lại pha bơm khi |theta| > release_angle (> catch_angle: tránh chập chờn)
+        """
+        self.plant = plant
+        self.balance = balance if balance is not None else LQRController(plant)
+        self.k_energy = k_energy
+        self.a_max = a_max
+        self.k_x = k_x
+        self.k_v = k_v
+        self.u_max = u_max
+        self.catch_angle = catch_angle
+        self.catch_rate = catch_rate
+        self.release_angle = release_angle
+        self.mode = SWING
+        self.switches = 0   # Số lần chuyển pha (đánh giá độ ổn định của công tắc)
+
+    @property
+    def K(self):
+        return self.balance.K
+
+    @property
+    def discrete(self):
+        return getattr(self.balance, 'discrete', False)
+
+    @discrete.setter
+    def discrete(self, value):
+        self.balance.discrete = value
+
+    def compute_gains(self, Q_diag, R_val, verbose=True):
+        """Tính gain cho bộ cân bằng (pha bơm không cần tính trước)."""
+        return self.balance.compute_gains(Q_diag, R_val, verbose=verbose)
+
+    def reset(self):
+        self.mode = SWING
+        self.switches = 0
+
+    def swing_force(self, theta, theta_dot, x, x_dot):
+        """Lực pha bơm năng lượng (số thực)."""
+        p = self.plant.p
+        m = p.m_total
+        ml = m * p.l_cm
+        s = math.sin(theta)
+        c = math.cos(theta)
+
+        E = 0.5 * p.J * theta_dot * theta_dot + ml * p.g * (c - 1.0)
+        # sign(0) lấy +1: con lắc treo đứng yên tuyệt đối vẫn được kích lên
+        a = self.k_energy * E * (1.0 if theta_dot * c >= 0.0 else -1.0)
+        a = min(max(a, -self.a_max), self.a_max) - self.k_x * x - self.k_v * x_dot
+
+        # Lực để xe có gia tốc a (khử tương tác con lắc theo phương trình Lagrange)
+        theta_ddot = (ml * p.g * s - ml * c * a) / p.J
+        u = (p.M + m) * a + ml * c * theta_ddot - ml * s * theta_dot * theta_dot
+        return min(max(u, -self.u_max), self.u_max)
+
+    def get_action(self, state):
+        theta, theta_dot, x, x_dot = state.tolist() if isinstance(state, np.ndarray) else state
+        th = (theta + math.pi) % (2 * math.pi) - math.pi
+
+        if self.mode == SWING:
+            if abs(th) < self.catch_angle and abs(theta_dot) < self.catch_rate:
+                self.mode = BALANCE
+                self.switches += 1
+        elif abs(th) > self.release_angle:
+            self.mode = SWING
+            self.switches += 1
+
+        if self.mode == BALANCE:
+            # LQR làm việc với góc đã quy về quanh 0 (con lắc có thể đã quay nhiều vòng)
+            return self.balance.get_action(np.array([th, theta_dot, x, x_dot]))
+        return self.swing_force(theta, theta_dot, x, x_dot)
+
+
+# ----------------------------------------------------------------------
+# Đánh giá hàng loạt (vector hóa theo lô, song song theo tiến trình)
+# ----------------------------------------------------------------------
+def swing_up_batch(p, X0, duration, K, ctrl_kwargs=None, settle_angle=0.05, dt=None):
+    """
+    Mô phỏng N lần swing-up cùng lúc (cùng luật như SwingUpController.get_action,
+    tính trên mảng). K: gain LQR (4,) của pha cân bằng.
+    Trả về dict các mảng (N,):
+      catch_time: lần đầu vào pha cân bằng (nan nếu không)
+      swing_up_time: thời điểm từ đó trở đi luôn ở pha cân bằng và |theta| < settle_angle
+                     đến hết mô phỏng (nan nếu không đạt)
+      switches: số lần chuyển pha; max_abs_x, max_force
+    """
+    c = SwingUpController(CartPoleSystem(p), **(ctrl_kwargs or {}))
+    plant = c.plant
+    if dt is None:
+        dt = p.dt
+    n = int(round(duration / dt))
+
+    X = np.array(X0, dtype=float)
+    N = X.shape[0]
+    K = np.asarray(K, dtype=float).ravel()
+    target = p.target_state
+
+    m = p.m_total
+    ml = m * p.l_cm
+    mgl = ml * p.g
+
+    balance = np.zeros(N, dtype=bool)
+    catch_time = np.full(N, np.nan)
+    last_bad = np.zeros(N)          # Thời điểm cuối cùng chưa đạt (ngoài pha cân bằng hoặc lệch góc)
+    switches = np.zeros(N, dtype=int)
+    max_abs_x = np.abs(X[:, 2])
+    max_force = np.zeros(N)
+
+    for k in range(n):
+        t = k * dt
+        theta, theta_dot, x, x_dot = X.T
+        th = wrap_angle(theta)
+
+        # Công tắc có trễ
+        enter = ~balance & (np.abs(th) < c.catch_angle) & (np.abs(theta_dot) < c.catch_rate)
+        leave = balance & (np.abs(th) > c.release_angle)
+        balance = (balance | enter) & ~leave
+        switches += enter | leave
+        catch_time[enter & np.isnan(catch_time)] = t
+
+        # Pha bơm năng lượng
+        s = np.sin(theta)
+        cs = np.cos(theta)
+        E = pendulum_energy(theta, theta_dot, p)
+        a = np.clip(c.k_energy * E * np.where(theta_dot * cs >= 0.0, 1.0, -1.0), -c.a_max, c.a_max)
+        a -= c.k_x * x + c.k_v * x_dot
+        theta_ddot = (mgl * s - ml * cs * a) / p.J
+        u_swing = np.clip((p.M + m) * a + ml * cs * theta_ddot - ml * s * theta_dot**2, -c.u_max, c.u_max)
+
+        # Pha cân bằng: LQR trên góc đã quy về quanh 0
+        E_bal = np.column_stack((th, theta_dot, x, x_dot)) - target
+        u_bal = -(E_bal @ K)
+
+        u = np.where(balance, u_bal, u_swing)
+        last_bad[~balance | (np.abs(th) > settle_angle)] = t
+        np.maximum(max_force, np.abs(u), out=max_force)
+
+        X = plant.rk4_step_batch(X, u, dt)
+        np.maximum(max_abs_x, np.abs(X[:, 2]), out=max_abs_x)
+
+    th = np.abs(wrap_angle(X[:, 0]))
+    done = balance & (th <= settle_angle) & (last_bad < (n - 1) * dt)
+    swing_up_time = np.where(done, last_bad + dt, np.nan)
+    return {
+        'catch_time': catch_time,
+        'swing_up_time': swing_up_time,
+        'switches': switches,
+        'max_abs_x': max_abs_x,
+        'max_force': max_force,
+    }
+
+
+def hanging_starts(n, seed=None, theta_spread=0.3, rate_spread=1.0, x_spread=0.1):
+    """n trạng thái ban đầu quanh vị trí treo xuống (theta = pi), phân phối đều."""
+    rng = np.random.default_rng(seed)
+    X0 = np.zeros((n, 4))
+    X0[:, 0] = np.pi + rng.uniform(-theta_spread, theta_spread, n)
+    X0[:, 1] = rng.uniform(-rate_spread, rate_spread, n)
+    X0[:, 2] = rng.uniform(-x_spread, x_spread, n)
+    return X0
+
+
+def evaluate_chunk(X0, duration, ctrl_kwargs=None, Q_diag=DEFAULT_Q, R_val=DEFAULT_R):
+    """Một nhóm trạng thái đầu trong một tiến trình (một rollout lô)."""
+    p = PhysParam()
+    K = LQRController(CartPoleSystem(p)).compute_gains(Q_diag, R_val, verbose=False)
+    metrics = swing_up_batch(p, X0, duration, K, ctrl_kwargs)
+    rows = []
+    for i, x0 in enumerate(X0):
+        row = {'theta0': x0[0], 'theta_dot0': x0[1], 'x0': x0[2], 'x_dot0': x0[3]}
+        row.update({k: v[i].item() for k, v in metrics.items()})
+        rows.append(row)
+    return rows
+
+
+def run_swing_up(X0, duration=15.0, ctrl_kwargs=None, workers=None, chunk_size=256):
+    """Chạy mọi trạng thái đầu qua ProcessPoolExecutor, trả về danh sách kết quả."""
+    chunks = [X0[i:i + chunk_size] for i in range(0, len(X0), chunk_size)]
+    rows = []
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as pool:
+        futures = [pool.submit(evaluate_chunk, ch, duration, ctrl_kwargs) for ch in chunks]
+        for f in futures:
+            rows.extend(f.result())
+    return rows
+
+
+def summarize(rows, bins=(1, 2, 3, 4, 5, 7.5, 10)):
+    """Phân phối thời gian swing-up (chỉ các lần thành công) và tỷ lệ thất bại."""
+    t = np.array([r['swing_up_time'] for r in rows], dtype=float)
+    ok = np.isfinite(t)
+    summary = {'runs': len(rows), 'failed': int((~ok).sum()), 'fail_rate': float((~ok).mean()) if rows else 0.0}
+    if ok.any():
+        v = t[ok]
+        summary['swing_up_time'] = {
+            'mean': float(v.mean()),
+            'p50': float(np.percentile(v, 50)),
+            'p90': float(np.percentile(v, 90)),
+            'p99': float(np.percentile(v, 99)),
+            'max': float(v.max()),
+        }
+        edges = [0.0] + list(bins) + [np.inf]
+        counts, _ = np.histogram(v, edges)
+        summary['histogram'] = {f"<{b:g}s" if np.isfinite(b) else f">={edges[-2]:g}s": int(c)
+                                for b, c in zip(edges[1:], counts)}
+    for key in ('switches', 'max_abs_x', 'max_force'):
+        v = np.array([r[key] for r in rows], dtype=float)
+        summary[key] = {'p50': float(np.percentile(v, 50)), 'max': float(v.max())} if rows else {}
+    return summary
+
+
+def write_csv(rows, path):
+    keys = list(rows[0]) if rows else []
+    with open(path, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=keys)
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Đánh giá swing-up từ các trạng thái treo xuống")
+    ap.add_argument("-n", type=int, default=2000, help="Số trạng thái ban đầu")
+    ap.add_argument("--seed", type=int, default=None)
+    ap.add_argument("-t", "--duration", type=float, default=15.0)
+    ap.add_argument("--theta-spread", type=float, default=0.3, help="Lệch góc quanh pi (rad)")
+    ap.add_argument("--rate-spread", type=float, default=1.0, help="Lệch vận tốc góc (rad/s)")
+    ap.add_argument("--x-spread", type=float, default=0.1, help="Lệch vị trí xe (m)")
+    ap.add_argument("--k-energy", type=float, default=None)
+    ap.add_argument("--a-max", type=float, default=None)
+    ap.add_argument("--workers", type=int, default=None)
+    ap.add_argument("--out", default=None, help="Ghi kết quả từng lần chạy (CSV)")
+    args = ap.parse_args(argv)
+
+    ctrl_kwargs = {k: v for k, v in (('k_energy', args.k_energy), ('a_max', args.a_max)) if v is not None}
+    X0 = hanging_starts(args.n, args.seed, args.theta_spread, args.rate_spread, args.x_spread)
+    rows = run_swing_up(X0, args.duration, ctrl_kwargs, args.workers)
+
+    summary = summarize(rows)
+    if args.out:
+        write_csv(rows, args.out)
+        with open(os.path.splitext(args.out)[0] + "_summary.json", 'w') as f:
+            json.dump(summary, f, indent=2)
+    print(json.dumps(summary, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,337 @@
+# sysid.py - Nhận dạng thông số vật lý từ quỹ đạo đã ghi (.cplog hoặc mảng t, states, u)
+# Phương trình Lagrange của CartPoleSystem.dynamics() tuyến tính theo bộ thông số
+#     a = [M + m, m * l_cm, J, d]:
+#   (M+m) x_ddot + m l (cos th th_ddot - sin th th_dot^2) + d x_dot = F
+#   m l (cos th x_ddot - g sin th) + J th_ddot                      = 0
+# Bước 1: bình phương tối thiểu theo lô trên dạng tích phân theo cửa sổ của hai phương trình
+#         (không đạo hàm số dữ liệu nhiễu), cộng dồn phương trình chuẩn 4x4 theo từng khối mẫu
+#         -> nhanh, chạy được trên hàng giờ dữ liệu 1 kHz.
+# Bước 2: tinh chỉnh bằng khớp quỹ đạo đa đoạn (multiple shooting): mô phỏng lô nhiều đoạn ngắn
+#         bắt đầu từ trạng thái đo được, tối thiểu sai lệch bằng scipy.optimize.least_squares.
+# Chỉ nhận dạng được 4 đại lượng trên: tách M và l_cm cần biết m_total (cân riêng con lắc),
+# nên m_total lấy từ thông số tiên nghiệm (prior).
+#
+# Cách dùng:
+#   python sysid.py logs/run_xxx.cplog
+#   python sysid.py --synthetic            # tự kiểm tra trên dữ liệu mô phỏng có nhiễu
+
+import argparse
+import json
+import time
+
+import numpy as np
+
+from conf import PhysParam
+from plant import CartPoleSystem
+
+FIT_FIELDS = ('M', 'm_total', 'l_cm', 'J', 'd')
+
+
+def window_regressors(t, states, u, g, window):
+    """
+    Dạng tích phân của hai phương trình Lagrange trên các cửa sổ không chồng nhau `window` mẫu,
+    chỉ dùng trạng thái đo được (không cần đạo hàm số nên nhiễu không bị khuếch đại 1/dt):
+      int x_ddot                          = dx_dot
+      int (cos th th_ddot - sin th th_dot^2) = d(cos th th_dot)
+      int x_dot                           = dx
+      int cos th x_ddot = d(cos th x_dot) + int sin th th_dot x_dot
+      int th_ddot                         = dth_dot
+    Lực u[k] giữ nguyên trên [t_k, t_k+1] (ZOH như scheduler ghi) nên int u là tổng chính xác.
+    Cửa sổ chứa khoảng trống thời gian (nối nhiều log) bị bỏ.
+    Trả về (Phi1, y1, Phi2) theo a = [M+m, m*l, J, d], mỗi hàng một cửa sổ.
+    """
+    theta, theta_dot, x, x_dot = states.T
+    s = np.sin(theta)
+    c = np.cos(theta)
+    h = np.diff(t)
+
+    def integral(f):
+        # Tích phân hình thang tích lũy, cùng độ dài với t
+        out = np.empty(len(f))
+        out[0] = 0.0
+        np.cumsum(0.5 * (f[1:] + f[:-1]) * h, out=out[1:])
+        return out
+
+    def delta(f):
+        return (f[idx[1:]] - f[idx[:-1]])[ok]
+
+    idx = np.arange(0, len(t), window)
+    gaps = np.concatenate(([0], np.cumsum(_gaps(h))))
+    ok = gaps[idx[1:]] == gaps[idx[:-1]]
+    Iu = np.empty(len(t))
+    Iu[0] = 0.0
+    np.cumsum(u[:-1] * h, out=Iu[1:])
+    Iss = integral(s)
+    Ivv = integral(s * theta_dot * x_dot)
+
+    n = int(ok.sum())
+    Phi1 = np.zeros((n, 4))
+    Phi1[:, 0] = delta(x_dot)
+    Phi1[:, 1] = delta(c * theta_dot)
+    Phi1[:, 3] = delta(x)
+    Phi2 = np.zeros((n, 4))
+    Phi2[:, 1] = delta(c * x_dot) + delta(Ivv) - g * delta(Iss)
+    Phi2[:, 2] = delta(theta_dot)
+    return Phi1, delta(Iu), Phi2
+
+
+def _gaps(h):
+    """Bước thời gian lớn bất thường (chỗ nối hai log)."""
+    return h > 1.5 * np.median(h) if len(h) else np.zeros(0, dtype=bool)
+
+
+def least_squares_fit(t, states, u, g=9.81, eq2_weight=1.0, window=200, chunk=1000000):
+    """
+    Bình phương tối thiểu theo lô trên toàn bộ dữ liệu, trả về (a, info).
+    Phương trình chuẩn 4x4 được cộng dồn theo từng khối `chunk` mẫu nên bộ nhớ không phụ thuộc
+    độ dài log (hàng giờ dữ liệu 1 kHz vẫn chạy trong vài giây).
+    window: số mẫu mỗi cửa sổ tích phân. eq2_weight: trọng số phương trình 2 (N*m) so với
+    phương trình 1 (N), ~ 1 / l_cm.
+    """
+    t = np.asarray(t, dtype=float)
+    u = np.asarray(u, dtype=float)
+    N = len(t)
+    chunk = max(chunk // window, 1) * window
+    AtA = np.zeros((4, 4))
+    Atb = np.zeros(4)
+    rows = 0
+    for i0 in range(0, N - 1, chunk):
+        # Khối gồm thêm mẫu đầu của khối sau để cửa sổ cuối khép kín
+        i1 = min(i0 + chunk + 1, N)
+        Phi1, y1, Phi2 = window_regressors(t[i0:i1], np.asarray(states[i0:i1], dtype=float),
+                                           u[i0:i1], g, window)
+        Phi2 *= eq2_weight
+        AtA += Phi1.T @ Phi1 + Phi2.T @ Phi2
+        Atb += Phi1.T @ y1
+        rows += len(y1)
+
+    a = np.linalg.solve(AtA, Atb)
+    return a, {'windows': rows, 'cond': float(np.linalg.cond(AtA))}
+
+
+def to_phys(a, prior):
+    """
+    PhysParam từ a = [M+m, m*l, J, d] với m_total lấy từ prior.
+    Các thuộc tính dẫn xuất (m_total, l_cm, J) được gán trực tiếp: KHÔNG gọi update_derived()
+    trên kết quả (sẽ tính lại từ m_pole, m_ball, L và ghi đè giá trị nhận dạng).
+    """
+    p = PhysParam()
+    for k in ('M', 'm_pole', 'm_ball', 'L', 'g', 'd', 'dt'):
+        setattr(p, k, getattr(prior, k))
+    p.target_state = np.array(prior.target_state, dtype=float)
+    m = prior.m_total
+    p.m_total = m
+    p.M = float(a[0] - m)
+    p.l_cm = float(a[1] / m)
+    p.J = float(a[2])
+    p.d = float(a[3])
+    return p
+
+
+def _batch_params(a, m, g):
+    return {'M': a[0] - m, 'm_total': m, 'l_cm': a[1] / m, 'J': a[2], 'g': g, 'd': a[3]}
+
+
+def shooting_residuals(a, m, g, plant, X0, U, Y, dt, scale):
+    """
+    Sai lệch (đã chuẩn hóa theo scale) giữa mô phỏng lô và trạng thái đo cho mọi đoạn.
+    X0: (S, 4) trạng thái đầu đoạn; U: (L, S) lực; Y: (L, S, 4) trạng thái đo sau mỗi bước.
+    """
+    params = _batch_params(a, m, g)
+    X = X0
+    res = np.empty(Y.shape)
+    for k in range(len(U)):
+        X = plant.rk4_step_batch(X, U[k], dt, params)
+        res[k] = X
+    res -= Y
+    res /= scale
+    return np.nan_to_num(res, nan=1e3, posinf=1e3, neginf=-1e3).ravel()
+
+
+def refine_shooting(t, states, u, a0, prior, segment=0.2, max_segments=1000, stride=1, seed=0,
+                    verbose=False):
+    """
+    Tinh chỉnh a bằng khớp quỹ đạo: chọn ngẫu nhiên tối đa max_segments đoạn dài `segment` giây,
+    mỗi đoạn mô phỏng từ trạng thái đo đầu đoạn với lực đã ghi (lấy mỗi `stride` mẫu).
+    Toàn bộ các đoạn được tích phân cùng lúc trên một lô.
+    """
+    from scipy.optimize import least_squares
+
+    t = np.asarray(t, dtype=float)
+    states = np.asarray(states, dtype=float)
+    u = np.asarray(u, dtype=float)
+    dt = float(np.median(np.diff(t))) * stride
+    L = max(int(round(segment / dt)), 1)
+    span = L * stride
+    # Điểm bắt đầu hợp lệ: đoạn không vắt qua chỗ nối hai log
+    gaps = np.concatenate(([0], np.cumsum(_gaps(np.diff(t)))))
+    valid = np.flatnonzero(gaps[span:] == gaps[:-span])
+    if len(valid) == 0:
+        raise ValueError("Log ngắn hơn một đoạn khớp quỹ đạo")
+    rng = np.random.default_rng(seed)
+    starts = np.sort(rng.choice(valid, size=min(max_segments, len(valid)), replace=False))
+
+    steps = starts[None, :] + stride * np.arange(L + 1)[:, None]     # (L+1, S)
+    X0 = states[starts]
+    U = u[steps[:-1]]
+    Y = states[steps[1:]]
+    scale = states.std(axis=0) + 1e-9
+
+    m = prior.m_total
+    g = prior.g
+    plant = CartPoleSystem(prior)
+    lower = [m * 1.0001, 1e-9, 1e-12, 0.0]
+    x0 = np.maximum(np.asarray(a0, dtype=float), np.array(lower) * 1.01 + [0, 0, 0, 1e-6])
+    fit = least_squares(shooting_residuals, x0, args=(m, g, plant, X0, U, Y, dt, scale),
+                        bounds=(lower, np.inf), x_scale=np.abs(x0) + 1e-6, verbose=2 if verbose else 0)
+    return fit.x, {'segments': len(starts), 'steps': L, 'nfev': int(fit.nfev),
+                   'rms': float(np.sqrt(np.mean(fit.fun**2)))}
+
+
+def identify(t, states, u, prior=None, refine=True, window=200, segment=0.2, max_segments=1000,
+             stride=1, verbose=False):
+    """
+    Nhận dạng thông số từ dữ liệu. Trả về (PhysParam, report).
+    prior: PhysParam tiên nghiệm (m_total, g và các thông số không nhận dạng lấy từ đây).
+    """
+    if prior is None:
+        prior = PhysParam()
+    report = {}
+    t0 = time.perf_counter()
+    a, info = least_squares_fit(t, states, u, g=prior.g, eq2_weight=1.0 / prior.l_cm,
+                                 window=window)
+    report['least_squares'] = dict(zip(FIT_FIELDS, _fields(a, prior)), **info,
+                                   seconds=time.perf_counter() - t0)
+    if refine:
+        t0 = time.perf_counter()
+        a, info = refine_shooting(t, states, u, a, prior, segment, max_segments, stride, verbose=verbose)
+        report['shooting'] = dict(zip(FIT_FIELDS, _fields(a, prior)), **info,
+                                  seconds=time.perf_counter() - t0)
+    return to_phys(a, prior), report
+
+
+def _fields(a, prior):
+    m = prior.m_total
+    return [float(a[0] - m), m, float(a[1] / m), float(a[2]), float(a[3])]
+
+
+def identify_log(path, prior=None, **kwargs):
+    """Nhận dạng từ file .cplog; prior mặc định là thông số ghi trong header của log."""
+    from recorder import RunLog
+    log = RunLog(path)
+    if prior is None:
+        prior = log.phys_param()
+    return identify(log.t, log.states, log.u, prior, **kwargs)
+
+
+# ----------------------------------------------------------------------
+# Dữ liệu tổng hợp để tự kiểm tra
+# ----------------------------------------------------------------------
+def synthetic_log(true, prior, duration=60.0, physics_hz=1000.0, excite=3.0, noise=(1e-4, 2e-3, 1e-4, 2e-3),
+                  seed=0):
+    """
+    Chạy MultiRateScheduler (LQR thiết kế trên prior, mô hình thật là `true`) cộng lực kích thích
+    ngẫu nhiên dạng bậc thang, ghi vào log; trả về (t, states có nhiễu đo, u).
+    """
+    import os
+    import tempfile
+    from controller import LQRController, DEFAULT_Q, DEFAULT_R
+    from recorder import RunRecorder, RunLog
+    from scheduler import MultiRateScheduler
+
+    ctrl = LQRController(CartPoleSystem(prior))
+    ctrl.compute_gains(DEFAULT_Q, DEFAULT_R, verbose=False)
+    sched = MultiRateScheduler(CartPoleSystem(true), ctrl, physics_hz=physics_hz)
+    sched.reset(np.array([0.05, 0.0, 0.0, 0.0]))
+    rng = np.random.default_rng(seed)
+
+    fd, path = tempfile.mkstemp(suffix=".cplog")
+    os.close(fd)
+    try:
+        with RunRecorder(path, true, ctrl.K) as rec:
+            sched.recorder = rec
+            n_total = int(duration * physics_hz)
+            done = 0
+            while done < n_total:
+                # Giữ mỗi mức kích thích 0.1 - 0.5 s
+                n = min(int(rng.uniform(0.1, 0.5) * physics_hz), n_total - done)
+                sched.manual_force = rng.uniform(-excite, excite)
+                sched.advance(n)
+                done += n
+        log = RunLog(path)
+        t = np.array(log.t)
+        states = np.array(log.states)
+        u = np.array(log.u)
+        del log
+    finally:
+        os.remove(path)
+    states += rng.normal(0.0, 1.0, states.shape) * np.asarray(noise)
+    return t, states, u
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Nhận dạng thông số cart-pole từ log")
+    ap.add_argument("logs", nargs='*', help="File .cplog (nối tiếp nhau)")
+    ap.add_argument("--synthetic", action="store_true", help="Tự kiểm tra trên dữ liệu mô phỏng")
+    ap.add_argument("--duration", type=float, default=60.0, help="Độ dài dữ liệu tổng hợp (s)")
+    ap.add_argument("--no-refine", action="store_true", help="Chỉ bình phương tối thiểu")
+    ap.add_argument("--window", type=int, default=200, help="Số mẫu mỗi cửa sổ tích phân")
+    ap.add_argument("--segment", type=float, default=0.2, help="Độ dài mỗi đoạn khớp quỹ đạo (s)")
+    ap.add_argument("--segments", type=int, default=1000, help="Số đoạn tối đa")
+    ap.add_argument("--stride", type=int, default=1, help="Lấy mỗi n mẫu khi khớp quỹ đạo")
+    ap.add_argument("--json", default=None, help="Ghi thông số nhận dạng ra JSON")
+    args = ap.parse_args(argv)
+    kwargs = {'refine': not args.no_refine, 'window': args.window, 'segment': args.segment,
+              'max_segments': args.segments, 'stride': args.stride}
+
+    true = None
+    if args.synthetic:
+        prior = PhysParam()
+        true = PhysParam()
+        true.M, true.L, true.d = 0.62, 0.32, 0.35
+        true.update_derived()
+        t, states, u = synthetic_log(true, prior, duration=args.duration)
+        print(f"Dữ liệu tổng hợp: {len(t):,} mẫu ({t[-1]:.0f}s @ 1 kHz)")
+        p, report = identify(t, states, u, prior, **kwargs)
+    elif args.logs:
+        from recorder import RunLog
+        logs = [RunLog(path) for path in args.logs]
+        prior = logs[0].phys_param()
+        # Nối các log; bước nhảy thời gian giữa chúng được nhận ra và bỏ qua khi khớp
+        t = np.concatenate([log.t + (i * 1e6) for i, log in enumerate(logs)])
+        states = np.concatenate([log.states for log in logs])
+        u = np.concatenate([log.u for log in logs])
+        p, report = identify(t, states, u, prior, **kwargs)
+    else:
+        ap.error("cần file log hoặc --synthetic")
+
+    header = f"{'':14s}" + "".join(f"{k:>12s}" for k in FIT_FIELDS)
+    print(header)
+    rows = [("tiên nghiệm", [getattr(prior, k) for k in FIT_FIELDS])]
+    if true is not None:
+        rows.insert(0, ("thật", [getattr(true, k) for k in FIT_FIELDS]))
+    for stage in ('least_squares', 'shooting'):
+        if stage in report:
+            rows.append((stage, [report[stage][k] for k in FIT_FIELDS]))
+    for name, vals in rows:
+        print(f"{name:14s}" + "".join(f"{v:12.5f}" for v in vals))
+    for stage in ('least_squares', 'shooting'):
+        if stage in report:
+            extra = {k: v for k, v in report[stage].items() if k not in FIT_FIELDS}
+            print(f"{stage}: " + ", ".join(f"{k}={v:.4g}" if isinstance(v, float) else f"{k}={v}"
+                                           for k, v in extra.items()))
+
+    from controller import LQRController, DEFAULT_Q, DEFAULT_R
+    for name, param in (("tiên nghiệm", prior), ("nhận dạng", p)):
+        ctrl = LQRController(CartPoleSystem(param))
+        ctrl.compute_gains(DEFAULT_Q, DEFAULT_R, verbose=False)
+        print(f"K ({name}): {np.array2string(ctrl.K.ravel(), precision=3)}")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({k: getattr(p, k) for k in FIT_FIELDS}, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    main()
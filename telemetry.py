@@ -0,0 +1,424 @@
+# telemetry.py - Đường truyền UART nhị phân (đo lường vào, lệnh điều khiển ra)
+#
+# Khung tin (little-endian), kiểm tra bằng CRC-16/CCITT (binascii.crc_hqx):
+#   Đo lường (thiết bị -> PC), 19 byte:
+#       A5 5A | type=0x01 (u8) | seq (u16) | t_us (u32) | theta (f32) | x (f32) | crc (u16)
+#   Điều khiển (PC -> thiết bị), 11 byte:
+#       A5 5A | type=0x02 (u8) | seq (u16) | force (f32) | crc (u16)
+# 1kHz đo lường = 19 kB/s -> cần baud >= 230400 (mặc định 460800).
+#
+# Thử nghiệm không cần phần cứng (tạo cặp pty, giả lập thiết bị bằng CartPoleSystem):
+#   python telemetry.py --emulate            # in ra đường dẫn cổng để GUI kết nối
+#   python telemetry.py --selftest -t 3      # giả lập + kết nối vòng kín, báo tốc độ khung
+# Hoặc dùng socat: socat -d -d pty,raw,echo=0 pty,raw,echo=0
+
+import argparse
+import binascii
+import os
+import struct
+import threading
+import time
+import traceback
+
+import numpy as np
+
+from live_plot import RingBuffer
+
+try:
+    import serial   # pyserial (tùy chọn; bắt buộc trên Windows)
+except ImportError:
+    serial = None
+
+SYNC = b'\xa5\x5a'
+TYPE_MEAS = 0x01
+TYPE_CTRL = 0x02
+
+_HEAD = struct.Struct('<2sBH')
+_MEAS = struct.Struct('<2sBHIff')
+_CTRL = struct.Struct('<2sBHf')
+_CRC = struct.Struct('<H')
+MEAS_SIZE = _MEAS.size + _CRC.size
+CTRL_SIZE = _CTRL.size + _CRC.size
+_FRAME_SIZE = {TYPE_MEAS: MEAS_SIZE, TYPE_CTRL: CTRL_SIZE}
+
+
+def _crc(data):
+    return binascii.crc_hqx(data, 0xFFFF)
+
+
+def encode_measurement(seq, t_us, theta, x):
+    body = _MEAS.pack(SYNC, TYPE_MEAS, seq & 0xFFFF, t_us & 0xFFFFFFFF, theta, x)
+    return body + _CRC.pack(_crc(body))
+
+
+def encode_control(seq, force):
+    body = _CTRL.pack(SYNC, TYPE_CTRL, seq & 0xFFFF, force)
+    return body + _CRC.pack(_crc(body))
+
+
+class FrameParser:
+    """
+    Tách khung từ dòng byte (đọc theo lô, khung có thể bị cắt ngang giữa hai lần đọc).
+    Byte rác hoặc khung sai CRC bị bỏ qua và tìm lại mã đồng bộ.
+    """
+    def __init__(self):
+        self._buf = bytearray()
+        self.frames = 0
+        self.crc_errors = 0
+        self.discarded = 0  # số byte rác bị bỏ qua
+
+    def feed(self, data):
+        """Nạp byte mới, trả về danh sách (type, seq, values...)."""
+        buf = self._buf
+        buf += data
+        out = []
+        pos = 0
+        n = len(buf)
+        while True:
+            i = buf.find(SYNC, pos)
+            if i < 0:
+                # Giữ lại byte cuối phòng trường hợp mã đồng bộ bị cắt đôi
+                keep = 1 if n and buf[-1] == SYNC[0] else 0
+                self.discarded += n - pos - keep
+                pos = n - keep
+                break
+            self.discarded += i - pos
+            if i + _HEAD.size > n:
+                pos = i
+                break
+            ftype = buf[i + 2]
+            size = _FRAME_SIZE.get(ftype)
+            if size is None:
+                pos = i + 1
+                continue
+            if i + size > n:
+                pos = i
+                break
+            body = bytes(buf[i:i + size - 2])
+            (crc,) = _CRC.unpack_from(buf, i + size - 2)
+            if crc != _crc(body):
+                self.crc_errors += 1
+                pos = i + 1
+                continue
+            if ftype == TYPE_MEAS:
+                _, _, seq, t_us, theta, x = _MEAS.unpack(body)
+                out.append((ftype, seq, t_us, theta, x))
+            else:
+                _, _, seq, force = _CTRL.unpack(body)
+                out.append((ftype, seq, force))
+            self.frames += 1
+            pos = i + size
+        del buf[:pos]
+        return out
+
+
+class _PosixPort:
+    """Cổng tty thô (POSIX) khi không có pyserial - đủ cho pty/socat và USB-UART trên Linux."""
+    def __init__(self, path, baudrate):
+        import termios
+        import tty
+        self.fd = os.open(path, os.O_RDWR | os.O_NOCTTY | os.O_NONBLOCK)
+        tty.setraw(self.fd)
+        attrs = termios.tcgetattr(self.fd)
+        speed = getattr(termios, f'B{baudrate}', None)
+        if speed is not None:
+            attrs[4] = attrs[5] = speed
+        termios.tcsetattr(self.fd, termios.TCSANOW, attrs)
+        self._pending = b''     # đuôi khung chưa ghi được (xem write())
+
+    def read(self, size, timeout):
+        import select
+        r, _, _ = select.select([self.fd], [], [], timeout)
+        if not r:
+            return b''
+        try:
+            return os.read(self.fd, size)
+        except BlockingIOError:
+            return b''
+
+    def write(self, data):
+        """
+        Ghi không chặn trên fd O_NONBLOCK, không bao giờ để khung cụt trên đường truyền:
+        phần chưa ghi được (ghi thiếu / EAGAIN) giữ trong _pending và gửi nốt trước khung sau.
+        Còn phần tồn đọng khi khung mới tới (bộ đệm tty đầy) -> bỏ cả khung mới, trả về False.
+        """
+        if self._pending:
+            self._pending = self._pending[self._write_some(self._pending):]
+            if self._pending:
+                return False
+        n = self._write_some(data)
+        self._pending = bytes(data[n:])
+        return True
+
+    def _write_some(self, data):
+        try:
+            return os.write(self.fd, data)
+        except BlockingIOError:
+            return 0
+
+    def close(self):
+        os.close(self.fd)
+
+
+class _PySerialPort:
+    def __init__(self, path, baudrate):
+        self.ser = serial.Serial(path, baudrate, timeout=0)
+
+    def read(self, size, timeout):
+        self.ser.timeout = timeout
+        first = self.ser.read(1)
+        if not first:
+            return b''
+        # Đọc theo lô: lấy luôn toàn bộ byte đang chờ
+        return first + self.ser.read(min(size, self.ser.in_waiting))
+
+    def write(self, data):
+        self.ser.write(data)    # pyserial tự ghi đủ (chặn tới khi xong)
+        return True
+
+    def close(self):
+        self.ser.close()
+
+
+def open_port(path, baudrate):
+    if serial is not None:
+        return _PySerialPort(path, baudrate)
+    if os.name != 'posix':
+        raise RuntimeError("Cần cài pyserial để mở cổng nối tiếp trên hệ điều hành này")
+    return _PosixPort(path, baudrate)
+
+
+class TelemetryLink:
+    """
+    Luồng I/O riêng đọc khung đo lường và gửi lệnh điều khiển trên cùng một cổng.
+    Không chạm tới Tk: GUI chỉ đọc latest() hoặc bộ đệm vòng `samples`.
+    """
+    def __init__(self, port, baudrate=460800, on_measurement=None, capacity=65536, read_size=4096):
+        """
+        port:           đường dẫn cổng (/dev/ttyUSB0, COM3, /dev/pts/N ...)
+        on_measurement: hàm f(t, theta, x) gọi trong luồng I/O cho mỗi khung đo lường
+                        (t tính bằng giây theo đồng hồ thiết bị)
+        capacity:       số mẫu lưu trong bộ đệm vòng [t, theta, x, seq]
+        """
+        self.port_name = port
+        self.baudrate = baudrate
+        self.on_measurement = on_measurement
+        self.read_size = read_size
+        self.samples = RingBuffer(capacity, 4)
+        self.parser = FrameParser()
+
+        self.lost = 0           # số khung bị mất (theo khoảng trống seq)
+        self.bytes_in = 0
+        self.sent = 0
+        self.tx_dropped = 0     # số lệnh bị bỏ vì bộ đệm gửi của cổng đầy
+        self.error = None       # ngoại lệ làm dừng luồng I/O (đọc cổng hoặc on_measurement), None nếu chưa có
+        self._last = None
+        self._last_seq = None
+        self._t_wraps = 0
+        self._last_t_us = None
+        self._tx_seq = 0
+        self._tx_lock = threading.Lock()
+
+        self._port = None
+        self._thread = None
+        self._stop = threading.Event()
+
+    @property
+    def connected(self):
+        """Luồng I/O còn chạy (False sau stop() hoặc khi luồng dừng vì lỗi - xem `error`)."""
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        self.error = None
+        self._port = open_port(self.port_name, self.baudrate)
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._io_loop, name="telemetry", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if self._port is not None:
+            self._port.close()
+            self._port = None
+
+    def latest(self):
+        """(t, theta, x) của khung mới nhất hoặc None."""
+        return self._last
+
+    def stats(self):
+        return {
+            'frames': self.parser.frames,
+            'crc_errors': self.parser.crc_errors,
+            'lost': self.lost,
+            'bytes_in': self.bytes_in,
+            'sent': self.sent,
+            'tx_dropped': self.tx_dropped,
+            'error': None if self.error is None else repr(self.error),
+        }
+
+    def send_control(self, force):
+        with self._tx_lock:
+            frame = encode_control(self._tx_seq, force)
+            self._tx_seq = (self._tx_seq + 1) & 0xFFFF
+            if self._port.write(frame):
+                self.sent += 1
+            else:
+                self.tx_dropped += 1
+
+    def _unwrap_time(self, t_us):
+        # t_us là u32 (quay vòng sau ~71 phút)
+        if self._last_t_us is not None and t_us < self._last_t_us:
+            self._t_wraps += 1
+        self._last_t_us = t_us
+        return (t_us + (self._t_wraps << 32)) * 1e-6
+
+    def _io_loop(self):
+        # Lỗi trong luồng I/O (cổng bị rút, on_measurement ném ngoại lệ, ...) không được làm luồng
+        # chết âm thầm: in traceback, lưu vào self.error rồi dừng (connected -> False để GUI báo lỗi).
+        try:
+            self._io_run()
+        except Exception as e:
+            self.error = e
+            traceback.print_exc()
+
+    def _io_run(self):
+        while not self._stop.is_set():
+            data = self._port.read(self.read_size, 0.005)
+            if not data:
+                continue
+            self.bytes_in += len(data)
+            for frame in self.parser.feed(data):
+                if frame[0] != TYPE_MEAS:
+                    continue
+                _, seq, t_us, theta, x = frame
+                if self._last_seq is not None:
+                    self.lost += (seq - self._last_seq - 1) & 0xFFFF
+                self._last_seq = seq
+
+                t = self._unwrap_time(t_us)
+                self.samples.append((t, theta, x, seq))
+                self._last = (t, theta, x)
+                if self.on_measurement is not None:
+                    self.on_measurement(t, theta, x)
+
+
+class DeviceEmulator:
+    """
+    Giả lập thiết bị trên đầu kia của pty: tích phân CartPoleSystem ở rate Hz,
+    gửi khung đo lường [theta, x] và nhận lực điều khiển (ZOH) từ PC.
+    """
+    def __init__(self, plant, x0=(0.1, 0.0, 0.0, 0.0), rate=1000.0, noise=0.0):
+        self.plant = plant
+        self.state = np.array(x0, dtype=float)
+        self.rate = rate
+        self.noise = noise
+        self.force = 0.0
+        self.master, slave = os.openpty()
+        self.port_name = os.ttyname(slave)
+        import tty
+        tty.setraw(slave)
+        self._slave = slave
+        os.set_blocking(self.master, False)
+        self._parser = FrameParser()
+        self._stop = threading.Event()
+        self._thread = None
+        self.sent = 0
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="emulator", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        os.close(self.master)
+        os.close(self._slave)
+
+    def _run(self):
+        dt = 1.0 / self.rate
+        rng = np.random.default_rng()
+        t0 = time.perf_counter()
+        k = 0
+        while not self._stop.is_set():
+            # Nhận lệnh điều khiển (không chặn)
+            try:
+                for frame in self._parser.feed(os.read(self.master, 4096)):
+                    if frame[0] == TYPE_CTRL:
+                        self.force = frame[2]
+            except (BlockingIOError, OSError):
+                pass
+
+            # Đuổi theo đồng hồ thực với mốc tuyệt đối
+            target = int((time.perf_counter() - t0) / dt)
+            out = bytearray()
+            while k < target:
+                self.state = self.plant.rk4_step(self.state, self.force, dt)
+                k += 1
+                theta = self.state[0] + self.noise * rng.standard_normal()
+                x = self.state[2] + self.noise * rng.standard_normal()
+                out += encode_measurement(k, int(k * dt * 1e6), theta, x)
+            if out:
+                try:
+                    os.write(self.master, out)
+                    self.sent += len(out) // MEAS_SIZE
+                except BlockingIOError:
+                    pass
+            time.sleep(0.0005)
+
+
+def main(argv=None):
+    from conf import PhysParam
+    from plant import CartPoleSystem
+    from controller import LQRController, DEFAULT_Q, DEFAULT_R
+
+    ap = argparse.ArgumentParser(description="Giả lập thiết bị UART / kiểm tra đường truyền")
+    ap.add_argument("--emulate", action="store_true", help="Chỉ chạy thiết bị giả lập trên pty")
+    ap.add_argument("--selftest", action="store_true", help="Giả lập + kết nối vòng kín qua pty")
+    ap.add_argument("--rate", type=float, default=1000.0)
+    ap.add_argument("-t", "--duration", type=float, default=3.0)
+    args = ap.parse_args(argv)
+
+    p = PhysParam()
+    plant = CartPoleSystem(p)
+    dev = DeviceEmulator(plant, rate=args.rate)
+    dev.start()
+    print(f"Thiết bị giả lập: {dev.port_name} ({args.rate:.0f} Hz)")
+
+    if args.emulate and not args.selftest:
+        try:
+            while True:
+                time.sleep(1.0)
+        except KeyboardInterrupt:
+            dev.stop()
+        return
+
+    ctrl = LQRController(plant)
+    ctrl.compute_gains(DEFAULT_Q, DEFAULT_R, verbose=False)
+    prev = {}
+
+    def on_meas(t, theta, x):
+        # Vận tốc bằng sai phân lùi (đủ cho kiểm tra đường truyền)
+        if prev:
+            h = max(t - prev['t'], 1e-6)
+            state = np.array([theta, (theta - prev['theta']) / h, x, (x - prev['x']) / h])
+            link.send_control(ctrl.get_action(state))
+        prev.update(t=t, theta=theta, x=x)
+
+    link = TelemetryLink(dev.port_name, on_measurement=on_meas)
+    link.start()
+    time.sleep(args.duration)
+    link.stop()
+    dev.stop()
+
+    s = link.stats()
+    print(f"Khung nhận: {s['frames']} ({s['frames'] / args.duration:.0f}/s), lỗi CRC: {s['crc_errors']}, "
+          f"mất: {s['lost']}, lệnh gửi: {s['sent']}")
+    print(f"Trạng thái cuối thiết bị: {dev.state}")
+
+
+if __name__ == "__main__":
+    main()
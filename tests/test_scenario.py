@@ -0,0 +1,183 @@
+# Kiểm thử bộ chạy kịch bản: chuẩn hóa / kiểm tra khóa, khóa lưu đệm, lịch nhiễu, gộp kết quả đệm và chạy mới
+import json
+import os
+
+import numpy as np
+import pytest
+
+import scenario
+from scenario import normalize, cache_key, disturbance_schedule, run_scenarios
+from sweep import FALL_ANGLE
+
+
+def _write(path, data):
+    with open(path, 'w') as f:
+        json.dump(data, f)
+
+
+# ----------------------------------------------------------------------
+# normalize
+# ----------------------------------------------------------------------
+def test_normalize_fills_defaults():
+    s = normalize({})
+    assert s['controller']['type'] == 'lqr'
+    assert len(s['controller']['Q']) == 4 and len(s['x0']) == 4
+    assert s['integrator'] == 'fixed' and s['disturbances'] == []
+    assert 'name' not in s and 'expect' not in s
+
+
+@pytest.mark.parametrize('raw', [
+    {'durations': 5.0},                                     # khóa gõ sai
+    {'params': {'mass': 1.0}},                              # thông số không có
+    {'controller': {'type': 'pid'}},
+    {'controller': {'type': 'lqr', 'horizon': 10}},         # khóa chỉ dành cho mpc
+    {'controller': {'Q': [1, 2, 3]}},
+    {'x0': [0.0, 0.0]},
+    {'disturbances': [{'t': 1.0}]},                         # thiếu force
+    {'integrator': 'euler42'},
+])
+def test_normalize_rejects_invalid(raw):
+    with pytest.raises(ValueError):
+        normalize(raw)
+
+
+def test_normalize_controller_keys_per_type():
+    s = normalize({'controller': {'type': 'mpc', 'horizon': 12}})
+    assert s['controller']['horizon'] == 12
+    assert s['controller']['u_max'] == scenario.MPC_DEFAULTS['u_max']
+    assert 'horizon' not in normalize({'controller': {'type': 'swingup'}})['controller']
+
+
+def test_normalize_sorts_pulses_and_defaults_duration():
+    s = normalize({'params': {'dt': 0.01},
+                   'disturbances': [{'t': 2.0, 'force': 1}, {'t': 0.5, 'duration': 0.2, 'force': -3}]})
+    assert [d['t'] for d in s['disturbances']] == [0.5, 2.0]
+    assert s['disturbances'][1]['duration'] == 0.01       # mặc định một chu kỳ điều khiển
+
+
+# ----------------------------------------------------------------------
+# cache_key
+# ----------------------------------------------------------------------
+def test_cache_key_ignores_name_expect_and_key_order(tmp_path):
+    a, b = tmp_path / 'a.json', tmp_path / 'b.json'
+    _write(a, {'name': 'một', 'x0': [0.2, 0, 0, 0], 'duration': 3.0, 'expect': {'fell': False}})
+    _write(b, {'duration': 3, 'x0': [0.2, 0, 0, 0], 'name': 'hai'})
+    assert cache_key(scenario.load(str(a))[1]) == cache_key(scenario.load(str(b))[1])
+
+
+def test_cache_key_changes_with_scenario_and_code(monkeypatch):
+    base = normalize({'duration': 3.0})
+    key = cache_key(base)
+    assert cache_key(normalize({'duration': 3.0})) == key
+    assert cache_key(normalize({'duration': 3.5})) != key
+    assert cache_key(normalize({'duration': 3.0, 'params': {'L': 0.4}})) != key
+    monkeypatch.setattr(scenario, '_CODE_HASH', 'mã nguồn khác')
+    assert cache_key(base) != key
+
+
+def test_code_version_ignores_line_endings(tmp_path, monkeypatch):
+    monkeypatch.setattr(scenario, '_CODE_HASH', None)
+    root = os.path.dirname(os.path.abspath(scenario.__file__))
+    lf, crlf = tmp_path / 'lf', tmp_path / 'crlf'
+    lf.mkdir(), crlf.mkdir()
+    for name in scenario.SOURCE_FILES:
+        with open(os.path.join(root, name), 'rb') as f:
+            text = f.read().replace(b'\r\n', b'\n')
+        (lf / name).write_bytes(text)
+        (crlf / name).write_bytes(text.replace(b'\n', b'\r\n'))
+    h = scenario.code_version(str(lf))
+    assert scenario.code_version(str(crlf)) == h
+    plant = crlf / 'plant.py'
+    plant.write_bytes(plant.read_bytes() + '# sửa\r\n'.encode())
+    assert scenario.code_version(str(crlf)) != h
+
+
+# ----------------------------------------------------------------------
+# disturbance_schedule
+# ----------------------------------------------------------------------
+def test_pulse_at_zero_and_zero_duration():
+    f = disturbance_schedule([{'t': 0.0, 'duration': 0.1, 'force': 5.0}], 0.02, 10)
+    assert f.tolist() == [5.0] * 5 + [0.0] * 5
+    # Độ dài 0 vẫn giữ một chu kỳ (không bị làm tròn mất)
+    f = disturbance_schedule([{'t': 0.1, 'duration': 0.0, 'force': 2.0}], 0.02, 10)
+    assert np.flatnonzero(f).tolist() == [5]
+
+
+def test_pulses_outside_duration_are_clipped():
+    pulses = [{'t': 0.16, 'duration': 0.1, 'force': 1.0},     # cắt ở cuối
+              {'t': 0.5, 'duration': 0.1, 'force': 9.0},      # hoàn toàn sau cùng
+              {'t': -0.04, 'duration': 0.08, 'force': 3.0}]   # bắt đầu trước 0
+    f = disturbance_schedule(pulses, 0.02, 10)
+    assert f.tolist() == [3.0, 3.0] + [0.0] * 6 + [1.0, 1.0]
+
+
+def test_overlapping_pulses_add():
+    f = disturbance_schedule([{'t': 0.0, 'duration': 0.06, 'force': 1.0},
+                              {'t': 0.04, 'duration': 0.04, 'force': 2.0}], 0.02, 5)
+    assert f.tolist() == [1.0, 1.0, 3.0, 2.0, 0.0]
+
+
+# ----------------------------------------------------------------------
+# swing-up
+# ----------------------------------------------------------------------
+def test_swingup_judged_after_handoff():
+    _, r = scenario.evaluate(normalize({'controller': {'type': 'swingup'},
+                                        'x0': [np.pi, 0.0, 0.0, 0.0], 'duration': 8.0}))
+    m = r['metrics']
+    assert not m['fell'] and r['events'] == []
+    assert 0 < m['catch_time'] <= m['settling_time'] < 8.0
+    assert m['peak_angle'] < FALL_ANGLE
+
+    _, r = scenario.evaluate(normalize({'controller': {'type': 'swingup'},
+                                        'x0': [np.pi, 0.0, 0.0, 0.0], 'duration': 0.5}))
+    assert r['metrics']['fell'] and r['metrics']['catch_time'] is None
+
+
+# ----------------------------------------------------------------------
+# run_scenarios: gộp kết quả đệm và chạy mới
+# ----------------------------------------------------------------------
+@pytest.fixture
+def scenario_dir(tmp_path):
+    d = tmp_path / 'scenarios'
+    d.mkdir()
+    _write(d / 'a.json', {'x0': [0.1, 0, 0, 0], 'duration': 2.0, 'expect': {'fell': False}})
+    _write(d / 'b.json', {'x0': [0.2, 0, 0, 0], 'duration': 2.0,
+                          'disturbances': [{'t': 0.5, 'duration': 0.1, 'force': 5.0}]})
+    return d
+
+
+def test_run_scenarios_merges_cached_and_fresh(scenario_dir, tmp_path):
+    cache = str(tmp_path / 'cache')
+    first = run_scenarios([str(scenario_dir)], cache_dir=cache, workers=1)
+    assert [e['name'] for e in first] == ['a', 'b']
+    assert not any(e['cached'] for e in first) and all(e['passed'] for e in first)
+
+    # a: chỉ đổi kỳ vọng -> cùng khóa, lấy từ bộ đệm nhưng vẫn so với kỳ vọng mới
+    _write(scenario_dir / 'a.json', {'x0': [0.1, 0, 0, 0], 'duration': 2.0,
+                                     'expect': {'settling_time': {'max': 0.01}}})
+    # b: đổi nội dung -> khóa mới, chạy lại
+    _write(scenario_dir / 'b.json', {'x0': [0.2, 0, 0, 0], 'duration': 2.5})
+    # c: file hỏng không làm hỏng cả lượt
+    (scenario_dir / 'c.json').write_text('{"x0": [0.1, 0, 0, 0], "bogus": 1}')
+
+    second = run_scenarios([str(scenario_dir)], cache_dir=cache, workers=1)
+    a, b, c = second
+    assert a['cached'] and a['key'] == first[0]['key'] and a['metrics'] == first[0]['metrics']
+    assert not a['passed'] and a['failures']
+    assert not b['cached'] and b['key'] != first[1]['key'] and b['sim_time'] == pytest.approx(2.5)
+    assert b['passed']
+    assert not c['cached'] and c['metrics'] is None and not c['passed'] and 'error' in c
+
+    # force chạy lại mọi thứ; cần quỹ đạo mà bộ đệm chưa có .npz -> cũng chạy lại
+    assert not any(e['cached'] for e in run_scenarios([str(scenario_dir)], cache_dir=cache,
+                                                      force=True, workers=1))
+    again = run_scenarios([str(scenario_dir / 'a.json')], cache_dir=cache, save_traj=True, workers=1)
+    assert not again[0]['cached'] and os.path.exists(os.path.join(cache, again[0]['key'] + '.npz'))
+    assert run_scenarios([str(scenario_dir / 'a.json')], cache_dir=cache, save_traj=True,
+                         workers=1)[0]['cached']
+
+
+def test_run_scenarios_without_cache(scenario_dir, tmp_path):
+    entries = run_scenarios([str(scenario_dir)], cache_dir=None, workers=1)
+    assert not any(e['cached'] for e in entries)
+    assert not os.path.exists(tmp_path / 'cache')
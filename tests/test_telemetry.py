@@ -0,0 +1,161 @@
+# Kiểm thử giao thức UART: FrameParser (CRC, đồng bộ lại, khung bị cắt) và TelemetryLink trên pty
+import os
+import time
+
+import pytest
+
+from telemetry import (FrameParser, TelemetryLink, DeviceEmulator, encode_measurement, encode_control,
+                       MEAS_SIZE, TYPE_MEAS, TYPE_CTRL)
+
+pytestmark = pytest.mark.skipif(not hasattr(os, 'openpty'), reason="cần pty (POSIX)")
+
+
+def _wait(cond, timeout=2.0):
+    end = time.perf_counter() + timeout
+    while not cond() and time.perf_counter() < end:
+        time.sleep(0.005)
+    return cond()
+
+
+# ----------------------------------------------------------------------
+# FrameParser
+# ----------------------------------------------------------------------
+def test_roundtrip_measurement_and_control():
+    p = FrameParser()
+    frames = p.feed(encode_measurement(7, 123456, 0.25, -0.5) + encode_control(9, 3.5))
+    assert frames[0][:3] == (TYPE_MEAS, 7, 123456)
+    assert frames[0][3:] == pytest.approx((0.25, -0.5))
+    assert frames[1][:2] == (TYPE_CTRL, 9)
+    assert frames[1][2] == pytest.approx(3.5)
+    assert p.frames == 2 and p.crc_errors == 0 and p.discarded == 0
+
+
+def test_crc_error_is_counted_and_skipped():
+    bad = bytearray(encode_measurement(1, 0, 0.1, 0.2))
+    bad[10] ^= 0xFF
+    p = FrameParser()
+    frames = p.feed(bytes(bad) + encode_measurement(2, 1000, 0.3, 0.4))
+    assert [f[1] for f in frames] == [2]
+    assert p.crc_errors == 1
+
+
+def test_resync_after_junk():
+    junk = b'\x00\xa5\x13\x5a\xa5\xa5garbage'
+    p = FrameParser()
+    frames = p.feed(junk + encode_measurement(3, 0, 0.0, 0.0) + junk + encode_measurement(4, 0, 0.0, 0.0))
+    assert [f[1] for f in frames] == [3, 4]
+    assert p.discarded >= 2 * len(junk) - 4
+
+
+def test_frames_split_across_reads():
+    stream = b''.join(encode_measurement(k, k * 1000, 0.01 * k, -0.01 * k) for k in range(50))
+    p = FrameParser()
+    seqs = []
+    for i in range(len(stream)):        # từng byte một: mọi điểm cắt, kể cả giữa mã đồng bộ
+        seqs += [f[1] for f in p.feed(stream[i:i + 1])]
+    assert seqs == list(range(50))
+    assert p.crc_errors == 0 and p.discarded == 0
+
+
+# ----------------------------------------------------------------------
+# TelemetryLink trên pty (ghi khung trực tiếp từ đầu master)
+# ----------------------------------------------------------------------
+@pytest.fixture
+def pty_link():
+    import tty
+    master, slave = os.openpty()
+    tty.setraw(slave)
+    received = []
+    link = TelemetryLink(os.ttyname(slave), on_measurement=lambda t, th, x: received.append((t, th, x)))
+    link.start()
+    yield master, link, received
+    link.stop()
+    os.close(master)
+    os.close(slave)
+
+
+def test_link_counts_lost_frames_across_seq_wrap(pty_link):
+    master, link, received = pty_link
+    seqs = [65533, 65534, 65535, 0, 2, 3]     # mất 1 (seq 1)
+    os.write(master, b''.join(encode_measurement(s, i * 1000, 0.0, 0.0) for i, s in enumerate(seqs)))
+    assert _wait(lambda: len(received) == len(seqs))
+    assert link.lost == 1
+
+
+def test_link_unwraps_device_time(pty_link):
+    master, link, received = pty_link
+    t_us = [0xFFFFFF00, 0xFFFFFFF0, 0x10, 0x100]   # đồng hồ u32 quay vòng
+    os.write(master, b''.join(encode_measurement(i, t, 0.0, 0.0) for i, t in enumerate(t_us)))
+    assert _wait(lambda: len(received) == len(t_us))
+    t = [r[0] for r in received]
+    assert all(b > a for a, b in zip(t, t[1:]))
+    assert t[2] == pytest.approx((0x10 + (1 << 32)) * 1e-6)
+
+
+def test_callback_error_stops_link_and_is_reported(pty_link, capsys):
+    master, link, _ = pty_link
+
+    def boom(t, theta, x):
+        raise RuntimeError("lỗi bộ điều khiển")
+    link.on_measurement = boom
+    os.write(master, encode_measurement(0, 0, 0.0, 0.0))
+    assert _wait(lambda: not link.connected)
+    assert isinstance(link.error, RuntimeError)
+    assert 'RuntimeError' in link.stats()['error']
+    assert 'lỗi bộ điều khiển' in capsys.readouterr().err
+
+
+def test_send_control_drops_whole_frames_when_buffer_full(pty_link):
+    master, link, _ = pty_link
+    # Không ai đọc đầu master: bộ đệm pty đầy dần, lệnh bị bỏ nguyên khung thay vì ném BlockingIOError
+    for _ in range(100000):
+        link.send_control(1.0)
+        if link.tx_dropped:
+            break
+    assert link.tx_dropped > 0
+    assert link.connected
+
+    # Mọi byte đã vào đường truyền là các khung đầy đủ
+    os.set_blocking(master, False)
+    data = b''
+    while True:
+        try:
+            chunk = os.read(master, 65536)
+        except BlockingIOError:
+            break
+        if not chunk:
+            break
+        data += chunk
+    # Đã đọc bớt: lệnh kế tiếp gửi nốt đuôi khung còn tồn đọng rồi mới tới khung mới
+    link.send_control(2.0)
+    time.sleep(0.01)
+    try:
+        data += os.read(master, 65536)
+    except BlockingIOError:
+        pass
+    p = FrameParser()
+    frames = p.feed(data)
+    assert len(frames) == link.sent
+    assert p.crc_errors == 0 and p.discarded == 0
+    assert frames[-1][2] == pytest.approx(2.0)
+
+
+# ----------------------------------------------------------------------
+# Vòng kín với thiết bị giả lập
+# ----------------------------------------------------------------------
+def test_closed_loop_with_emulator():
+    from conf import PhysParam
+    from plant import CartPoleSystem
+
+    dev = DeviceEmulator(CartPoleSystem(PhysParam()), rate=1000.0)
+    dev.start()
+    link = TelemetryLink(dev.port_name, on_measurement=lambda t, th, x: link.send_control(0.5))
+    link.start()
+    try:
+        assert _wait(lambda: link.parser.frames >= 200 and dev.force == pytest.approx(0.5))
+    finally:
+        link.stop()
+        dev.stop()
+    s = link.stats()
+    assert s['crc_errors'] == 0 and s['error'] is None
+    assert s['sent'] > 0 and s['bytes_in'] >= s['frames'] * MEAS_SIZE
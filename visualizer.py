@@ -1,94 +1,131 @@
 # visualizer.py - Chịu trách nhiệm vẽ hình (Rendering) lên Canvas Tkinter
 
-import tkinter as tk
 import math
+import time
 from conf import SimParam, PhysParam
 
+# Kích thước các chi tiết (pixel)
+CART_W = 60     # Chiều rộng xe
+CART_H = 30     # Chiều cao xe
+WHEEL_R = 8     # Bán kính bánh xe
+MASS_R = 12     # Bán kính vật nặng
+
+
+def cart_pole_geometry(theta, x, L, width, floor_y, scale=SimParam.SCALE):
+    """
+    Chuyển trạng thái (theta, x) sang tọa độ màn hình (pixel) của từng chi tiết.
+    Trả về dict: tên chi tiết -> tuple tọa độ (dùng trực tiếp cho canvas.coords).
+    """
+    cx = width / 2  # Tâm màn hình
+
+    # Tọa độ Xe (Cart)
+    cart_x = cx + x * scale
+    cart_y = floor_y
+
+    # Tọa độ Đầu con lắc (Pole End)
+    # Công thức: x_pole = x_cart + L * sin(theta)
+    #            y_pole = y_cart - L * cos(theta)
+    # Lưu ý: Trục Y màn hình hướng xuống, nên ta phải dùng dấu TRỪ cho cos(theta)
+    # để khi góc = 0 (cos=1), con lắc hướng lên trên.
+    pole_len = L * scale
+    end_x = cart_x + pole_len * math.sin(theta)
+    end_y = cart_y - pole_len * math.cos(theta)
+
+    return {
+        'cart': (cart_x - CART_W / 2, cart_y - CART_H / 2, cart_x + CART_W / 2, cart_y + CART_H / 2),
+        'wheel_l': (cart_x - 20, cart_y + 15, cart_x - 20 + WHEEL_R * 2, cart_y + 15 + WHEEL_R * 2),
+        'wheel_r': (cart_x + 5, cart_y + 15, cart_x + 5 + WHEEL_R * 2, cart_y + 15 + WHEEL_R * 2),
+        'pole': (cart_x, cart_y, end_x, end_y),
+        'mass': (end_x - MASS_R, end_y - MASS_R, end_x + MASS_R, end_y + MASS_R),
+    }
+
+
 class CartPoleVisualizer:
-    def __init__(self, canvas):
+    def __init__(self, canvas, phys=None):
         """
         Khởi tạo Visualizer.
         canvas: Đối tượng tk.Canvas để vẽ lên.
+        phys:   PhysParam dùng chung với ứng dụng (None -> tạo bộ mặc định)
         """
         self.canvas = canvas
         self.width = SimParam.WIN_WIDTH
         self.height = SimParam.WIN_HEIGHT
         
         # Lấy thông số vật lý để biết chiều dài thanh
-        self.phys = PhysParam()
+        self.phys = phys if phys is not None else PhysParam()
 
         # Tọa độ mặt đất (Vẽ thấp xuống dưới một chút cho đẹp)
         # Tọa độ Y trong Tkinter tính từ trên xuống dưới (0 là đỉnh)
         self.floor_y = self.height / 2 + 100
 
+        # Chế độ giữ hình (Retained mode): các item Tk tạo một lần, sau đó chỉ dời bằng coords()
+        self.items = None
+        self._last_coords = {}
+
+        # Bộ đếm thời gian vẽ khung hình
+        self.frame_count = 0
+        self.last_frame_time = 0.0   # giây
+        self.total_frame_time = 0.0  # giây
+
+    @property
+    def avg_frame_time(self):
+        """Thời gian vẽ trung bình mỗi khung hình (giây)."""
+        return self.total_frame_time / self.frame_count if self.frame_count else 0.0
+
+    def reset_stats(self):
+        self.frame_count = 0
+        self.last_frame_time = 0.0
+        self.total_frame_time = 0.0
+
+    def clear(self):
+        """
+        Xóa các item của visualizer khỏi canvas; lần draw() kế tiếp tạo lại.
+        Dùng hàm này thay cho canvas.delete("all") để visualizer biết item đã mất.
+        """
+        if self.items is not None:
+            for item in self.items.values():
+                self.canvas.delete(item)
+        self.items = None
+        self._last_coords = {}
+
+    def _create_items(self, geom):
+        c = self.canvas
+        self.items = {
+            # A. Đường ray (Sàn) - tĩnh, không cần cập nhật
+            'rail': c.create_line(0, self.floor_y, self.width, self.floor_y, fill="gray", width=2),
+            # B. Xe (Cart) và bánh xe
+            'cart': c.create_rectangle(*geom['cart'], fill=SimParam.COLOR_CART, outline="white", width=2),
+            'wheel_l': c.create_oval(*geom['wheel_l'], fill="gray"),
+            'wheel_r': c.create_oval(*geom['wheel_r'], fill="gray"),
+            # C. Thanh (Pole)
+            'pole': c.create_line(*geom['pole'], fill=SimParam.COLOR_POLE, width=6, capstyle="round"),
+            # D. Vật nặng (Mass)
+            'mass': c.create_oval(*geom['mass'], fill=SimParam.COLOR_MASS, outline="white", width=2),
+        }
+        self._last_coords = dict(geom)
+
     def draw(self, state):
         """
-        Vẽ lại toàn bộ khung hình dựa trên trạng thái hiện tại.
+        Cập nhật khung hình theo trạng thái hiện tại.
         state: [theta, theta_dot, x, x_dot]
+        Lần đầu tạo các item; các lần sau chỉ gọi coords() cho chi tiết có tọa độ thay đổi.
         """
-        # 1. Xóa hình cũ
-        self.canvas.delete("all")
+        t_start = time.perf_counter()
 
-        # 2. Giải nén trạng thái
         # Lưu ý: state[0] là theta (góc), state[2] là x (vị trí xe)
-        theta = state[0]
-        x = state[2]
+        geom = cart_pole_geometry(state[0], state[2], self.phys.L, self.width, self.floor_y)
 
-        # 3. Chuyển đổi tọa độ Thực tế (Mét) -> Tọa độ Màn hình (Pixel)
-        cx = self.width / 2  # Tâm màn hình
-        scale = SimParam.SCALE
+        # Chưa có item (lần đầu hoặc sau clear()) -> tạo; không hỏi lại Tk mỗi khung hình
+        if self.items is None:
+            self._create_items(geom)
+        else:
+            last = self._last_coords
+            for name, coords in geom.items():
+                if last.get(name) != coords:
+                    self.canvas.coords(self.items[name], *coords)
+                    last[name] = coords
 
-        # --- TÍNH TOÁN TỌA ĐỘ ---
-        # Tọa độ Xe (Cart)
-        cart_screen_x = cx + x * scale
-        cart_screen_y = self.floor_y
-        
-        # Tọa độ Đầu con lắc (Pole End)
-        # Công thức: x_pole = x_cart + L * sin(theta)
-        #            y_pole = y_cart - L * cos(theta)
-        # Lưu ý: Trục Y màn hình hướng xuống, nên ta phải dùng dấu TRỪ cho cos(theta) 
-        # để khi góc = 0 (cos=1), con lắc hướng lên trên.
-        pole_len_pixel = self.phys.L * scale
-        pole_end_x = cart_screen_x + pole_len_pixel * math.sin(theta)
-        pole_end_y = cart_screen_y - pole_len_pixel * math.cos(theta)
-
-        # --- VẼ HÌNH ---
-        
-        # A. Vẽ Đường ray (Sàn)
-        self.canvas.create_line(
-            0, self.floor_y, self.width, self.floor_y, 
-            fill="gray", width=2
-        )
-
-        # B. Vẽ Xe (Cart)
-        cart_w = 60 # Chiều rộng xe (pixel)
-        cart_h = 30 # Chiều cao xe (pixel)
-        self.canvas.create_rectangle(
-            cart_screen_x - cart_w/2, cart_screen_y - cart_h/2,
-            cart_screen_x + cart_w/2, cart_screen_y + cart_h/2,
-            fill=SimParam.COLOR_CART, outline="white", width=2
-        )
-        
-        # Vẽ bánh xe cho sinh động
-        wheel_r = 8
-        self.canvas.create_oval(cart_screen_x - 20, cart_screen_y + 15, cart_screen_x - 20 + wheel_r*2, cart_screen_y + 15 + wheel_r*2, fill="gray")
-        self.canvas.create_oval(cart_screen_x + 5, cart_screen_y + 15, cart_screen_x + 5 + wheel_r*2, cart_screen_y + 15 + wheel_r*2, fill="gray")
-
-        # C. Vẽ Thanh (Pole)
-        self.canvas.create_line(
-            cart_screen_x, cart_screen_y,
-            pole_end_x, pole_end_y,
-            fill=SimParam.COLOR_POLE, width=6, capstyle=tk.ROUND
-        )
-
-        # D. Vẽ Vật nặng (Mass) - Mô hình Point Mass
-        r = 12 # Bán kính vật nặng
-        self.canvas.create_oval(
-            pole_end_x - r, pole_end_y - r,
-            pole_end_x + r, pole_end_y + r,
-            fill=SimParam.COLOR_MASS, outline="white", width=2
-        )
-        
-        # E. Hiển thị thông số (HUD)
-        #info_text = f"Góc: {theta:.2f} rad\nVị trí: {x:.2f} m"
-        #self.canvas.create_text(20, 20, text=info_text, fill="white", anchor="w", font=("Consolas", 12))
\ No newline at end of file
+        dt = time.perf_counter() - t_start
+        self.last_frame_time = dt
+        self.total_frame_time += dt
+        self.frame_count += 1